@@ -0,0 +1,166 @@
+"""
+Benchmark for the test submit write path.
+
+Counts DB round trips and time per submission for the baseline multi-statement
+flow (replayed statement by statement) and the single-statement submit path.
+
+Safe by construction:
+- runs only against BENCHMARK_DATABASE_URL, never DATABASE_URL;
+- every write (contacts, results, test_sessions, sheets_outbox, daily_rollups)
+  happens inside one transaction that is rolled back at the end.
+
+Usage: BENCHMARK_DATABASE_URL=postgresql://... python benchmark_submit.py [iterations]
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+import traceback
+from dotenv import load_dotenv
+
+
+class CountingConnection:
+    """Connection proxy counting query round trips"""
+    def __init__(self, conn, counter):
+        self._conn = conn
+        self._counter = counter
+
+    def __getattr__(self, name):
+        attr = getattr(self._conn, name)
+        if name in ("execute", "fetch", "fetchrow", "fetchval"):
+            async def counted(*args, **kwargs):
+                self._counter["queries"] += 1
+                return await attr(*args, **kwargs)
+            return counted
+        return attr
+
+
+class Rollback(Exception):
+    """Raised at the end of the run so the benchmark transaction is rolled back"""
+
+
+TEREMOK_ANSWERS = {"1": 0, "2": 1, "3": 2, "4": 0, "5": 1}
+FORMULA_ANSWERS = ["result", "status", "process", "result", "result"]
+
+
+async def baseline_teremok(user_service, test_repo, user_id):
+    """Statements of the baseline Teremok submit (contact must exist, test_results FK)"""
+    from core.logic import calculate_result
+    result = calculate_result(TEREMOK_ANSWERS)
+    test_id = await test_repo.fetch_val(
+        """INSERT INTO test_results (user_id, result_type, answers, scores, product)
+           VALUES ($1, $2, $3, $4, 'teremok') RETURNING id""",
+        user_id, result['type'], TEREMOK_ANSWERS, result.get('scores', {})
+    )
+    contact = await user_service.get_contact(user_id)
+    await test_repo.fetch_val(
+        """INSERT INTO test_sessions
+           (user_id, product, source, channel, status, answers_json, result_json, meta_json)
+           VALUES ($1, 'teremok', $2, $3, 'finished', $4, $5, $6) RETURNING id""",
+        user_id, contact.source if contact else 'unknown',
+        contact.preferred_channel if contact else 'unknown',
+        TEREMOK_ANSWERS, result, {"type": result['type']}
+    )
+    await user_service.get_contact(user_id)
+    return test_id
+
+
+async def baseline_formula(user_service, test_repo, user_id):
+    """Statements of the baseline Formula RSP submit (guest contact on first submit)"""
+    from core.formula_rsp_logic import compute_formula_rsp
+    from models.user import UserContact
+    if not await user_service.has_contact(user_id):
+        await user_service.register_contact(UserContact(
+            user_id=user_id, name="Guest User", role="Guest", company="",
+            team_size="", phone="", telegram_username=None, product="formula_rsp"
+        ))
+    computed = compute_formula_rsp(FORMULA_ANSWERS)
+    test_id = await test_repo.fetch_val(
+        """INSERT INTO formula_rsp_results
+           (user_id, primary_type_code, primary_type_name, scores, answers)
+           VALUES ($1, $2, $3, $4, $5) RETURNING id""",
+        user_id, computed.primary_code, computed.primary_name, computed.scores, FORMULA_ANSWERS
+    )
+    contact = await user_service.get_contact(user_id)
+    await test_repo.fetch_val(
+        """INSERT INTO test_sessions
+           (user_id, product, source, channel, status, answers_json, result_json, meta_json)
+           VALUES ($1, 'formula', $2, $3, 'finished', $4, $5, $6) RETURNING id""",
+        user_id, contact.source if contact else 'unknown',
+        contact.preferred_channel if contact else 'unknown',
+        FORMULA_ANSWERS, computed.scores, {"type": computed.primary_name}
+    )
+    await user_service.get_contact(user_id)
+    return test_id
+
+
+async def measure(label, counter, iterations, func):
+    counter["queries"] = 0
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await func()
+    elapsed = time.perf_counter() - started
+    print(
+        f"{label:<28} round trips/req={counter['queries'] / iterations:.1f} "
+        f"avg={elapsed / iterations * 1000:.2f}ms"
+    )
+
+
+async def run(iterations: int):
+    load_dotenv(override=True)
+    url = os.getenv("BENCHMARK_DATABASE_URL")
+    if not url:
+        sys.exit("BENCHMARK_DATABASE_URL is not set: refusing to run against the application database")
+    if url == os.getenv("DATABASE_URL"):
+        sys.exit("BENCHMARK_DATABASE_URL must point to a dedicated database, not DATABASE_URL")
+    os.environ["DATABASE_URL"] = url
+
+    from infrastructure.db import db
+    from core.database import run_migrations
+    from core.dependencies import user_service, test_service, test_repo
+    from models.user import UserContact
+
+    await db.connect()
+    try:
+        await run_migrations()
+        counter = {"queries": 0}
+
+        # Throwaway ids well outside the ranges used by the web flows
+        teremok_baseline_id, teremok_new_id, formula_baseline_id, formula_new_id = \
+            [random.randint(9_000_000_000, 9_999_999_999) for _ in range(4)]
+
+        try:
+            async with db.transaction():
+                # Every repository call below runs on this connection, inside the transaction
+                scope = db.current_scope()
+                conn = scope.conn
+                scope.conn = CountingConnection(conn, counter)
+                try:
+                    await user_service.register_contact(UserContact(
+                        user_id=teremok_baseline_id, name="Benchmark", role="Benchmark",
+                        company="", team_size="", phone="", product="teremok"
+                    ))
+
+                    await measure("teremok baseline", counter, iterations,
+                                  lambda: baseline_teremok(user_service, test_repo, teremok_baseline_id))
+                    await measure("teremok single round trip", counter, iterations,
+                                  lambda: test_service.submit_teremok_test(teremok_new_id, TEREMOK_ANSWERS))
+                    await measure("formula baseline", counter, iterations,
+                                  lambda: baseline_formula(user_service, test_repo, formula_baseline_id))
+                    await measure("formula single round trip", counter, iterations,
+                                  lambda: test_service.submit_formula_rsp(formula_new_id, FORMULA_ANSWERS))
+                finally:
+                    scope.conn = conn
+                raise Rollback()
+        except Rollback:
+            print("Benchmark rows rolled back")
+    finally:
+        await db.disconnect()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else 50))
+    except Exception:
+        traceback.print_exc()
@@ -0,0 +1,23 @@
+"""
+Access filters for bot handlers.
+"""
+from aiogram.filters import BaseFilter
+from aiogram.types import Message
+
+from core.config import settings
+from core.dependencies import user_service
+
+
+def is_owner(user_id: int) -> bool:
+    """Check if user is the owner"""
+    return user_id == settings.OWNER_ID
+
+
+class IsAdmin(BaseFilter):
+    """Owner or a member of the admin roster (in-process cache, no DB query per message)"""
+
+    async def __call__(self, message: Message) -> bool:
+        user = message.from_user
+        if user is None:
+            return False
+        return is_owner(user.id) or await user_service.is_admin(user.id)
@@ -7,7 +7,11 @@ Commands:
 - /addadmin <user_id> - Add admin (owner only)
 - /deladmin <user_id> - Remove admin (owner only)
 - /admins - List admins
+- /broadcast [filters] <text> - Broadcast to bot users (owner only)
+- /broadcast_stop <id> - Cancel a broadcast (owner only)
 """
+import re
+
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.filters import Command
@@ -17,25 +21,18 @@ from aiogram.types import InlineKeyboardButton
 from core.config import settings
 # from core.database import get_all_leads # Legacy, todo: move to repo
 from core.texts import TYPES_DATA
-from core.dependencies import user_service
+from core.dependencies import user_service, broadcast_service
+from repositories.broadcast_repository import clean_filters, MATCH_FILTERS
+from bot.filters import IsAdmin, is_owner
 
 router = Router()
 
-def is_owner(user_id: int) -> bool:
-    """Check if user is the owner"""
-    return user_id == settings.OWNER_ID
-
 
-@router.message(Command("admin"))
+@router.message(Command("admin"), IsAdmin())
 async def cmd_admin(message: Message):
     """Admin panel"""
     user_id = message.from_user.id
     
-    # Check access
-    if not is_owner(user_id) and not await user_service.is_admin(user_id):
-        await message.answer("❌ У вас нет доступа к админ-панели.")
-        return
-    
     role = "👑 Владелец" if is_owner(user_id) else "👤 Админ"
     
     # Get stats
@@ -73,19 +70,14 @@ async def cmd_admin(message: Message):
             f"/addadmin &lt;user_id&gt; — Добавить админа\n"
             f"/deladmin &lt;user_id&gt; — Удалить админа\n"
             f"/admins — Список админов\n"
+            f"/broadcast — Рассылка пользователям бота\n"
         )
     
     await message.answer(text, parse_mode="HTML", disable_web_page_preview=True)
 
-@router.message(Command("leads"))
+@router.message(Command("leads"), IsAdmin())
 async def cmd_leads(message: Message):
     """View recent leads with quick stats"""
-    user_id = message.from_user.id
-    
-    if not is_owner(user_id) and not await user_service.is_admin(user_id):
-        await message.answer("❌ У вас нет доступа.")
-        return
-    
     # Get stats
     stats = await user_service.get_statistics()
     
@@ -127,17 +119,11 @@ async def cmd_leads(message: Message):
     await message.answer(text, parse_mode="HTML", disable_web_page_preview=True)
 
 
-@router.message(Command("stats"))
+@router.message(Command("stats"), IsAdmin())
 async def cmd_stats(message: Message):
     """View detailed statistics"""
-    user_id = message.from_user.id
-    
-    if not is_owner(user_id) and not await user_service.is_admin(user_id):
-        await message.answer("❌ У вас нет доступа.")
-        return
-    
     stats = await user_service.get_statistics()
-    admins = await user_service.get_admins()
+    admin_ids = await user_service.admin_roster.ids()
     
     leads_count = stats.get('total_leads', 0)
     tests_count = stats.get('total_tests', 0)
@@ -146,13 +132,27 @@ async def cmd_stats(message: Message):
         f"📊 <b>Статистика</b>\n\n"
         f"📋 Всего заявок: <b>{leads_count}</b>\n"
         f"🧾 Пройдено тестов: <b>{tests_count}</b>\n"
-        f"👥 Админов: <b>{len(admins)}</b>\n\n"
+        f"👥 Админов: <b>{len(admin_ids)}</b>\n\n"
         f"Конверсия (тесты/заявки): <b>{(tests_count/leads_count*100) if leads_count > 0 else 0:.1f}%</b>\n"
     )
     
+    if stats.get('generated_at'):
+        text += f"\n<i>Данные на {stats['generated_at']}</i>"
+    
     await message.answer(text, parse_mode="HTML")
 
 
+@router.message(Command("admin"))
+async def cmd_admin_denied(message: Message):
+    """/admin from a non-admin (IsAdmin did not match)"""
+    await message.answer("❌ У вас нет доступа к админ-панели.")
+
+
+@router.message(Command("leads", "stats"))
+async def cmd_admin_only_denied(message: Message):
+    await message.answer("❌ У вас нет доступа.")
+
+
 @router.message(Command("addadmin"))
 async def cmd_addadmin(message: Message):
     """Add admin (owner only)"""
@@ -229,3 +229,128 @@ async def cmd_id(message: Message):
         f"Отправьте это владельцу бота, чтобы он мог добавить вас как админа.",
         parse_mode="HTML"
     )
+
+
+# ===== Broadcasts (owner only) =====
+
+# Leading key=value tokens of /broadcast are audience filters; "from"/"to" are date_from/date_to
+BROADCAST_ARG = re.compile(r"\s*(\w+)=(\S+)")
+BROADCAST_ALIASES = {"from": "date_from", "to": "date_to"}
+
+STATUS_LABELS = {
+    "draft": "📝 черновик",
+    "running": "▶️ идёт",
+    "paused": "⏸ пауза",
+    "done": "✅ завершена",
+    "cancelled": "⛔ отменена",
+    "failed": "❌ ошибка",
+}
+
+
+def parse_broadcast(args: str) -> tuple[dict, str]:
+    """'product=teremok from=2024-01-01 Текст' -> ({filters}, 'Текст')"""
+    filters = {}
+    pos = 0
+    while match := BROADCAST_ARG.match(args, pos):
+        key = BROADCAST_ALIASES.get(match.group(1), match.group(1))
+        if key not in MATCH_FILTERS + ("date_from", "date_to"):
+            break
+        filters[key] = match.group(2)
+        pos = match.end()
+    return clean_filters(filters), args[pos:].strip()
+
+
+def broadcast_line(b: dict) -> str:
+    return (
+        f"#{b['id']} {STATUS_LABELS.get(b['status'], b['status'])}: "
+        f"{b['sent']}/{b['total']} отправлено, {b['blocked']} заблокировали, {b['failed']} ошибок"
+    )
+
+
+@router.message(Command("broadcast"))
+async def cmd_broadcast(message: Message):
+    """Create a broadcast draft and ask for confirmation (owner only)"""
+    if not is_owner(message.from_user.id):
+        await message.answer("❌ Только владелец может делать рассылки.")
+        return
+
+    parts = message.html_text.split(maxsplit=1)
+    if len(parts) < 2:
+        recent = await broadcast_service.repo.get_recent(limit=5)
+        text = (
+            "Использование: /broadcast [фильтры] &lt;текст&gt;\n\n"
+            "Фильтры: product=, status=, utm_source=, utm_medium=, utm_campaign=, "
+            "from=ГГГГ-ММ-ДД, to=ГГГГ-ММ-ДД\n"
+            "Пример: /broadcast product=teremok status=new Новый вебинар в четверг!\n\n"
+            "Остановить: /broadcast_stop &lt;id&gt;"
+        )
+        if recent:
+            text += "\n\n<b>Последние рассылки:</b>\n" + "\n".join(broadcast_line(b) for b in recent)
+        await message.answer(text, parse_mode="HTML")
+        return
+
+    try:
+        filters, text = parse_broadcast(parts[1])
+    except ValueError:
+        await message.answer("❌ Дата должна быть в формате ГГГГ-ММ-ДД.")
+        return
+    if not text:
+        await message.answer("❌ Укажите текст рассылки после фильтров.")
+        return
+
+    broadcast = await broadcast_service.create(text, filters, created_by=f"tg:{message.from_user.id}")
+    filters_str = ", ".join(f"{k}={v}" for k, v in filters.items()) or "все пользователи бота"
+
+    builder = InlineKeyboardBuilder()
+    builder.row(
+        InlineKeyboardButton(text="🚀 Отправить", callback_data=f"broadcast:launch:{broadcast['id']}"),
+        InlineKeyboardButton(text="Отмена", callback_data=f"broadcast:cancel:{broadcast['id']}"),
+    )
+    await message.answer(
+        f"📣 <b>Рассылка #{broadcast['id']}</b>\n"
+        f"Аудитория: {filters_str}\n"
+        f"Получателей: <b>{broadcast['total']}</b>\n\n"
+        f"{text}",
+        parse_mode="HTML",
+        reply_markup=builder.as_markup(),
+        disable_web_page_preview=True
+    )
+
+
+@router.callback_query(F.data.startswith("broadcast:"))
+async def cb_broadcast(callback: CallbackQuery):
+    """Confirm or drop a broadcast draft"""
+    if not is_owner(callback.from_user.id):
+        await callback.answer("Только владелец", show_alert=True)
+        return
+
+    _, action, broadcast_id = callback.data.split(":")
+    if action == "launch":
+        broadcast = await broadcast_service.launch(int(broadcast_id))
+        note = f"🚀 Рассылка #{broadcast_id} запущена." if broadcast else "Рассылка уже запущена или отменена."
+    else:
+        broadcast = await broadcast_service.cancel(int(broadcast_id))
+        note = f"⛔ Рассылка #{broadcast_id} отменена." if broadcast else "Рассылку уже нельзя отменить."
+
+    await callback.message.edit_reply_markup(reply_markup=None)
+    await callback.message.answer(note + "\nСтатус: /broadcast")
+    await callback.answer()
+
+
+@router.message(Command("broadcast_stop"))
+async def cmd_broadcast_stop(message: Message):
+    """Cancel a running or paused broadcast (owner only)"""
+    if not is_owner(message.from_user.id):
+        await message.answer("❌ Только владелец может управлять рассылками.")
+        return
+
+    args = message.text.split()
+    if len(args) < 2 or not args[1].lstrip("#").isdigit():
+        await message.answer("Использование: /broadcast_stop &lt;id&gt;", parse_mode="HTML")
+        return
+
+    broadcast = await broadcast_service.cancel(int(args[1].lstrip("#")))
+    if broadcast:
+        await message.answer(f"⛔ Остановлено. {broadcast_line(broadcast)}")
+    else:
+        await message.answer("❌ Рассылка не найдена или уже завершена.")
@@ -1,11 +1,29 @@
 from aiogram import Router, F, types
 from aiogram.filters import Command
-from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, WebAppInfo
+from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, WebAppInfo, ChatMemberUpdated
 
 from core.config import settings
+from core.telegram_checks import subscription_cache, is_required_channel
+from core.telegram_sender import send_priority, URGENT
 
 router = Router()
 
+@router.chat_member()
+async def on_channel_member_update(event: ChatMemberUpdated):
+    """Подписка/отписка в обязательном канале: сбрасываем кеш проверки подписки"""
+    if is_required_channel(event.chat):
+        subscription_cache.invalidate(event.new_chat_member.user.id)
+
+@router.my_chat_member(F.chat.type == "private")
+async def on_bot_blocked(event: ChatMemberUpdated):
+    """Пользователь заблокировал/разблокировал бота: рассылки его пропускают"""
+    from core.dependencies import broadcast_repo
+    
+    if event.new_chat_member.status == "kicked":
+        await broadcast_repo.mark_blocked([event.chat.id], "blocked")
+    elif event.new_chat_member.status == "member":
+        await broadcast_repo.unmark_blocked(event.chat.id)
+
 @router.message(Command("start"))
 async def cmd_start(message: Message):
     from bot.keyboards import hub_menu_keyboard
@@ -89,11 +107,12 @@ async def handle_web_app_data(message: Message):
                 notification_text += f"\n\n_От пользователя:_ @{message.from_user.username or 'без username'} (ID: <code>{message.from_user.id}</code>)"
                 
                 try:
-                    await message.bot.send_message(
-                        chat_id=settings.MANAGER_CHAT_ID,
-                        text=notification_text,
-                        parse_mode="HTML"
-                    )
+                    with send_priority(URGENT):
+                        await message.bot.send_message(
+                            chat_id=settings.MANAGER_CHAT_ID,
+                            text=notification_text,
+                            parse_mode="HTML"
+                        )
                 except Exception as e:
                     print(f"Failed to send notification: {e}")
             
@@ -118,6 +118,7 @@ async def process_contacts(message: Message, state: FSMContext):
 async def process_request(message: Message, state: FSMContext):
     """Process final request and send to manager"""
     from core.dependencies import user_service, notification_service
+    from core.task_runner import task_runner
     
     await state.update_data(request=message.text)
     
@@ -138,8 +139,9 @@ async def process_request(message: Message, state: FSMContext):
             message=msg_str
         )
         
-        # Send to manager via Service
-        success = await notification_service.notify_new_lead(
+        # Send to manager in the background; False only if the task queue is full
+        success = task_runner.submit(
+            "notify_new_lead", notification_service.notify_new_lead,
             name=data.get('name', 'N/A'),
             contact=data.get('contacts', 'N/A'),
             message=msg_str,
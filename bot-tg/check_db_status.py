@@ -11,6 +11,7 @@ async def check():
     from infrastructure.db import db
     from core.config import settings
     from repositories.test_repository import TestRepository
+    from core.database import current_version, load_migrations
     
     # Print masked host
     dsn = str(settings.DATABASE_URL)
@@ -27,6 +28,12 @@ async def check():
     print("Connected!")
     
     repo = TestRepository()
+
+    # Schema version vs newest migration file
+    async with db.get_pool().acquire() as conn:
+        version = await current_version(conn)
+    latest = load_migrations()[-1][0]
+    print(f"Schema version: {version} (latest migration: {latest})")
     
     # Check tables
     try:
@@ -11,6 +11,14 @@ class Settings:
     
     # Notifications (disable to avoid spam, admins can check via /leads)
     SEND_NOTIFICATIONS: bool = os.getenv("SEND_NOTIFICATIONS", "false").lower() == "true"
+    # Digest mode: buffer lead/test notifications and send one summary every INTERVAL minutes
+    # or once MAX_EVENTS are buffered; URGENT lists events still sent at once, comma-separated
+    # "lead", "lead:<product>", "test", "test:<product>", "test:<product>:<result type>"
+    NOTIFICATION_DIGEST_ENABLED: bool = os.getenv("NOTIFICATION_DIGEST_ENABLED", "false").lower() == "true"
+    NOTIFICATION_DIGEST_INTERVAL: float = float(os.getenv("NOTIFICATION_DIGEST_INTERVAL", "15"))
+    NOTIFICATION_DIGEST_MAX_EVENTS: int = int(os.getenv("NOTIFICATION_DIGEST_MAX_EVENTS", "50"))
+    NOTIFICATION_DIGEST_TOP_LEADS: int = int(os.getenv("NOTIFICATION_DIGEST_TOP_LEADS", "5"))
+    NOTIFICATION_DIGEST_URGENT: str = os.getenv("NOTIFICATION_DIGEST_URGENT", "")
     
     # Web App
     WEB_APP_URL: str = os.getenv("WEB_APP_URL", "https://vostroslava.github.io/teremok_game_bot/")
@@ -37,15 +45,74 @@ class Settings:
              return url
         return f"postgresql://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_HOST}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
     
+    # Outbound Telegram limits: messages/s for the whole bot and per private chat,
+    # messages/min per group or channel, resends after a RetryAfter (429)
+    TELEGRAM_GLOBAL_RATE: float = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))
+    TELEGRAM_CHAT_RATE: float = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))
+    TELEGRAM_GROUP_RATE: float = float(os.getenv("TELEGRAM_GROUP_RATE", "20"))
+    TELEGRAM_SEND_RETRIES: int = int(os.getenv("TELEGRAM_SEND_RETRIES", "3"))
+    # Broadcasts: recipients per page (progress is saved after each), parallel sends,
+    # idle poll for runnable broadcasts (s), how long shutdown waits for the current page (s)
+    BROADCAST_PAGE_SIZE: int = int(os.getenv("BROADCAST_PAGE_SIZE", "100"))
+    BROADCAST_CONCURRENCY: int = int(os.getenv("BROADCAST_CONCURRENCY", "25"))
+    BROADCAST_POLL_INTERVAL: float = float(os.getenv("BROADCAST_POLL_INTERVAL", "15"))
+    BROADCAST_SHUTDOWN_TIMEOUT: float = float(os.getenv("BROADCAST_SHUTDOWN_TIMEOUT", "10"))
+    
     # Channel subscription check
     REQUIRED_CHANNEL_USERNAME: str = os.getenv("REQUIRED_CHANNEL_USERNAME", "testtesttest12332221")
     CHECK_SUBSCRIPTION_ENABLED: bool = os.getenv("CHECK_SUBSCRIPTION_ENABLED", "true").lower() == "true"
+    # Subscription check cache: subscribed / not subscribed TTL (s), max cached users
+    SUBSCRIPTION_CACHE_TTL: float = float(os.getenv("SUBSCRIPTION_CACHE_TTL", "600"))
+    SUBSCRIPTION_CACHE_NEGATIVE_TTL: float = float(os.getenv("SUBSCRIPTION_CACHE_NEGATIVE_TTL", "30"))
+    SUBSCRIPTION_CACHE_MAX_ENTRIES: int = int(os.getenv("SUBSCRIPTION_CACHE_MAX_ENTRIES", "50000"))
     
     # Admin Panel
     ADMIN_PANEL_SECRET: str = os.getenv("ADMIN_PANEL_SECRET", "")
+    # Admin panel sessions: lifetime (s); in-process cache of validated sessions: TTL (s), max entries
+    ADMIN_SESSION_TTL: int = int(os.getenv("ADMIN_SESSION_TTL", str(86400 * 7)))
+    ADMIN_SESSION_CACHE_TTL: float = float(os.getenv("ADMIN_SESSION_CACHE_TTL", "60"))
+    ADMIN_SESSION_CACHE_SIZE: int = int(os.getenv("ADMIN_SESSION_CACHE_SIZE", "1000"))
+    # Bot admin roster reload interval (s): how soon other processes see /addadmin and /deladmin
+    ADMIN_ROSTER_TTL: float = float(os.getenv("ADMIN_ROSTER_TTL", "60"))
+    
+    # Statistics snapshot cache (dashboard, bot /admin /leads /stats), seconds; 0 disables
+    STATS_CACHE_TTL: float = float(os.getenv("STATS_CACHE_TTL", "60"))
+    # Browser cache lifetime for static API payloads (questions, types), seconds; revalidated by ETag
+    STATIC_API_MAX_AGE: int = int(os.getenv("STATIC_API_MAX_AGE", "86400"))
+    # Background side effects (notifications): workers, queue size, per-task timeout (s),
+    # how long shutdown waits for queued tasks (s)
+    TASK_RUNNER_WORKERS: int = int(os.getenv("TASK_RUNNER_WORKERS", "4"))
+    TASK_RUNNER_QUEUE_SIZE: int = int(os.getenv("TASK_RUNNER_QUEUE_SIZE", "1000"))
+    TASK_RUNNER_TIMEOUT: float = float(os.getenv("TASK_RUNNER_TIMEOUT", "30"))
+    TASK_RUNNER_SHUTDOWN_TIMEOUT: float = float(os.getenv("TASK_RUNNER_SHUTDOWN_TIMEOUT", "10"))
     
     # Google Sheets Integration (via Apps Script Webhook)
     GOOGLE_SHEETS_ENABLED: bool = os.getenv("GOOGLE_SHEETS_ENABLED", "false").lower() == "true"
     GOOGLE_SHEETS_WEBHOOK_URL: str = os.getenv("GOOGLE_SHEETS_WEBHOOK_URL", "")
+    # Shared outbound HTTP client (webhooks): timeout (s), pool limits, keep-alive (s), HTTP/2 (needs h2)
+    HTTP_CLIENT_TIMEOUT: float = float(os.getenv("HTTP_CLIENT_TIMEOUT", "4"))
+    HTTP_CLIENT_MAX_CONNECTIONS: int = int(os.getenv("HTTP_CLIENT_MAX_CONNECTIONS", "20"))
+    HTTP_CLIENT_MAX_KEEPALIVE: int = int(os.getenv("HTTP_CLIENT_MAX_KEEPALIVE", "10"))
+    HTTP_CLIENT_KEEPALIVE_EXPIRY: float = float(os.getenv("HTTP_CLIENT_KEEPALIVE_EXPIRY", "30"))
+    HTTP_CLIENT_HTTP2: bool = os.getenv("HTTP_CLIENT_HTTP2", "false").lower() == "true"
+    # Sheets outbox worker: rows per webhook call, idle poll (s), attempts before dead letter,
+    # first retry delay (s, doubles per attempt up to the cap)
+    SHEETS_OUTBOX_BATCH_SIZE: int = int(os.getenv("SHEETS_OUTBOX_BATCH_SIZE", "50"))
+    SHEETS_OUTBOX_POLL_INTERVAL: float = float(os.getenv("SHEETS_OUTBOX_POLL_INTERVAL", "2"))
+    SHEETS_OUTBOX_MAX_ATTEMPTS: int = int(os.getenv("SHEETS_OUTBOX_MAX_ATTEMPTS", "8"))
+    SHEETS_OUTBOX_BACKOFF_BASE: float = float(os.getenv("SHEETS_OUTBOX_BACKOFF_BASE", "5"))
+    SHEETS_OUTBOX_BACKOFF_MAX: float = float(os.getenv("SHEETS_OUTBOX_BACKOFF_MAX", "3600"))
+    # Real-time rows are coalesced: flush once BATCH_SIZE rows are waiting or after LINGER_MS;
+    # on shutdown the remaining due rows are flushed for at most SHUTDOWN_FLUSH_TIMEOUT (s)
+    SHEETS_OUTBOX_LINGER_MS: int = int(os.getenv("SHEETS_OUTBOX_LINGER_MS", "500"))
+    SHEETS_OUTBOX_SHUTDOWN_FLUSH_TIMEOUT: float = float(os.getenv("SHEETS_OUTBOX_SHUTDOWN_FLUSH_TIMEOUT", "10"))
+    # Admin full exports (background jobs): rows per webhook call, parallel calls,
+    # retries per failed batch, first retry delay (s, doubles per attempt)
+    SHEETS_EXPORT_BATCH_SIZE: int = int(os.getenv("SHEETS_EXPORT_BATCH_SIZE", "50"))
+    SHEETS_EXPORT_CONCURRENCY: int = int(os.getenv("SHEETS_EXPORT_CONCURRENCY", "4"))
+    SHEETS_EXPORT_RETRIES: int = int(os.getenv("SHEETS_EXPORT_RETRIES", "3"))
+    SHEETS_EXPORT_RETRY_DELAY: float = float(os.getenv("SHEETS_EXPORT_RETRY_DELAY", "2"))
+    # Incremental Sheets sync schedule, minutes (0 = only on demand from the admin panel)
+    SHEETS_SYNC_INTERVAL: float = float(os.getenv("SHEETS_SYNC_INTERVAL", "30"))
 
 settings = Settings()
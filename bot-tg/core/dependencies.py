@@ -1,16 +1,28 @@
 from repositories.user_repository import UserRepository
 from repositories.test_repository import TestRepository
+from repositories.outbox_repository import OutboxRepository
+from repositories.sync_repository import SyncRepository
+from repositories.broadcast_repository import BroadcastRepository
 from services.user_service import UserService
 from services.test_service import TestService
 from services.auth_service import AuthService
 from services.notification_service import NotificationService
+from services.sheets_outbox import SheetsOutboxWorker
+from services.sheets_sync import SheetsSyncService
+from services.broadcast import BroadcastService
 
 # Repositories
 user_repo = UserRepository()
 test_repo = TestRepository()
+outbox_repo = OutboxRepository()
+sync_repo = SyncRepository()
+broadcast_repo = BroadcastRepository()
 
 # Services
 user_service = UserService(user_repo)
 test_service = TestService(test_repo)
 auth_service = AuthService(user_repo)
 notification_service = NotificationService()
+sheets_sync = SheetsSyncService(sync_repo)
+sheets_outbox_worker = SheetsOutboxWorker(outbox_repo, sheets_sync)
+broadcast_service = BroadcastService(broadcast_repo, notification_service.get_bot_instance)
@@ -4,9 +4,9 @@ Simple HTTP POST to Google Apps Script - no auth required
 """
 import json
 import logging
-import httpx
 from typing import Union, List, Optional
 from .config import settings
+from .http_client import http_client
 
 logger = logging.getLogger(__name__)
 
@@ -22,32 +22,29 @@ async def send_to_sheets(data: Union[dict, List[dict]]) -> bool:
         return False
     
     try:
-        async with httpx.AsyncClient(timeout=4.0) as client:
-            response = await client.post(
-                webhook_url,
-                json=data,
-                headers={"Content-Type": "application/json"}
-            )
-            
-            if response.status_code == 200:
-                count = len(data) if isinstance(data, list) else 1
-                logger.info(f"Sent to Google Sheets: {count} items")
-                return True
-            else:
-                logger.error(f"Google Sheets webhook error: {response.status_code}")
-                return False
+        # Shared keep-alive client, see core/http_client.py
+        response = await http_client.client.post(
+            webhook_url,
+            json=data,
+            headers={"Content-Type": "application/json"}
+        )
+        
+        if response.status_code == 200:
+            count = len(data) if isinstance(data, list) else 1
+            logger.info(f"Sent to Google Sheets: {count} items")
+            return True
+        else:
+            logger.error(f"Google Sheets webhook error: {response.status_code}")
+            return False
                 
     except Exception as e:
         logger.error(f"Google Sheets webhook failed: {e}")
         return False
 
 
-async def export_lead_to_sheets(lead: dict) -> bool:
-    """Export a lead to Google Sheets"""
-    if not settings.GOOGLE_SHEETS_ENABLED:
-        return False
-    
-    data = {
+def lead_row(lead: dict) -> dict:
+    """Sheets row for a lead"""
+    return {
         "type": "lead",
         "name": lead.get("name", ""),
         "role": lead.get("role", ""),
@@ -58,15 +55,10 @@ async def export_lead_to_sheets(lead: dict) -> bool:
         "user_id": str(lead.get("user_id", "")),
         "status": lead.get("status", "new")
     }
-    
-    return await send_to_sheets(data)
 
 
-async def export_test_to_sheets(test: dict, lead: Optional[dict] = None) -> bool:
-    """Export a test result to Google Sheets"""
-    if not settings.GOOGLE_SHEETS_ENABLED:
-        return False
-    
+def test_row(test: dict, lead: Optional[dict] = None) -> dict:
+    """Sheets row for a test result, contact fields taken from lead when given"""
     # Parse scores
     scores_str = ""
     if test.get("scores"):
@@ -78,7 +70,7 @@ async def export_test_to_sheets(test: dict, lead: Optional[dict] = None) -> bool
         except:
             scores_str = str(test.get("scores", ""))
     
-    data = {
+    return {
         "type": "test",
         "name": lead.get("name", "") if lead else test.get("name", ""),
         "role": lead.get("role", "") if lead else test.get("role", ""),
@@ -89,8 +81,56 @@ async def export_test_to_sheets(test: dict, lead: Optional[dict] = None) -> bool
         "product": test.get("product", "teremok"),
         "user_id": str(test.get("user_id", ""))
     }
+
+
+def unified_test_row(session: dict) -> dict:
+    """Sheets row for the unified tests list (test_sessions + lead), columns in sheet order"""
+    res = session.get('result_json')
+    summary = ""
+    if isinstance(res, dict):
+        summary = res.get('type') or res.get('primary_name') or res.get('primary_type_name') or 'N/A'
+
+    return {
+        "type": "unified_test",
+        "created_at": str(session.get('created_at', '')),
+        "product": session.get('product', ''),
+        "source": session.get('source', ''),
+        "user_id": str(session.get('user_id', '')),
+        "lead_name": session.get('lead_name') or '',
+        "lead_phone_or_messenger": session.get('lead_phone') or '',
+        "lead_preferred_channel": session.get('lead_preferred_channel') or '',
+        "company": session.get('lead_company') or '',
+        "role": session.get('lead_role') or '',
+        "team_size": session.get('lead_team_size') or '',
+        "utm_source": session.get('utm_source', ''),
+        "utm_medium": session.get('utm_medium', ''),
+        "utm_campaign": session.get('utm_campaign', ''),
+        "test_summary": summary,
+        "result_json": json.dumps(res) if res is not None else ""
+    }
+
+
+def outbox_row(kind: str, payload: dict) -> dict:
+    """Sheets row for a sheets_outbox entry ({"lead": ...} or {"test": ..., "lead": ...})"""
+    if kind == "lead":
+        return lead_row(payload.get("lead") or {})
+    return test_row(payload.get("test") or {}, payload.get("lead"))
+
+
+async def export_lead_to_sheets(lead: dict) -> bool:
+    """Export a lead to Google Sheets"""
+    if not settings.GOOGLE_SHEETS_ENABLED:
+        return False
+    
+    return await send_to_sheets(lead_row(lead))
+
+
+async def export_test_to_sheets(test: dict, lead: Optional[dict] = None) -> bool:
+    """Export a test result to Google Sheets"""
+    if not settings.GOOGLE_SHEETS_ENABLED:
+        return False
     
-    return await send_to_sheets(data)
+    return await send_to_sheets(test_row(test, lead))
 
 
 # Legacy compatibility - these do nothing now, export happens via webhook
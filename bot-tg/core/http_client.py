@@ -0,0 +1,61 @@
+"""
+Application-lifetime HTTP client for outbound webhooks (Google Sheets and others).
+
+One pooled httpx.AsyncClient is shared by the whole process, so repeated calls
+reuse keep-alive connections instead of paying DNS + TCP + TLS every time.
+Started in the FastAPI startup hook and closed on shutdown; code running
+outside the app (scripts) gets a client lazily on first use.
+"""
+import importlib.util
+import logging
+import httpx
+from typing import Optional
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _http2_available() -> bool:
+    # httpx needs the 'h2' package for HTTP/2
+    return importlib.util.find_spec("h2") is not None
+
+
+class HttpClientManager:
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _create(self) -> httpx.AsyncClient:
+        http2 = settings.HTTP_CLIENT_HTTP2 and _http2_available()
+        if settings.HTTP_CLIENT_HTTP2 and not http2:
+            logger.warning("HTTP/2 requested but the 'h2' package is not installed, using HTTP/1.1")
+        return httpx.AsyncClient(
+            http2=http2,
+            timeout=httpx.Timeout(settings.HTTP_CLIENT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=settings.HTTP_CLIENT_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.HTTP_CLIENT_MAX_KEEPALIVE,
+                keepalive_expiry=settings.HTTP_CLIENT_KEEPALIVE_EXPIRY
+            ),
+            # Apps Script answers webhook POSTs with a redirect to the result
+            follow_redirects=True
+        )
+
+    async def start(self) -> None:
+        if self._client is None:
+            self._client = self._create()
+            logger.info("HTTP client started")
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            logger.info("HTTP client closed")
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = self._create()
+        return self._client
+
+
+http_client = HttpClientManager()
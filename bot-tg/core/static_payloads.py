@@ -0,0 +1,71 @@
+"""
+Pre-encoded JSON for API payloads that only change on deploy
+(question lists, type descriptions).
+
+Each payload is serialized once (at startup, or on first use) into bytes with a
+strong ETag derived from the content. Responses carry a long Cache-Control and
+a matching If-None-Match gets an empty 304.
+"""
+import hashlib
+import logging
+import orjson
+from typing import Any, Callable, List, Optional
+from fastapi import Request
+from fastapi.responses import Response
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_registry: List["StaticPayload"] = []
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match uses weak comparison: W/"x" matches "x", * matches anything"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+class StaticPayload:
+    def __init__(self, name: str, build: Callable[[], Any]):
+        self.name = name
+        self._build = build
+        self.body: Optional[bytes] = None
+        self.etag: Optional[str] = None
+        _registry.append(self)
+
+    def encode(self) -> None:
+        self.body = orjson.dumps(self._build())
+        self.etag = '"' + hashlib.sha256(self.body).hexdigest()[:32] + '"'
+
+    def merged(self, extra: dict) -> bytes:
+        """The pre-encoded object with per-request keys appended, static part not re-encoded"""
+        if self.body is None:
+            self.encode()
+        if not extra:
+            return self.body
+        if self.body == b"{}":
+            return orjson.dumps(extra)
+        return self.body[:-1] + b"," + orjson.dumps(extra)[1:]
+
+    def response(self, request: Request) -> Response:
+        if self.body is None:
+            self.encode()
+        headers = {
+            "ETag": self.etag,
+            "Cache-Control": f"public, max-age={settings.STATIC_API_MAX_AGE}",
+        }
+        if etag_matches(request.headers.get("if-none-match"), self.etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=self.body, media_type="application/json", headers=headers)
+
+
+def encode_all() -> None:
+    """Serialize every registered payload (FastAPI startup)"""
+    for payload in _registry:
+        payload.encode()
+    logger.info(f"Static API payloads encoded: {', '.join(p.name for p in _registry)}")
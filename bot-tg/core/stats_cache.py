@@ -0,0 +1,76 @@
+"""
+In-process cache for statistics snapshots (dashboard, bot /admin, /leads, /stats).
+
+Entries expire after a TTL and are invalidated by version counters:
+every write bumps the version of its domain ("leads" / "tests"), and an entry
+is only served while the versions it was computed against are current.
+The cache is per process, so other workers see a write at most TTL later.
+"""
+import time
+import logging
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Iterable, Tuple
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+LEADS = "leads"
+TESTS = "tests"
+
+
+class StatsSnapshotCache:
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._versions: Dict[str, int] = {LEADS: 0, TESTS: 0}
+        # key -> (versions, expires_at, payload)
+        self._entries: Dict[str, Tuple[Tuple[int, ...], float, dict]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def invalidate(self, *domains: str) -> None:
+        """Bump version counters after a write"""
+        for domain in domains:
+            self._versions[domain] = self._versions.get(domain, 0) + 1
+        self.invalidations += 1
+
+    def _current(self, domains: Iterable[str]) -> Tuple[int, ...]:
+        return tuple(self._versions.get(d, 0) for d in domains)
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[dict]],
+                             domains: Iterable[str] = (LEADS, TESTS)) -> dict:
+        """
+        Return cached snapshot for key or compute a fresh one.
+        Payload gets a 'generated_at' timestamp (YYYY-MM-DD HH:MM:SS).
+        """
+        domains = tuple(domains)
+        entry = self._entries.get(key)
+        if entry and self.ttl > 0:
+            versions, expires_at, payload = entry
+            if versions == self._current(domains) and expires_at > time.monotonic():
+                self.hits += 1
+                return payload
+
+        self.misses += 1
+        # Versions are read before computing: a write racing with the query
+        # leaves the entry stale and the next read recomputes
+        versions = self._current(domains)
+        payload = dict(await compute())
+        payload['generated_at'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self._entries[key] = (versions, time.monotonic() + self.ttl, payload)
+        return payload
+
+    def metrics(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+            "invalidations": self.invalidations,
+            "entries": len(self._entries),
+            "ttl_seconds": self.ttl,
+            "versions": dict(self._versions),
+        }
+
+
+stats_cache = StatsSnapshotCache(ttl=settings.STATS_CACHE_TTL)
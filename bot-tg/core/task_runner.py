@@ -0,0 +1,125 @@
+"""
+In-process background runner for side effects of a request (manager
+notifications and the like), so a slow Telegram API call never delays the
+user's response.
+
+Tasks go into a bounded queue served by TASK_RUNNER_WORKERS workers. Each task
+gets at most TASK_RUNNER_TIMEOUT seconds; failures and timeouts are logged and
+counted, never raised to the caller. When the queue is full the task is
+dropped (and logged) instead of blocking the handler. On shutdown the queue is
+drained for at most TASK_RUNNER_SHUTDOWN_TIMEOUT seconds.
+
+Started in the FastAPI startup hook; code running outside the app gets the
+workers lazily on the first submit.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+from core.config import settings
+from infrastructure.db import db
+
+logger = logging.getLogger(__name__)
+
+
+class TaskRunner:
+    def __init__(self, workers: int, max_queue: int, timeout: float):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._closing = False
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.dropped = 0
+        self._wait_total = 0.0
+        self._run_total = 0.0
+        self.max_wait = 0.0
+
+    def start(self) -> None:
+        if self._workers:
+            return
+        self._closing = False
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._workers = [db.spawn(self._work()) for _ in range(self.workers)]
+        logger.info(f"Task runner started: {self.workers} workers, queue {self.max_queue}")
+
+    def submit(self, name: str, func: Callable[..., Awaitable[Any]], *args, **kwargs) -> bool:
+        """Queue func(*args, **kwargs); False if the runner is stopping or the queue is full"""
+        if self._closing:
+            logger.warning(f"Task {name} rejected: runner is shutting down")
+            self.dropped += 1
+            return False
+        self.start()
+        try:
+            self._queue.put_nowait((name, func, args, kwargs, time.monotonic()))
+        except asyncio.QueueFull:
+            logger.error(f"Task {name} dropped: queue is full ({self.max_queue})")
+            self.dropped += 1
+            return False
+        self.submitted += 1
+        return True
+
+    async def _work(self) -> None:
+        while True:
+            item: Tuple = await self._queue.get()
+            try:
+                await self._execute(*item)
+            finally:
+                self._queue.task_done()
+
+    async def _execute(self, name: str, func, args, kwargs, queued_at: float) -> None:
+        started = time.monotonic()
+        wait = started - queued_at
+        self._wait_total += wait
+        self.max_wait = max(self.max_wait, wait)
+        try:
+            await asyncio.wait_for(func(*args, **kwargs), timeout=self.timeout)
+            self.completed += 1
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            logger.error(f"Task {name} timed out after {self.timeout}s")
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Task {name} failed: {e}")
+        finally:
+            self._run_total += time.monotonic() - started
+
+    async def stop(self, timeout: float = None) -> None:
+        """Stop accepting tasks, finish the queued ones within the deadline, cancel the rest"""
+        if not self._workers:
+            return
+        self._closing = True
+        timeout = settings.TASK_RUNNER_SHUTDOWN_TIMEOUT if timeout is None else timeout
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Task runner: {self._queue.qsize()} queued tasks abandoned after {timeout}s")
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def metrics(self) -> dict:
+        finished = self.completed + self.failed + self.timed_out
+        return {
+            "queued": self._queue.qsize() if self._queue else 0,
+            "max_queue": self.max_queue,
+            "workers": len(self._workers),
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timed_out": self.timed_out,
+            "dropped": self.dropped,
+            "avg_wait_ms": round(self._wait_total / finished * 1000, 1) if finished else None,
+            "max_wait_ms": round(self.max_wait * 1000, 1),
+            "avg_run_ms": round(self._run_total / finished * 1000, 1) if finished else None,
+        }
+
+
+task_runner = TaskRunner(
+    settings.TASK_RUNNER_WORKERS, settings.TASK_RUNNER_QUEUE_SIZE, settings.TASK_RUNNER_TIMEOUT
+)
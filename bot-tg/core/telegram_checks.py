@@ -1,7 +1,18 @@
 """
 Проверка подписки на Telegram канал
+
+Результаты get_chat_member кешируются в памяти процесса (SubscriptionCache):
+подписка — на SUBSCRIPTION_CACHE_TTL, её отсутствие — на более короткий
+SUBSCRIPTION_CACHE_NEGATIVE_TTL, ошибки API не кешируются. Одновременные
+проверки одного пользователя ждут один запрос к Telegram. Бот сбрасывает
+запись при chat_member-обновлении канала (bot/handlers/common.py); запрос,
+начатый до сброса, свой результат в кеш уже не пишет.
 """
+import asyncio
 import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
 from aiogram import Bot
 from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramAPIError
 from core.config import settings
@@ -9,9 +20,109 @@ from core.config import settings
 logger = logging.getLogger(__name__)
 
 
+class SubscriptionCache:
+    def __init__(self, ttl: float, negative_ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        # user_id -> (subscribed, expires_at), least recently used first
+        self._entries: "OrderedDict[int, Tuple[bool, float]]" = OrderedDict()
+        self._inflight: Dict[int, asyncio.Task] = {}
+        # user_id -> generation, bumped by invalidate(): a fetch started before an
+        # invalidation doesn't store its (stale) result
+        self._generations: "OrderedDict[int, int]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+
+    def get(self, user_id: int) -> Optional[bool]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        subscribed, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[user_id]
+            return None
+        self._entries.move_to_end(user_id)
+        return subscribed
+
+    def put(self, user_id: int, subscribed: bool) -> None:
+        ttl = self.ttl if subscribed else self.negative_ttl
+        if ttl <= 0:
+            return
+        self._entries[user_id] = (subscribed, time.monotonic() + ttl)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        self._generations[user_id] = self._generations.get(user_id, 0) + 1
+        self._generations.move_to_end(user_id)
+        while len(self._generations) > self.max_entries:
+            self._generations.popitem(last=False)
+        # Later checks must not wait for a fetch started before the update
+        stale = self._inflight.pop(user_id, None)
+        if self._entries.pop(user_id, None) is not None or stale is not None:
+            self.invalidations += 1
+
+    async def check(self, bot: Bot, user_id: int) -> bool:
+        cached = self.get(user_id)
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        task = self._inflight.get(user_id)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.create_task(self._fetch(bot, user_id, self._generations.get(user_id, 0)))
+            self._inflight[user_id] = task
+        # shield: a cancelled caller must not cancel the call other callers wait for
+        return await asyncio.shield(task)
+
+    async def _fetch(self, bot: Bot, user_id: int, generation: int) -> bool:
+        try:
+            subscribed = await _fetch_subscription(bot, user_id)
+            if subscribed is not None and self._generations.get(user_id, 0) == generation:
+                self.put(user_id, subscribed)
+            return bool(subscribed)
+        finally:
+            if self._inflight.get(user_id) is asyncio.current_task():
+                del self._inflight[user_id]
+
+    def metrics(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "invalidations": self.invalidations,
+            "hit_rate": round((self.hits + self.coalesced) / lookups, 3) if lookups else 0.0,
+            "ttl": self.ttl,
+            "negative_ttl": self.negative_ttl,
+        }
+
+
+subscription_cache = SubscriptionCache(
+    settings.SUBSCRIPTION_CACHE_TTL,
+    settings.SUBSCRIPTION_CACHE_NEGATIVE_TTL,
+    settings.SUBSCRIPTION_CACHE_MAX_ENTRIES
+)
+
+
+def is_required_channel(chat) -> bool:
+    """Чат — обязательный канал (по username)"""
+    username = (getattr(chat, "username", None) or "").lower()
+    return bool(username) and username == settings.REQUIRED_CHANNEL_USERNAME.lstrip("@").lower()
+
+
 async def is_subscribed_to_required_channel(bot: Bot, user_id: int) -> bool:
     """
-    Проверяет подписку пользователя на обязательный канал.
+    Проверяет подписку пользователя на обязательный канал (через кеш).
     
     Args:
         bot: Экземпляр aiogram Bot
@@ -25,6 +136,11 @@ async def is_subscribed_to_required_channel(bot: Bot, user_id: int) -> bool:
         logger.info("Проверка подписки отключена в конфигурации")
         return False
     
+    return await subscription_cache.check(bot, user_id)
+
+
+async def _fetch_subscription(bot: Bot, user_id: int) -> Optional[bool]:
+    """Запрос get_chat_member; None при ошибке (такой результат не кешируется)"""
     try:
         # Формируем username канала с @
         channel = f"@{settings.REQUIRED_CHANNEL_USERNAME}"
@@ -48,14 +164,14 @@ async def is_subscribed_to_required_channel(bot: Bot, user_id: int) -> bool:
             f"Не удалось проверить подписку для user_id={user_id}. "
             f"Возможно, бот не добавлен в канал {settings.REQUIRED_CHANNEL_USERNAME}: {e}"
         )
-        return False
+        return None
         
     except TelegramAPIError as e:
         # Другие ошибки API Telegram
         logger.error(f"Ошибка Telegram API при проверке подписки: {e}")
-        return False
+        return None
         
     except Exception as e:
         # Непредвиденные ошибки
         logger.error(f"Неожиданная ошибка при проверке подписки: {e}")
-        return False
+        return None
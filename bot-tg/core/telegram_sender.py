@@ -0,0 +1,215 @@
+"""
+Rate-aware outbound Telegram sending.
+
+Every request of the bot passes through OutboundThrottle (an aiogram session
+middleware), so handler replies, manager notifications and broadcasts share the
+same limits:
+
+- a global token bucket, TELEGRAM_GLOBAL_RATE messages/s (Telegram allows ~30);
+- a bucket per chat, TELEGRAM_CHAT_RATE messages/s for private chats and
+  TELEGRAM_GROUP_RATE messages/min for groups and channels;
+- RetryAfter (429) pauses the chat for retry_after seconds and the message is
+  sent again, at most TELEGRAM_SEND_RETRIES times.
+
+When senders wait for the global bucket, higher priority goes first: manager
+alerts (URGENT) before replies to users (NORMAL) before broadcasts (BULK).
+Callers pick the priority with `with send_priority(URGENT): ...`.
+"""
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import itertools
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+from core.config import settings
+from infrastructure.db import db
+
+logger = logging.getLogger(__name__)
+
+URGENT = 0
+NORMAL = 1
+BULK = 2
+
+# Idle chat buckets are dropped once there are more than this many
+MAX_CHAT_BUCKETS = 10000
+
+_priority: contextvars.ContextVar[int] = contextvars.ContextVar("telegram_send_priority", default=NORMAL)
+
+
+@contextlib.contextmanager
+def send_priority(level: int):
+    """Priority of the Telegram sends made inside the block"""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def is_throttled(method: TelegramMethod) -> bool:
+    """Methods that deliver a message to a chat (the ones Telegram rate-limits)"""
+    name = type(method).__name__
+    return name.startswith(("Send", "Copy", "Forward")) and name != "SendChatAction" \
+        and getattr(method, "chat_id", None) is not None
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self) -> float:
+        """Consume a token and return 0, or return how long to wait for one"""
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def refund(self) -> None:
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    def block(self, seconds: float) -> None:
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+    def idle(self) -> bool:
+        now = time.monotonic()
+        self._refill(now)
+        return self.tokens >= self.capacity and now >= self.blocked_until
+
+
+class TelegramSender:
+    def __init__(self):
+        self.global_bucket = TokenBucket(settings.TELEGRAM_GLOBAL_RATE, settings.TELEGRAM_GLOBAL_RATE)
+        self._chats: Dict[int, TokenBucket] = {}
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._pump: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.waited = 0.0
+        self.sent_by_priority = {URGENT: 0, NORMAL: 0, BULK: 0}
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= MAX_CHAT_BUCKETS:
+                for key in [k for k, b in self._chats.items() if b.idle()]:
+                    del self._chats[key]
+            # Private chats have positive ids; groups, supergroups and channels
+            # (negative ids, or @username) get the per-minute group limit
+            if isinstance(chat_id, int) and chat_id > 0:
+                rate = settings.TELEGRAM_CHAT_RATE
+            else:
+                rate = settings.TELEGRAM_GROUP_RATE / 60
+            bucket = self._chats[chat_id] = TokenBucket(rate, 1)
+        return bucket
+
+    async def acquire(self, chat_id, priority: int = NORMAL) -> None:
+        """Wait until a message to chat_id fits both the chat and the global limit"""
+        started = time.monotonic()
+        bucket = self._chat_bucket(chat_id)
+        while (wait := bucket.take()) > 0:
+            await asyncio.sleep(wait)
+        await self._acquire_global(priority)
+        self.waited += time.monotonic() - started
+
+    async def _acquire_global(self, priority: int) -> None:
+        if not self._waiters and self.global_bucket.take() == 0:
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        if self._pump is None or self._pump.done():
+            self._pump = db.spawn(self._grant())
+        await future
+
+    async def _grant(self) -> None:
+        """Hand out global tokens to waiters, highest priority (then oldest) first"""
+        while self._waiters:
+            wait = self.global_bucket.take()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            while self._waiters:
+                _, _, future = heapq.heappop(self._waiters)
+                if not future.done():
+                    future.set_result(None)
+                    break
+            else:
+                # Every waiter gave up: the token goes back
+                self.global_bucket.refund()
+
+    async def send(self, make_request, bot: Bot, method: TelegramMethod):
+        priority = _priority.get()
+        for attempt in range(settings.TELEGRAM_SEND_RETRIES + 1):
+            await self.acquire(method.chat_id, priority)
+            try:
+                result = await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self._chat_bucket(method.chat_id).block(e.retry_after)
+                if attempt == settings.TELEGRAM_SEND_RETRIES:
+                    self.failed += 1
+                    raise
+                self.retried += 1
+                logger.warning(f"Telegram flood limit for chat {method.chat_id}: retry in {e.retry_after}s")
+                continue
+            self.sent += 1
+            self.sent_by_priority[priority] = self.sent_by_priority.get(priority, 0) + 1
+            return result
+
+    def metrics(self) -> dict:
+        return {
+            "sent": self.sent,
+            "sent_urgent": self.sent_by_priority.get(URGENT, 0),
+            "sent_normal": self.sent_by_priority.get(NORMAL, 0),
+            "sent_bulk": self.sent_by_priority.get(BULK, 0),
+            "retried": self.retried,
+            "failed": self.failed,
+            "waiting": len(self._waiters),
+            "chats": len(self._chats),
+            "avg_wait_ms": round(self.waited / self.sent * 1000, 1) if self.sent else None,
+        }
+
+
+class OutboundThrottle(BaseRequestMiddleware):
+    """Session middleware: rate-limits message sends, passes other API calls through"""
+
+    def __init__(self, sender: TelegramSender):
+        self.sender = sender
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        if not is_throttled(method):
+            return await make_request(bot, method)
+        return await self.sender.send(make_request, bot, method)
+
+
+telegram_sender = TelegramSender()
+
+
+def install(bot: Bot) -> None:
+    """Route every request of the bot through the shared limits"""
+    bot.session.middleware(OutboundThrottle(telegram_sender))
@@ -1,9 +1,58 @@
+import asyncio
 import asyncpg
+import contextvars
 import logging
+import orjson
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Coroutine, Optional
 from core.config import settings
 
 logger = logging.getLogger(__name__)
 
+
+class ConnectionScope:
+    """
+    One pooled connection shared by every repository call in a scope (a
+    db.scope() or db.transaction() block, e.g. the admin pages' request
+    dependency). The connection is acquired lazily on first use and goes back
+    to the pool when the block ends. Outside a scope every statement takes a
+    pool connection only for its own duration.
+    """
+    def __init__(self):
+        self.conn: Optional[asyncpg.Connection] = None
+        self.closed = False
+        # asyncpg connections can't run concurrent operations
+        self.lock = asyncio.Lock()
+
+    async def acquire(self) -> asyncpg.Connection:
+        if self.conn is None:
+            self.conn = await DatabasePool.get_pool().acquire()
+        return self.conn
+
+    async def close(self):
+        self.closed = True
+        if self.conn is not None:
+            await DatabasePool.get_pool().release(self.conn)
+            self.conn = None
+
+
+def _json_encode(value) -> str:
+    return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode()
+
+
+async def init_connection(conn: asyncpg.Connection):
+    """JSON/JSONB columns map to Python objects (orjson) on every pool connection"""
+    for typename in ("json", "jsonb"):
+        await conn.set_type_codec(
+            typename, schema="pg_catalog",
+            encoder=_json_encode, decoder=orjson.loads, format="text"
+        )
+
+
+_current_scope: ContextVar[Optional[ConnectionScope]] = ContextVar("db_connection_scope", default=None)
+
+
 class DatabasePool:
     _pool: asyncpg.Pool = None
 
@@ -14,7 +63,8 @@ class DatabasePool:
                 cls._pool = await asyncpg.create_pool(
                     settings.DATABASE_URL,
                     min_size=1,
-                    max_size=20
+                    max_size=20,
+                    init=init_connection
                 )
                 logger.info("Database connection pool created")
             except Exception as e:
@@ -34,4 +84,66 @@ class DatabasePool:
             raise RuntimeError("Database pool is not initialized. Call connect() first.")
         return cls._pool
 
+    @classmethod
+    def current_scope(cls) -> Optional[ConnectionScope]:
+        """Active connection scope, or None outside of scope()/transaction()"""
+        scope = _current_scope.get()
+        if scope is None or scope.closed:
+            return None
+        return scope
+
+    @classmethod
+    @asynccontextmanager
+    async def scope(cls):
+        """
+        Bind one connection to the current context.
+        Nested scopes reuse the outer one.
+        """
+        existing = cls.current_scope()
+        if existing is not None:
+            yield existing
+            return
+
+        scope = ConnectionScope()
+        token = _current_scope.set(scope)
+        try:
+            yield scope
+        finally:
+            _current_scope.reset(token)
+            await scope.close()
+
+    @staticmethod
+    def spawn(coro: Coroutine) -> asyncio.Task:
+        """
+        Start a background task outside the caller's connection scope: a task
+        created inside db.transaction() must not run its queries on (or outlive)
+        that transaction's connection.
+        """
+        return asyncio.create_task(coro, context=contextvars.Context())
+
+    @classmethod
+    @asynccontextmanager
+    async def transaction(cls):
+        """
+        Opt-in transaction on the scoped connection:
+            async with db.transaction():
+                await self.execute("LOCK TABLE ...")
+                await self.execute("DELETE FROM ...")
+        Nested calls become savepoints.
+        """
+        async with cls.scope() as scope:
+            async with scope.lock:
+                conn = await scope.acquire()
+                tr = conn.transaction()
+                await tr.start()
+            try:
+                yield conn
+            except BaseException:
+                async with scope.lock:
+                    await tr.rollback()
+                raise
+            else:
+                async with scope.lock:
+                    await tr.commit()
+
 db = DatabasePool()
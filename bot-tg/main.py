@@ -4,9 +4,11 @@ import logging
 import asyncio
 from core.config import settings
 from bot.handlers import common, materials, diagnostics, lead_form, admin
-from core.database import ensure_db_exists
+from core.database import run_migrations
 from core.logging_config import setup_logging
 from infrastructure.db import db
+from core.dependencies import user_service
+from core.telegram_sender import install as install_telegram_sender
 import uvicorn
 from web.routes import app as web_app
 from web.routes import set_bot
@@ -25,6 +27,12 @@ async def start_bot(bot: Bot, dp: Dispatcher):
     # Pass bot instance to web routes for notifications
     set_bot(bot)
     
+    # Load the admin roster before the first admin command arrives
+    try:
+        await user_service.admin_roster.reload()
+    except Exception as e:
+        logger.error(f"Admin roster load failed: {e}")
+    
     # Update Menu Button
     from aiogram.types import MenuButtonWebApp, WebAppInfo
     if settings.WEB_APP_URL:
@@ -36,7 +44,8 @@ async def start_bot(bot: Bot, dp: Dispatcher):
         )
         print(f"Updated Menu Button to: {settings.WEB_APP_URL}")
     
-    await dp.start_polling(bot)
+    # chat_member updates are only delivered when requested explicitly
+    await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
 
 async def start_web():
     # To run web app in the same loop, we can use uvicorn.Server with config
@@ -51,10 +60,15 @@ async def main():
     # Initialize Database Pool
     await db.connect()
     
-    # Init DB Schema
-    await ensure_db_exists()
+    # Apply pending schema migrations
+    try:
+        await run_migrations()
+    except Exception as e:
+        logging.error(f"Database migration failed: {e}")
     
     bot = Bot(token=settings.BOT_TOKEN)
+    # All sends share the global / per-chat rate limits
+    install_telegram_sender(bot)
     dp = Dispatcher()
     
     try:
@@ -0,0 +1,84 @@
+-- Base tables, default web admin and original indexes (was core/database.ensure_db_exists)
+
+CREATE TABLE IF NOT EXISTS users (
+    user_id BIGINT PRIMARY KEY,
+    username TEXT,
+    first_name TEXT,
+    joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS leads (
+    id SERIAL PRIMARY KEY,
+    user_id BIGINT,
+    contact_info TEXT,
+    message TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS user_contacts (
+    user_id BIGINT PRIMARY KEY,
+    name TEXT NOT NULL,
+    role TEXT NOT NULL,
+    company TEXT,
+    team_size TEXT NOT NULL,
+    phone TEXT NOT NULL,
+    telegram_username TEXT,
+    product TEXT DEFAULT 'teremok',
+    status TEXT DEFAULT 'new',
+    notes TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS test_results (
+    id SERIAL PRIMARY KEY,
+    user_id BIGINT NOT NULL,
+    result_type TEXT NOT NULL,
+    scores TEXT,
+    answers TEXT,
+    product TEXT DEFAULT 'teremok',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES user_contacts(user_id)
+);
+
+CREATE TABLE IF NOT EXISTS admins (
+    user_id BIGINT PRIMARY KEY,
+    username TEXT,
+    role TEXT DEFAULT 'admin',
+    added_by BIGINT,
+    added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS formula_rsp_results (
+    id SERIAL PRIMARY KEY,
+    user_id BIGINT NOT NULL,
+    primary_type_code TEXT NOT NULL,
+    primary_type_name TEXT NOT NULL,
+    scores TEXT,
+    answers TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES user_contacts(user_id)
+);
+
+CREATE TABLE IF NOT EXISTS web_admins (
+    id SERIAL PRIMARY KEY,
+    username TEXT UNIQUE NOT NULL,
+    password_hash TEXT NOT NULL,
+    salt TEXT NOT NULL,
+    session_token TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Default admin/admin on an empty install: sha256(password || salt), 32-char hex salt
+INSERT INTO web_admins (username, password_hash, salt)
+SELECT 'admin', encode(sha256(convert_to('admin' || s.salt, 'UTF8')), 'hex'), s.salt
+FROM (SELECT md5(random()::text || clock_timestamp()::text) AS salt) s
+WHERE NOT EXISTS (SELECT 1 FROM web_admins);
+
+CREATE INDEX IF NOT EXISTS idx_contacts_created ON user_contacts(created_at);
+CREATE INDEX IF NOT EXISTS idx_contacts_status ON user_contacts(status);
+CREATE INDEX IF NOT EXISTS idx_contacts_user_id ON user_contacts(user_id);
+CREATE INDEX IF NOT EXISTS idx_tests_created ON test_results(created_at);
+CREATE INDEX IF NOT EXISTS idx_tests_user_id ON test_results(user_id);
+CREATE INDEX IF NOT EXISTS idx_tests_product ON test_results(product);
+CREATE INDEX IF NOT EXISTS idx_formula_rsp_user ON formula_rsp_results(user_id);
@@ -0,0 +1,13 @@
+-- Unified lead fields on user_contacts (was UserRepository.ensure_schema)
+
+ALTER TABLE user_contacts ADD COLUMN IF NOT EXISTS email TEXT;
+ALTER TABLE user_contacts ADD COLUMN IF NOT EXISTS consent BOOLEAN DEFAULT FALSE;
+ALTER TABLE user_contacts ADD COLUMN IF NOT EXISTS preferred_channel TEXT;
+ALTER TABLE user_contacts ADD COLUMN IF NOT EXISTS source TEXT DEFAULT 'landing';
+ALTER TABLE user_contacts ADD COLUMN IF NOT EXISTS session_id TEXT;
+ALTER TABLE user_contacts ADD COLUMN IF NOT EXISTS utm_source TEXT;
+ALTER TABLE user_contacts ADD COLUMN IF NOT EXISTS utm_medium TEXT;
+ALTER TABLE user_contacts ADD COLUMN IF NOT EXISTS utm_campaign TEXT;
+ALTER TABLE user_contacts ADD COLUMN IF NOT EXISTS utm_content TEXT;
+ALTER TABLE user_contacts ADD COLUMN IF NOT EXISTS utm_term TEXT;
+ALTER TABLE user_contacts ADD COLUMN IF NOT EXISTS comment TEXT;
@@ -0,0 +1,22 @@
+-- Unified test storage (was TestRepository.ensure_schema)
+
+CREATE TABLE IF NOT EXISTS test_sessions (
+    id SERIAL PRIMARY KEY,
+    user_id BIGINT,
+    product TEXT,
+    channel TEXT,
+    source TEXT,
+    status TEXT,
+    answers_json TEXT,
+    result_json TEXT,
+    meta_json TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    legacy_source TEXT,
+    legacy_id BIGINT
+);
+
+ALTER TABLE test_sessions ADD COLUMN IF NOT EXISTS legacy_source TEXT;
+ALTER TABLE test_sessions ADD COLUMN IF NOT EXISTS legacy_id BIGINT;
+
+-- Idempotent backfill from legacy tables
+CREATE UNIQUE INDEX IF NOT EXISTS idx_test_sessions_legacy ON test_sessions (legacy_source, legacy_id);
@@ -0,0 +1,16 @@
+-- Pre-aggregated dashboard counters, see repositories/rollups.py
+
+CREATE TABLE IF NOT EXISTS daily_rollups (
+    day DATE NOT NULL,
+    product TEXT NOT NULL DEFAULT '',
+    source TEXT NOT NULL DEFAULT '',
+    utm_source TEXT NOT NULL DEFAULT '',
+    result_type TEXT NOT NULL DEFAULT '',
+    leads INTEGER NOT NULL DEFAULT 0,
+    leads_new INTEGER NOT NULL DEFAULT 0,
+    leads_done INTEGER NOT NULL DEFAULT 0,
+    tests INTEGER NOT NULL DEFAULT 0,
+    formula_tests INTEGER NOT NULL DEFAULT 0,
+    sessions INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, product, source, utm_source, result_type)
+);
@@ -0,0 +1,17 @@
+-- Keyset pagination: one (sort key, id) index per sort column of the admin listings
+-- (UserRepository.LEADS_SORT_COLUMNS, TestRepository.TESTS_SORT_COLUMNS / UNIFIED_KEYS)
+
+CREATE INDEX IF NOT EXISTS idx_contacts_created_user ON user_contacts (created_at, user_id);
+CREATE INDEX IF NOT EXISTS idx_contacts_updated_user ON user_contacts (updated_at, user_id);
+CREATE INDEX IF NOT EXISTS idx_contacts_status_user ON user_contacts ((COALESCE(status, '')), user_id);
+CREATE INDEX IF NOT EXISTS idx_contacts_name_user ON user_contacts ((COALESCE(name, '')), user_id);
+CREATE INDEX IF NOT EXISTS idx_contacts_company_user ON user_contacts ((COALESCE(company, '')), user_id);
+CREATE INDEX IF NOT EXISTS idx_contacts_role_user ON user_contacts ((COALESCE(role, '')), user_id);
+CREATE INDEX IF NOT EXISTS idx_contacts_product_user ON user_contacts ((COALESCE(product, '')), user_id);
+CREATE INDEX IF NOT EXISTS idx_contacts_team_size_user ON user_contacts ((COALESCE(team_size, '')), user_id);
+
+CREATE INDEX IF NOT EXISTS idx_tests_created_id ON test_results (created_at, id);
+CREATE INDEX IF NOT EXISTS idx_tests_result_type_id ON test_results (result_type, id);
+CREATE INDEX IF NOT EXISTS idx_tests_product_id ON test_results ((COALESCE(product, '')), id);
+
+CREATE INDEX IF NOT EXISTS idx_test_sessions_created_id ON test_sessions (created_at, id);
@@ -0,0 +1,11 @@
+-- Lead search, see repositories/search.py: trigram indexes on name/company,
+-- digits-only phone column with a prefix-capable btree index
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+ALTER TABLE user_contacts ADD COLUMN IF NOT EXISTS phone_digits TEXT
+    GENERATED ALWAYS AS (regexp_replace(COALESCE(phone, ''), '[^0-9]', '', 'g')) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_contacts_name_trgm ON user_contacts USING gin (name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_contacts_company_trgm ON user_contacts USING gin (company gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_contacts_phone_digits ON user_contacts (phone_digits text_pattern_ops);
@@ -0,0 +1,3 @@
+-- Latest test per lead (leads listing LATERAL join)
+
+CREATE INDEX IF NOT EXISTS idx_tests_user_created ON test_results (user_id, created_at DESC);
@@ -0,0 +1,32 @@
+-- Test payloads as JSONB (decoded to Python objects by the pool's JSON codec)
+-- plus GIN indexes for containment queries on session results.
+-- Text that isn't valid JSON is kept as a JSON string instead of aborting the migration.
+
+CREATE FUNCTION pg_temp.safe_jsonb(value TEXT) RETURNS JSONB AS $$
+BEGIN
+    IF value IS NULL OR btrim(value) = '' THEN
+        RETURN NULL;
+    END IF;
+    RETURN value::jsonb;
+EXCEPTION WHEN invalid_text_representation OR untranslatable_character THEN
+    RETURN to_jsonb(value);
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+ALTER TABLE test_results
+    ALTER COLUMN scores TYPE JSONB USING pg_temp.safe_jsonb(scores),
+    ALTER COLUMN answers TYPE JSONB USING pg_temp.safe_jsonb(answers);
+
+ALTER TABLE formula_rsp_results
+    ALTER COLUMN scores TYPE JSONB USING pg_temp.safe_jsonb(scores),
+    ALTER COLUMN answers TYPE JSONB USING pg_temp.safe_jsonb(answers);
+
+ALTER TABLE test_sessions
+    ALTER COLUMN answers_json TYPE JSONB USING pg_temp.safe_jsonb(answers_json),
+    ALTER COLUMN result_json TYPE JSONB USING pg_temp.safe_jsonb(result_json),
+    ALTER COLUMN meta_json TYPE JSONB USING pg_temp.safe_jsonb(meta_json);
+
+DROP FUNCTION pg_temp.safe_jsonb(TEXT);
+
+CREATE INDEX IF NOT EXISTS idx_test_sessions_result_gin ON test_sessions USING gin (result_json jsonb_path_ops);
+CREATE INDEX IF NOT EXISTS idx_test_sessions_meta_gin ON test_sessions USING gin (meta_json jsonb_path_ops);
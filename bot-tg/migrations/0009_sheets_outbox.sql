@@ -0,0 +1,17 @@
+-- Durable outbox for Google Sheets rows, written in the same statement as the
+-- lead/test and drained by the background worker (services/sheets_outbox.py)
+
+CREATE TABLE IF NOT EXISTS sheets_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload JSONB NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_error TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Due rows in FIFO order; dead letters stay out of the hot index
+CREATE INDEX IF NOT EXISTS idx_sheets_outbox_due ON sheets_outbox (next_attempt_at, id) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_sheets_outbox_dead ON sheets_outbox (id) WHERE status = 'dead';
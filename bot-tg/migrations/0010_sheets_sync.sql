@@ -0,0 +1,25 @@
+-- Incremental Google Sheets sync (services/sheets_sync.py): one watermark per
+-- stream plus the content hash of every row already sent, so a run only sends
+-- new or changed rows
+
+CREATE TABLE IF NOT EXISTS sync_state (
+    stream TEXT PRIMARY KEY,
+    watermark_at TIMESTAMP,
+    watermark_id BIGINT,
+    locked_until TIMESTAMP,
+    last_run_at TIMESTAMP,
+    last_sent INTEGER NOT NULL DEFAULT 0,
+    last_skipped INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT
+);
+
+CREATE TABLE IF NOT EXISTS sync_row_hashes (
+    stream TEXT NOT NULL,
+    row_key BIGINT NOT NULL,
+    row_hash TEXT NOT NULL,
+    synced_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (stream, row_key)
+);
+
+-- Watermark scans reuse the keyset indexes from 0005:
+-- user_contacts (updated_at, user_id), test_results (created_at, id), test_sessions (created_at, id)
@@ -0,0 +1,16 @@
+-- Admin panel sessions (services/auth_service.py): only a SHA-256 of the
+-- cookie token is stored, looked up through the primary key, and every
+-- session has a server-side expiry. Several sessions per admin are allowed.
+
+CREATE TABLE IF NOT EXISTS admin_sessions (
+    token_hash TEXT PRIMARY KEY,
+    admin_id INTEGER NOT NULL REFERENCES web_admins(id) ON DELETE CASCADE,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_admin_sessions_admin ON admin_sessions (admin_id);
+CREATE INDEX IF NOT EXISTS idx_admin_sessions_expires ON admin_sessions (expires_at);
+
+-- Plaintext tokens without expiry are gone: existing sessions log in again
+ALTER TABLE web_admins DROP COLUMN IF EXISTS session_token;
@@ -0,0 +1,31 @@
+-- Bot broadcasts (services/broadcast.py). Recipients are walked in user_id
+-- order; `cursor` is the last user_id handled, saved with the counters after
+-- every page, so a restart resumes where the broadcast stopped. A running
+-- broadcast is leased (locked_until) by one process at a time.
+
+CREATE TABLE IF NOT EXISTS broadcasts (
+    id BIGSERIAL PRIMARY KEY,
+    text TEXT NOT NULL,
+    filters JSONB NOT NULL DEFAULT '{}'::jsonb,
+    status TEXT NOT NULL DEFAULT 'draft',
+    created_by TEXT,
+    total INTEGER NOT NULL DEFAULT 0,
+    sent INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    blocked INTEGER NOT NULL DEFAULT 0,
+    cursor BIGINT NOT NULL DEFAULT 0,
+    locked_until TIMESTAMP,
+    last_error TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_broadcasts_running ON broadcasts (id) WHERE status = 'running';
+
+-- Users who blocked the bot (or whose chat is gone): broadcasts skip them.
+-- Cleared when the user unblocks the bot.
+CREATE TABLE IF NOT EXISTS bot_blocked_users (
+    user_id BIGINT PRIMARY KEY,
+    reason TEXT,
+    blocked_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
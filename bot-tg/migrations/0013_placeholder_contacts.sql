@@ -0,0 +1,6 @@
+-- A Teremok submit without a contact creates a placeholder user_contacts row
+-- (test_results.user_id needs it). Placeholders are not leads: they are left
+-- out of lead counters, listings, Sheets and broadcast filters until the user
+-- leaves real contacts (save_contact clears the flag).
+
+ALTER TABLE user_contacts ADD COLUMN IF NOT EXISTS is_placeholder BOOLEAN NOT NULL DEFAULT FALSE;
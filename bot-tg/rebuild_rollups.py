@@ -0,0 +1,35 @@
+"""
+Rebuild daily_rollups from user_contacts, test_results,
+formula_rsp_results and test_sessions.
+
+Usage: python rebuild_rollups.py
+"""
+import asyncio
+import traceback
+from dotenv import load_dotenv
+
+
+async def rebuild():
+    load_dotenv(override=True)
+
+    from infrastructure.db import db
+    from core.database import run_migrations
+    from repositories.user_repository import UserRepository
+
+    print("Connecting to DB...")
+    await db.connect()
+
+    try:
+        await run_migrations()
+        repo = UserRepository()
+        rows = await repo.rebuild_daily_rollups()
+        print(f"Daily rollups rebuilt: {rows} rows")
+    finally:
+        await db.disconnect()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(rebuild())
+    except Exception:
+        traceback.print_exc()
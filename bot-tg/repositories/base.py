@@ -1,7 +1,8 @@
 import asyncpg
 from core.config import settings
 from core.exceptions import RepositoryError
-from typing import Optional, List, Any, Dict
+from typing import Optional, List, Any, Dict, AsyncIterator
+from contextlib import asynccontextmanager
 import logging
 from infrastructure.db import db
 
@@ -15,13 +16,24 @@ class BaseRepository:
 
     async def get_connection(self):
         # Allow usage as context manager: async with self.get_connection() as conn:
-        return db.get_pool().acquire()
+        return self._connection()
+
+    @asynccontextmanager
+    async def _connection(self):
+        """Reuse the scoped connection inside db.scope()/db.transaction(), else take one from the pool for this statement"""
+        scope = db.current_scope()
+        if scope is None:
+            async with db.get_pool().acquire() as conn:
+                yield conn
+            return
+
+        async with scope.lock:
+            yield await scope.acquire()
 
     async def execute(self, query: str, *params) -> str:
         """Execute a query (INSERT, UPDATE, DELETE)"""
         try:
-            pool = db.get_pool()
-            async with pool.acquire() as conn:
+            async with self._connection() as conn:
                 return await conn.execute(query, *params)
         except Exception as e:
             logger.error(f"DB Execute Error: {e} | Query: {query}")
@@ -29,8 +41,7 @@ class BaseRepository:
 
     async def fetch_one(self, query: str, *params) -> Optional[asyncpg.Record]:
         try:
-            pool = db.get_pool()
-            async with pool.acquire() as conn:
+            async with self._connection() as conn:
                 return await conn.fetchrow(query, *params)
         except Exception as e:
             logger.error(f"DB Fetch One Error: {e} | Query: {query}")
@@ -38,8 +49,7 @@ class BaseRepository:
 
     async def fetch_all(self, query: str, *params) -> List[asyncpg.Record]:
         try:
-            pool = db.get_pool()
-            async with pool.acquire() as conn:
+            async with self._connection() as conn:
                 return await conn.fetch(query, *params)
         except Exception as e:
             logger.error(f"DB Fetch All Error: {e} | Query: {query}")
@@ -47,9 +57,23 @@ class BaseRepository:
             
     async def fetch_val(self, query: str, *params) -> Any:
         try:
-            pool = db.get_pool()
-            async with pool.acquire() as conn:
+            async with self._connection() as conn:
                 return await conn.fetchval(query, *params)
         except Exception as e:
             logger.error(f"DB Fetch Val Error: {e} | Query: {query}")
             raise RepositoryError(f"Database error: {str(e)}")
+
+    async def stream(self, query: str, *params, prefetch: int = 500) -> AsyncIterator[asyncpg.Record]:
+        """
+        Iterate rows through a server-side cursor, prefetch rows per round trip.
+        Uses its own pool connection (never a transaction scope): streamed responses
+        outlive the request handler.
+        """
+        try:
+            async with db.get_pool().acquire() as conn:
+                async with conn.transaction(readonly=True):
+                    async for row in conn.cursor(query, *params, prefetch=prefetch):
+                        yield row
+        except Exception as e:
+            logger.error(f"DB Stream Error: {e} | Query: {query}")
+            raise RepositoryError(f"Database error: {str(e)}")
@@ -0,0 +1,164 @@
+"""
+Bot broadcasts and their audiences (migrations/0012).
+
+The audience is user_contacts narrowed by the filters, or every known bot user
+(users ∪ user_contacts) when no filter is set, minus users in
+bot_blocked_users. Recipients are read in user_id pages after the broadcast's
+cursor; the runner in services/broadcast.py leases a running broadcast
+(locked_until), so several processes never send the same one.
+"""
+from .base import BaseRepository
+from datetime import date
+from typing import List, Optional, Tuple
+
+DRAFT = "draft"
+RUNNING = "running"
+PAUSED = "paused"
+DONE = "done"
+CANCELLED = "cancelled"
+FAILED = "failed"
+
+# Exact-match filters on user_contacts; date_from / date_to bound created_at (inclusive days)
+MATCH_FILTERS = ("product", "status", "utm_source", "utm_medium", "utm_campaign")
+DATE_FILTERS = ("date_from", "date_to")
+
+
+def clean_filters(raw: dict) -> dict:
+    """Known, non-empty filters; raises ValueError on a malformed date"""
+    filters = {}
+    for name in MATCH_FILTERS + DATE_FILTERS:
+        value = (raw or {}).get(name)
+        if value in (None, "", "all"):
+            continue
+        value = str(value).strip()
+        if name in DATE_FILTERS:
+            date.fromisoformat(value)
+        filters[name] = value
+    return filters
+
+
+def _audience(filters: dict) -> Tuple[str, list]:
+    """(SELECT user_id ..., params) for the filters"""
+    conditions, params = [], []
+    for name in MATCH_FILTERS:
+        if filters.get(name):
+            params.append(filters[name])
+            conditions.append(f"c.{name} = ${len(params)}")
+    if filters.get("date_from"):
+        params.append(date.fromisoformat(filters["date_from"]))
+        conditions.append(f"c.created_at >= ${len(params)}")
+    if filters.get("date_to"):
+        params.append(date.fromisoformat(filters["date_to"]))
+        conditions.append(f"c.created_at < ${len(params)}::date + 1")
+
+    if conditions:
+        # Lead filters: placeholder contacts are not leads
+        conditions.append("NOT c.is_placeholder")
+        source = "SELECT c.user_id FROM user_contacts c WHERE " + " AND ".join(conditions)
+    else:
+        source = "SELECT user_id FROM users UNION SELECT user_id FROM user_contacts"
+    # Web guests have no Telegram chat (user_id <= 0)
+    return f"""
+        SELECT a.user_id FROM ({source}) a
+        WHERE a.user_id > 0
+          AND NOT EXISTS (SELECT 1 FROM bot_blocked_users b WHERE b.user_id = a.user_id)
+    """, params
+
+
+class BroadcastRepository(BaseRepository):
+
+    async def count_audience(self, filters: dict) -> int:
+        audience, params = _audience(filters)
+        return await self.fetch_val(f"SELECT COUNT(*) FROM ({audience}) r", *params)
+
+    async def recipients(self, filters: dict, after: int, limit: int) -> List[int]:
+        """Next page of recipients in user_id order"""
+        audience, params = _audience(filters)
+        n = len(params)
+        rows = await self.fetch_all(f"""
+            SELECT r.user_id FROM ({audience}) r
+            WHERE r.user_id > ${n + 1}
+            ORDER BY r.user_id
+            LIMIT ${n + 2}
+        """, *params, after, limit)
+        return [row['user_id'] for row in rows]
+
+    async def create(self, text: str, filters: dict, created_by: str, status: str = DRAFT) -> dict:
+        total = await self.count_audience(filters)
+        row = await self.fetch_one("""
+            INSERT INTO broadcasts (text, filters, created_by, total, status)
+            VALUES ($1, $2, $3, $4, $5)
+            RETURNING *
+        """, text, filters, created_by, total, status)
+        return dict(row)
+
+    async def get(self, broadcast_id: int) -> Optional[dict]:
+        row = await self.fetch_one("SELECT * FROM broadcasts WHERE id = $1", broadcast_id)
+        return dict(row) if row else None
+
+    async def get_recent(self, limit: int = 20) -> List[dict]:
+        rows = await self.fetch_all("SELECT * FROM broadcasts ORDER BY id DESC LIMIT $1", limit)
+        return [dict(row) for row in rows]
+
+    async def set_status(self, broadcast_id: int, status: str, from_statuses: tuple) -> Optional[dict]:
+        """Move to status if the broadcast is currently in one of from_statuses"""
+        row = await self.fetch_one("""
+            UPDATE broadcasts
+            SET status = $2,
+                locked_until = NULL,
+                finished_at = CASE WHEN $2 IN ('done', 'cancelled', 'failed') THEN CURRENT_TIMESTAMP END
+            WHERE id = $1 AND status = ANY($3::text[])
+            RETURNING *
+        """, broadcast_id, status, list(from_statuses))
+        return dict(row) if row else None
+
+    async def claim(self, lease_seconds: float) -> Optional[dict]:
+        """Lease the oldest running broadcast nobody is sending; None if there is none"""
+        row = await self.fetch_one("""
+            UPDATE broadcasts
+            SET locked_until = CURRENT_TIMESTAMP + $1::float8 * interval '1 second'
+            WHERE id = (
+                SELECT id FROM broadcasts
+                WHERE status = 'running' AND (locked_until IS NULL OR locked_until < CURRENT_TIMESTAMP)
+                ORDER BY id
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING *
+        """, float(lease_seconds))
+        return dict(row) if row else None
+
+    async def checkpoint(self, broadcast_id: int, cursor: int, sent: int, failed: int, blocked: int,
+                         lease_seconds: float) -> Optional[str]:
+        """Save progress and extend the lease; returns the current status (admin may have paused it)"""
+        return await self.fetch_val("""
+            UPDATE broadcasts
+            SET cursor = $2, sent = $3, failed = $4, blocked = $5,
+                locked_until = CASE WHEN status = 'running'
+                                    THEN CURRENT_TIMESTAMP + $6::float8 * interval '1 second' END
+            WHERE id = $1
+            RETURNING status
+        """, broadcast_id, cursor, sent, failed, blocked, float(lease_seconds))
+
+    async def release(self, broadcast_id: int) -> None:
+        """Give the lease up (shutdown): another process or the next start resumes at once"""
+        await self.execute("UPDATE broadcasts SET locked_until = NULL WHERE id = $1", broadcast_id)
+
+    async def finish(self, broadcast_id: int, status: str, error: str = None) -> None:
+        await self.execute("""
+            UPDATE broadcasts
+            SET status = $2, last_error = $3, locked_until = NULL, finished_at = CURRENT_TIMESTAMP
+            WHERE id = $1 AND status = 'running'
+        """, broadcast_id, status, error)
+
+    async def mark_blocked(self, user_ids: List[int], reason: str) -> None:
+        if not user_ids:
+            return
+        await self.execute("""
+            INSERT INTO bot_blocked_users (user_id, reason)
+            SELECT unnest($1::bigint[]), $2
+            ON CONFLICT (user_id) DO UPDATE SET reason = EXCLUDED.reason, blocked_at = CURRENT_TIMESTAMP
+        """, user_ids, reason)
+
+    async def unmark_blocked(self, user_id: int) -> None:
+        await self.execute("DELETE FROM bot_blocked_users WHERE user_id = $1", user_id)
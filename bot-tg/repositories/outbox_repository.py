@@ -0,0 +1,95 @@
+"""
+Google Sheets outbox.
+
+Writers append an "outbox" CTE to their own statement, so the Sheets row is
+committed together with the lead/test it describes. The worker in
+services/sheets_outbox.py claims due rows with a lease (FOR UPDATE SKIP LOCKED,
+safe with several processes), deletes them once delivered and otherwise
+reschedules them with exponential backoff until they become dead letters.
+"""
+from .base import BaseRepository
+from core.config import settings
+from typing import List
+
+
+def sheets_outbox_cte(kind: str, payload_sql: str, from_sql: str) -> str:
+    """
+    ", outbox AS (INSERT INTO sheets_outbox ...)" to append after the writer's CTEs,
+    or "" when the Sheets integration is disabled.
+    payload_sql is a jsonb expression evaluated per row of from_sql.
+    """
+    if not settings.GOOGLE_SHEETS_ENABLED:
+        return ""
+    return f""",
+        outbox AS (
+            INSERT INTO sheets_outbox (kind, payload)
+            SELECT '{kind}', {payload_sql} {from_sql}
+        )"""
+
+
+class OutboxRepository(BaseRepository):
+
+    async def claim_batch(self, limit: int, lease_seconds: float) -> List[dict]:
+        """Take up to limit due rows; they stay invisible to other workers for the lease"""
+        rows = await self.fetch_all("""
+            UPDATE sheets_outbox o
+            SET next_attempt_at = CURRENT_TIMESTAMP + $2::float8 * interval '1 second'
+            FROM (
+                SELECT id FROM sheets_outbox
+                WHERE status = 'pending' AND next_attempt_at <= CURRENT_TIMESTAMP
+                ORDER BY next_attempt_at, id
+                LIMIT $1
+                FOR UPDATE SKIP LOCKED
+            ) due
+            WHERE o.id = due.id
+            RETURNING o.id, o.kind, o.payload, o.attempts
+        """, limit, float(lease_seconds))
+        return sorted((dict(row) for row in rows), key=lambda r: r['id'])
+
+    async def delete_sent(self, ids: List[int]) -> None:
+        await self.execute("DELETE FROM sheets_outbox WHERE id = ANY($1::bigint[])", ids)
+
+    async def mark_failed(self, ids: List[int], error: str, max_attempts: int,
+                          backoff_base: float, backoff_max: float) -> int:
+        """Reschedule with exponential backoff; returns how many became dead letters"""
+        return await self.fetch_val("""
+            WITH failed AS (
+                UPDATE sheets_outbox
+                SET attempts = attempts + 1,
+                    last_error = $2,
+                    status = CASE WHEN attempts + 1 >= $3 THEN 'dead' ELSE 'pending' END,
+                    next_attempt_at = CURRENT_TIMESTAMP
+                        + LEAST($5::float8, $4::float8 * power(2, attempts)) * interval '1 second'
+                WHERE id = ANY($1::bigint[])
+                RETURNING status
+            )
+            SELECT COUNT(*) FILTER (WHERE status = 'dead') FROM failed
+        """, ids, error, max_attempts, float(backoff_base), float(backoff_max))
+
+    async def requeue_dead(self) -> int:
+        """Give dead letters a fresh set of attempts"""
+        return await self.fetch_val("""
+            WITH requeued AS (
+                UPDATE sheets_outbox
+                SET status = 'pending', attempts = 0, next_attempt_at = CURRENT_TIMESTAMP
+                WHERE status = 'dead'
+                RETURNING 1
+            )
+            SELECT COUNT(*) FROM requeued
+        """)
+
+    async def get_stats(self) -> dict:
+        """Queue depth and lag"""
+        row = await self.fetch_one("""
+            SELECT
+                COUNT(*) FILTER (WHERE status = 'pending') AS pending,
+                COUNT(*) FILTER (WHERE status = 'pending' AND next_attempt_at <= CURRENT_TIMESTAMP) AS due,
+                COUNT(*) FILTER (WHERE status = 'pending' AND attempts > 0) AS retrying,
+                COUNT(*) FILTER (WHERE status = 'dead') AS dead,
+                EXTRACT(EPOCH FROM CURRENT_TIMESTAMP - MIN(created_at) FILTER (WHERE status = 'pending')) AS lag_seconds,
+                (ARRAY_AGG(last_error ORDER BY id DESC) FILTER (WHERE last_error IS NOT NULL))[1] AS last_error
+            FROM sheets_outbox
+        """)
+        stats = dict(row)
+        stats['lag_seconds'] = round(float(stats['lag_seconds']), 1) if stats['lag_seconds'] is not None else 0.0
+        return stats
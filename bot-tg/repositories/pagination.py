@@ -0,0 +1,80 @@
+"""
+Keyset (cursor) pagination helpers.
+
+A cursor is an opaque url-safe token with the sort key of the last row served.
+The next page continues strictly after it in (sort column, id...) order, so
+deep pages cost the same as the first one and rows inserted meanwhile don't
+shift the window.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Sequence, Tuple
+
+
+def encode_cursor(sort_by: str, sort_order: str, values: Sequence[Any]) -> str:
+    encoded = [["dt", v.isoformat()] if isinstance(v, datetime) else ["v", v] for v in values]
+    raw = json.dumps([sort_by, sort_order, encoded], separators=(",", ":"), default=str)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _key_value(kind: Any, value: Any, default: Any) -> Any:
+    """Decoded cursor value, checked against the column type (its NULL default); ValueError if it doesn't fit"""
+    if default is None:
+        # Timestamp columns
+        if kind != "dt" or not isinstance(value, str):
+            raise ValueError("expected a timestamp")
+        return datetime.fromisoformat(value)
+    if kind != "v" or isinstance(value, bool):
+        raise ValueError("unexpected value")
+    if isinstance(default, float) and isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, type(default)):
+        raise ValueError(f"expected {type(default).__name__}")
+    return value
+
+
+def decode_cursor(token: Optional[str], sort_by: str, sort_order: str,
+                  keys: Sequence[Tuple[str, Any]]) -> Optional[List[Any]]:
+    """
+    Key values from a cursor, or None if it's missing, malformed, for another
+    sort or doesn't fit the keyset columns.
+    keys: (row key, value used when NULL) for every keyset column, as in make_page.
+    """
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        cursor_sort_by, cursor_order, encoded = json.loads(raw)
+        if cursor_sort_by != sort_by or cursor_order != sort_order or len(encoded) != len(keys):
+            return None
+        return [_key_value(kind, value, default) for (kind, value), (_, default) in zip(encoded, keys)]
+    except Exception:
+        return None
+
+
+def keyset_condition(exprs: Sequence[str], order: str, first_param: int) -> str:
+    """Row comparison continuing after the cursor, e.g. (c.created_at, c.user_id) < ($3, $4)"""
+    placeholders = ", ".join(f"${first_param + i}" for i in range(len(exprs)))
+    op = ">" if order == "ASC" else "<"
+    return f"({', '.join(exprs)}) {op} ({placeholders})"
+
+
+def keyset_order(exprs: Sequence[str], order: str) -> str:
+    return ", ".join(f"{e} {order}" for e in exprs)
+
+
+def make_page(rows: List[dict], limit: int, sort_by: str, sort_order: str,
+              keys: Sequence[Tuple[str, Any]]) -> dict:
+    """
+    Build {"items", "next_cursor"} from limit + 1 fetched rows.
+    keys: (row key, value used when NULL) for every keyset column.
+    """
+    has_more = len(rows) > limit
+    items = rows[:limit]
+    next_cursor = None
+    if has_more and items:
+        last = items[-1]
+        values = [last.get(key) if last.get(key) is not None else default for key, default in keys]
+        next_cursor = encode_cursor(sort_by, sort_order, values)
+    return {"items": items, "next_cursor": next_cursor}
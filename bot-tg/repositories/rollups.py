@@ -0,0 +1,73 @@
+"""
+Daily rollups: pre-aggregated counters per (day, product, source, utm_source, result_type).
+
+Writers attach a rollup CTE to their own INSERT/UPDATE, so the counters move
+in the same statement as the row itself. Dimensions are attributed at write
+time (later edits of a contact's product/source don't move old counts).
+The table itself is created by migrations/0004_daily_rollups.sql.
+"""
+
+ROLLUP_KEYS = ("day", "product", "source", "utm_source", "result_type")
+ROLLUP_METRICS = ("leads", "leads_new", "leads_done", "tests", "formula_tests", "sessions")
+
+
+def rollup_delta(from_sql: str, day: str, product: str = "''", source: str = "''",
+                 utm_source: str = "''", result_type: str = "''", **metrics: str) -> str:
+    """
+    SELECT producing one delta row per source row.
+    Key/metric arguments are SQL expressions; omitted metrics are 0.
+    """
+    columns = [
+        f"{day} AS day",
+        f"{product} AS product",
+        f"{source} AS source",
+        f"{utm_source} AS utm_source",
+        f"{result_type} AS result_type",
+    ]
+    columns += [f"{metrics.get(m, '0')} AS {m}" for m in ROLLUP_METRICS]
+    return f"SELECT {', '.join(columns)} {from_sql}"
+
+
+def rollup_upsert(*deltas: str) -> str:
+    """
+    INSERT ... ON CONFLICT adding the given deltas to daily_rollups.
+    Deltas are grouped first, so one statement never touches a key twice.
+    """
+    union = "\nUNION ALL\n".join(deltas)
+    sums = ", ".join(f"SUM({m})" for m in ROLLUP_METRICS)
+    increments = ",\n".join(f"{m} = daily_rollups.{m} + EXCLUDED.{m}" for m in ROLLUP_METRICS)
+    return f"""
+        INSERT INTO daily_rollups ({', '.join(ROLLUP_KEYS)}, {', '.join(ROLLUP_METRICS)})
+        SELECT day, COALESCE(product, ''), COALESCE(source, ''), COALESCE(utm_source, ''),
+               COALESCE(result_type, ''), {sums}
+        FROM ({union}) AS delta
+        GROUP BY 1, 2, 3, 4, 5
+        ON CONFLICT ({', '.join(ROLLUP_KEYS)}) DO UPDATE SET
+        {increments}
+    """
+
+
+# Full recompute from the source tables
+REBUILD_ROLLUPS = rollup_upsert(
+    rollup_delta(
+        "FROM user_contacts WHERE NOT is_placeholder",
+        "created_at::date", "product", "source", "utm_source",
+        leads="1", leads_new="(status IS NOT DISTINCT FROM 'new')::int",
+        leads_done="(status IS NOT DISTINCT FROM 'done')::int"
+    ),
+    rollup_delta(
+        "FROM test_results t LEFT JOIN user_contacts c ON c.user_id = t.user_id",
+        "t.created_at::date", "t.product", "c.source", "c.utm_source", "t.result_type",
+        tests="1"
+    ),
+    rollup_delta(
+        "FROM formula_rsp_results f LEFT JOIN user_contacts c ON c.user_id = f.user_id",
+        "f.created_at::date", "'formula_rsp'", "c.source", "c.utm_source", "f.primary_type_code",
+        formula_tests="1"
+    ),
+    rollup_delta(
+        "FROM test_sessions ts LEFT JOIN user_contacts c ON c.user_id = ts.user_id",
+        "ts.created_at::date", "ts.product", "ts.source", "c.utm_source", "ts.meta_json->>'type'",
+        sessions="1"
+    ),
+)
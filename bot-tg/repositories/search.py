@@ -0,0 +1,60 @@
+"""
+Lead search: trigram-indexed name/company matching and digits-only phone lookup.
+
+Name and company are matched by substring (ILIKE) or fuzzily (word similarity),
+both served by pg_trgm GIN indexes. Phones are compared on phone_digits, a
+generated column with only the digits of phone, as a btree prefix range, so
+"+7 (916) 123" finds "79161234567". Relevance is the best word similarity of
+the term to name/company, with phone matches ranked first.
+Column and indexes come from migrations/0006_lead_search.sql.
+"""
+import re
+from typing import Any, List, Tuple
+
+# Shortest digit run treated as a phone query
+MIN_PHONE_DIGITS = 3
+
+
+def phone_digits(term: str) -> str:
+    return re.sub(r"\D", "", term or "")
+
+
+def _like_pattern(term: str) -> str:
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def _next_prefix(digits: str) -> str:
+    """Smallest string sorting after every string starting with digits"""
+    return digits[:-1] + chr(ord(digits[-1]) + 1)
+
+
+def lead_search(term: str, first_param: int, alias: str = "c") -> Tuple[str, str, List[Any]]:
+    """
+    SQL condition and relevance expression for a search term.
+    Returns (condition, rank, params); params bind from $first_param on.
+    """
+    term = term.strip()
+    q, pattern = f"${first_param}", f"${first_param + 1}"
+    params: List[Any] = [term, _like_pattern(term)]
+
+    conditions = [
+        f"{alias}.name ILIKE {pattern}",
+        f"{alias}.company ILIKE {pattern}",
+        f"{q} <% {alias}.name",
+        f"{q} <% {alias}.company",
+    ]
+    ranks = [
+        f"word_similarity({q}, COALESCE({alias}.name, ''))",
+        f"word_similarity({q}, COALESCE({alias}.company, ''))",
+    ]
+
+    digits = phone_digits(term)
+    if len(digits) >= MIN_PHONE_DIGITS:
+        lo, hi = f"${first_param + 2}", f"${first_param + 3}"
+        phone_match = f"({alias}.phone_digits ~>=~ {lo} AND {alias}.phone_digits ~<~ {hi})"
+        conditions.append(phone_match)
+        ranks.append(f"CASE WHEN {phone_match} THEN 1::real ELSE 0::real END")
+        params += [digits, _next_prefix(digits)]
+
+    return f"({' OR '.join(conditions)})", f"GREATEST({', '.join(ranks)})", params
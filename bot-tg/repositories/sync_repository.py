@@ -0,0 +1,124 @@
+"""
+Incremental Google Sheets sync state (migrations/0010).
+
+Each stream walks its table in (watermark column, id) order: a run reads rows
+after the stored watermark, skips rows whose content hash is unchanged and
+moves the watermark forward once the batch is delivered. Runs are leased per
+stream (locked_until), so several processes never sync the same stream at once.
+"""
+from .base import BaseRepository
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# stream -> (SELECT ... FROM ..., watermark expression, id expression, their row keys)
+SYNC_STREAMS = {
+    "leads": (
+        # Placeholder contacts are not leads
+        "SELECT c.* FROM (SELECT * FROM user_contacts WHERE NOT is_placeholder) c",
+        "c.updated_at", "c.user_id", "updated_at", "user_id"
+    ),
+    "tests": (
+        """SELECT t.*, c.name, c.role, c.company, c.team_size, c.phone, c.telegram_username
+           FROM test_results t
+           LEFT JOIN user_contacts c ON t.user_id = c.user_id""",
+        "t.created_at", "t.id", "created_at", "id"
+    ),
+    "unified": (
+        """SELECT ts.*,
+                  c.name as lead_name, c.phone as lead_phone, c.role as lead_role,
+                  c.company as lead_company, c.team_size as lead_team_size,
+                  c.preferred_channel as lead_preferred_channel,
+                  c.utm_source, c.utm_medium, c.utm_campaign
+           FROM test_sessions ts
+           LEFT JOIN user_contacts c ON ts.user_id = c.user_id""",
+        "ts.created_at", "ts.id", "created_at", "id"
+    ),
+}
+
+
+class SyncRepository(BaseRepository):
+
+    async def claim(self, stream: str, lease_seconds: float) -> Optional[dict]:
+        """Lease the stream for one run; None while another run holds it"""
+        await self.execute(
+            "INSERT INTO sync_state (stream) VALUES ($1) ON CONFLICT (stream) DO NOTHING", stream
+        )
+        row = await self.fetch_one("""
+            UPDATE sync_state
+            SET locked_until = CURRENT_TIMESTAMP + $2::float8 * interval '1 second'
+            WHERE stream = $1 AND (locked_until IS NULL OR locked_until < CURRENT_TIMESTAMP)
+            RETURNING stream, watermark_at, watermark_id
+        """, stream, float(lease_seconds))
+        return dict(row) if row else None
+
+    async def release(self, stream: str, sent: int, skipped: int, error: str = None) -> None:
+        await self.execute("""
+            UPDATE sync_state
+            SET locked_until = NULL, last_run_at = CURRENT_TIMESTAMP,
+                last_sent = $2, last_skipped = $3, last_error = $4
+            WHERE stream = $1
+        """, stream, sent, skipped, error)
+
+    async def advance(self, stream: str, watermark_at: datetime, watermark_id: int) -> None:
+        await self.execute(
+            "UPDATE sync_state SET watermark_at = $2, watermark_id = $3 WHERE stream = $1",
+            stream, watermark_at, watermark_id
+        )
+
+    async def fetch_changed(self, stream: str, after_at: Optional[datetime], after_id: Optional[int],
+                            lag_seconds: float, limit: int) -> List[dict]:
+        """
+        Rows past the watermark, oldest first. Rows younger than lag_seconds are left
+        for the next run: a transaction still in flight may commit an older timestamp.
+        """
+        select, at, key, _, _ = SYNC_STREAMS[stream]
+        rows = await self.fetch_all(f"""
+            {select}
+            WHERE ($1::timestamp IS NULL OR ({at}, {key}) > ($1::timestamp, $2::bigint))
+              AND {at} <= CURRENT_TIMESTAMP - $3::float8 * interval '1 second'
+            ORDER BY {at}, {key}
+            LIMIT $4
+        """, after_at, after_id, float(lag_seconds), limit)
+        return [dict(row) for row in rows]
+
+    async def get_hashes(self, stream: str, keys: List[int]) -> Dict[int, str]:
+        rows = await self.fetch_all(
+            "SELECT row_key, row_hash FROM sync_row_hashes WHERE stream = $1 AND row_key = ANY($2::bigint[])",
+            stream, keys
+        )
+        return {row['row_key']: row['row_hash'] for row in rows}
+
+    async def save_hashes(self, stream: str, hashes: Dict[int, str]) -> None:
+        if not hashes:
+            return
+        await self.execute("""
+            INSERT INTO sync_row_hashes (stream, row_key, row_hash)
+            SELECT $1, k, h FROM unnest($2::bigint[], $3::text[]) AS u(k, h)
+            ON CONFLICT (stream, row_key) DO UPDATE
+            SET row_hash = EXCLUDED.row_hash, synced_at = CURRENT_TIMESTAMP
+        """, stream, list(hashes.keys()), list(hashes.values()))
+
+    async def baseline(self, stream: str) -> None:
+        """Treat everything up to now as already in the sheet (only later changes are sent)"""
+        select, at, key, at_col, key_col = SYNC_STREAMS[stream]
+        last = await self.fetch_one(f"{select} ORDER BY {at} DESC NULLS LAST, {key} DESC LIMIT 1")
+        if not last:
+            return
+        await self.execute("""
+            INSERT INTO sync_state (stream, watermark_at, watermark_id) VALUES ($1, $2, $3)
+            ON CONFLICT (stream) DO UPDATE
+            SET watermark_at = EXCLUDED.watermark_at, watermark_id = EXCLUDED.watermark_id
+        """, stream, last[at_col], last[key_col])
+
+    async def reset(self, stream: str) -> None:
+        """Forget the watermark and hashes: the next run sends the whole stream again"""
+        await self.execute("UPDATE sync_state SET watermark_at = NULL, watermark_id = NULL WHERE stream = $1", stream)
+        await self.execute("DELETE FROM sync_row_hashes WHERE stream = $1", stream)
+
+    async def get_states(self) -> List[dict]:
+        rows = await self.fetch_all("""
+            SELECT s.*, (SELECT COUNT(*) FROM sync_row_hashes h WHERE h.stream = s.stream) AS rows_synced
+            FROM sync_state s
+            ORDER BY s.stream
+        """)
+        return [dict(row) for row in rows]
@@ -1,50 +1,71 @@
 from .base import BaseRepository
+from .rollups import rollup_delta, rollup_upsert
+from .pagination import decode_cursor, keyset_condition, keyset_order, make_page
+from .outbox_repository import sheets_outbox_cte
+from .search import lead_search
 from models.test_result import TestResult, FormulaResult
+from models.user import UserContact
 from typing import Optional, List, Dict
 from datetime import datetime, timedelta
-import json
 import logging
 
 logger = logging.getLogger(__name__)
 
-class TestRepository(BaseRepository):
-    
-    async def ensure_schema(self) -> None:
-        """Ensure test_sessions table exists and has legacy columns"""
-        try:
-            await self.execute("""
-                CREATE TABLE IF NOT EXISTS test_sessions (
-                    id SERIAL PRIMARY KEY,
-                    user_id BIGINT,
-                    product TEXT,
-                    channel TEXT,
-                    source TEXT,
-                    status TEXT,
-                    answers_json TEXT,
-                    result_json TEXT,
-                    meta_json TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    legacy_source TEXT,
-                    legacy_id BIGINT
-                );
-            """)
-            
-            # Add columns if missing (migrations styled)
-            try:
-                await self.execute("ALTER TABLE test_sessions ADD COLUMN IF NOT EXISTS legacy_source TEXT")
-                await self.execute("ALTER TABLE test_sessions ADD COLUMN IF NOT EXISTS legacy_id BIGINT")
-            except Exception as e:
-                pass
+# Rollup deltas for writers below, fed from a "saved" CTE
+SESSION_ROLLUP = rollup_upsert(rollup_delta(
+    "FROM saved LEFT JOIN user_contacts c ON c.user_id = saved.user_id",
+    "saved.created_at::date", "saved.product", "saved.source", "c.utm_source",
+    "saved.meta_json->>'type'",
+    sessions="1"
+))
+
+
+def submit_rollup(legacy_metric: str) -> str:
+    """
+    Rollup for the submit path: new guest lead, legacy row and session in one upsert.
+    Placeholder contacts are not leads; a placeholder overwritten with a real
+    name/role becomes one now.
+    """
+    return rollup_upsert(
+        rollup_delta(
+            "FROM upserted WHERE NOT (contact_row).is_placeholder "
+            "AND (inserted OR EXISTS (SELECT 1 FROM previous WHERE is_placeholder))",
+            "(contact_row).created_at::date", "(contact_row).product", "(contact_row).source",
+            "(contact_row).utm_source",
+            leads="1", leads_new="((contact_row).status IS NOT DISTINCT FROM 'new')::int",
+            leads_done="((contact_row).status IS NOT DISTINCT FROM 'done')::int"
+        ),
+        rollup_delta(
+            "FROM legacy LEFT JOIN contact c ON TRUE",
+            "legacy.created_at::date", "legacy.product", "c.source", "c.utm_source", "legacy.result_type",
+            **{legacy_metric: "1"}
+        ),
+        rollup_delta(
+            "FROM session LEFT JOIN contact c ON TRUE",
+            "session.created_at::date", "session.product", "session.source", "c.utm_source",
+            "session.meta_json->>'type'",
+            sessions="1"
+        ),
+    )
 
-            # Unique index for idempotency
-            await self.execute("""
-                CREATE UNIQUE INDEX IF NOT EXISTS idx_test_sessions_legacy 
-                ON test_sessions (legacy_source, legacy_id);
-            """)
 
-        except Exception as e:
-            logger.warning(f"Test schema update warning: {e}")
+def submit_outbox() -> str:
+    """Sheets test row for the submit path (legacy row + contact), if Sheets export is enabled"""
+    return sheets_outbox_cte(
+        "test",
+        """jsonb_build_object(
+            'test', jsonb_build_object(
+                'user_id', $1::bigint, 'test_id', legacy.id, 'result_type', legacy.sheets_result_type,
+                'scores', legacy.scores, 'product', legacy.product
+            ),
+            'lead', CASE WHEN c.is_placeholder THEN NULL ELSE to_jsonb(c) END
+        )""",
+        "FROM legacy LEFT JOIN contact c ON TRUE"
+    )
 
+
+class TestRepository(BaseRepository):
+    
     async def backfill_unified_sessions(self) -> dict:
         """Import legacy data into unified table"""
         stats = {"teremok": 0, "formula": 0}
@@ -62,23 +83,27 @@ class TestRepository(BaseRepository):
                 # Prepare data
                 res_obj = {
                     "type": row['result_type'],
-                    "scores": json.loads(row['scores']) if isinstance(row['scores'], str) else row['scores']
+                    "scores": row['scores']
                 }
                 
                 # Insert
-                await self.execute("""
+                await self.execute(f"""
+                   WITH saved AS (
                    INSERT INTO test_sessions 
                    (user_id, product, source, channel, status, answers_json, result_json, meta_json, created_at, legacy_source, legacy_id)
                    VALUES ($1, $2, $3, $4, 'finished', $5, $6, $7, $8, 'teremok_test_results', $9)
                    ON CONFLICT (legacy_source, legacy_id) DO NOTHING
+                   RETURNING id, user_id, created_at, product, source, meta_json
+                   )
+                   {SESSION_ROLLUP}
                 """, 
                 row['user_id'], 
                 'teremok',
                 row['source'] or 'unknown',
                 row['preferred_channel'] or 'unknown',
-                row['answers'] if isinstance(row['answers'], str) else json.dumps(row['answers']),
-                json.dumps(res_obj),
-                json.dumps({"type": row['result_type']}),
+                row['answers'],
+                res_obj,
+                {"type": row['result_type']},
                 row['created_at'],
                 row['id']
                 )
@@ -103,22 +128,26 @@ class TestRepository(BaseRepository):
                 res_obj = {
                     "type": row['primary_type_code'],
                     "primary_name": row['primary_type_name'],
-                    "scores": json.loads(row['scores']) if isinstance(row['scores'], str) else row['scores']
+                    "scores": row['scores']
                 }
 
-                await self.execute("""
+                await self.execute(f"""
+                   WITH saved AS (
                    INSERT INTO test_sessions 
                    (user_id, product, source, channel, status, answers_json, result_json, meta_json, created_at, legacy_source, legacy_id)
                    VALUES ($1, $2, $3, $4, 'finished', $5, $6, $7, $8, 'formula_rsp_results', $9)
                    ON CONFLICT (legacy_source, legacy_id) DO NOTHING
+                   RETURNING id, user_id, created_at, product, source, meta_json
+                   )
+                   {SESSION_ROLLUP}
                 """,
                 row['user_id'],
                 'formula',
                 row['source'] or 'unknown',
                 row['preferred_channel'] or 'unknown',
-                row['answers'] if isinstance(row['answers'], str) else json.dumps(row['answers']),
-                json.dumps(res_obj),
-                json.dumps({"type": row['primary_type_name']}),
+                row['answers'],
+                res_obj,
+                {"type": row['primary_type_name']},
                 row['created_at'],
                 row['id']
                 )
@@ -128,29 +157,12 @@ class TestRepository(BaseRepository):
 
         return stats
 
-    async def save_test_session(self, 
-                                user_id: int, 
-                                product: str, 
-                                source: str, 
-                                answers: dict, 
-                                result: dict, 
-                                channel: str = None, 
-                                meta: dict = None) -> int:
-        """Save to unified test_sessions table"""
-        answers_json = json.dumps(answers) if isinstance(answers, (dict, list)) else str(answers)
-        result_json = json.dumps(result) if isinstance(result, (dict, list)) else str(result)
-        meta_json = json.dumps(meta) if meta else None
-        
-        val = await self.fetch_val(
-            """INSERT INTO test_sessions 
-               (user_id, product, source, channel, status, answers_json, result_json, meta_json)
-               VALUES ($1, $2, $3, $4, 'finished', $5, $6, $7) RETURNING id""",
-            user_id, product, source, channel, answers_json, result_json, meta_json
-        )
-        return val
+    # Unified listing is always newest first; keyset on (created_at, id)
+    UNIFIED_KEYS = (("ts.created_at", "created_at", None), ("ts.id", "id", 0))
 
-    async def get_unified_tests(self, limit: int = 200, product: str = None, days: int = None) -> list:
-        """Get tests with lead info from unified table"""
+    def _unified_query(self, product: str = None, days: int = None, cursor: str = None,
+                       search: str = None):
+        """Unified listing SQL (without LIMIT) and its params, shared by pages and exports"""
         query = """
             SELECT ts.*, 
                    c.name as lead_name, c.phone as lead_phone, c.role as lead_role,
@@ -171,45 +183,211 @@ class TestRepository(BaseRepository):
             date_from = datetime.now() - timedelta(days=days)
             conditions.append(f"ts.created_at >= ${len(params) + 1}")
             params.append(date_from)
+
+        if search and search.strip():
+            condition, _, search_params = lead_search(search, len(params) + 1)
+            conditions.append(condition)
+            params.extend(search_params)
+
+        exprs = [expr for expr, _, _ in self.UNIFIED_KEYS]
+        after = decode_cursor(cursor, "created_at", "DESC",
+                              [(key, default) for _, key, default in self.UNIFIED_KEYS])
+        if after:
+            conditions.append(keyset_condition(exprs, "DESC", len(params) + 1))
+            params.extend(after)
             
         if conditions:
             query += " WHERE " + " AND ".join(conditions)
             
-        query += f" ORDER BY ts.created_at DESC LIMIT ${len(params) + 1}"
-        params.append(limit)
-        
-        rows = await self.fetch_all(query, *params)
+        query += f" ORDER BY {keyset_order(exprs, 'DESC')}"
+        return query, params
+
+    async def get_unified_tests(self, limit: int = 200, product: str = None, days: int = None,
+                                cursor: str = None) -> list:
+        """Get tests with lead info from unified table (keyset-paginated by cursor)"""
+        query, params = self._unified_query(product, days, cursor)
+        rows = await self.fetch_all(f"{query} LIMIT ${len(params) + 1}", *params, limit)
         return [dict(row) for row in rows]
 
-    async def save_test_result(self, result: TestResult) -> int:
-        scores_json = json.dumps(result.scores) if isinstance(result.scores, dict) else result.scores
-        answers_json = json.dumps(result.answers) if isinstance(result.answers, dict) else result.answers
-        
-        # Postgres requires RETURNING id
-        val = await self.fetch_val(
+    def stream_unified_tests(self, product: str = None, days: int = None, search: str = None):
+        """All matching unified sessions from a server-side cursor (exports)"""
+        query, params = self._unified_query(product, days, search=search)
+        return self.stream(query, *params)
+
+    async def get_unified_tests_page(self, limit: int = 200, product: str = None, days: int = None,
+                                     cursor: str = None) -> dict:
+        """One page of unified tests: {"items": [...], "next_cursor": str | None}"""
+        rows = await self.get_unified_tests(limit + 1, product, days, cursor)
+        return make_page(rows, limit, "created_at", "DESC",
+                         [(key, default) for _, key, default in self.UNIFIED_KEYS])
+
+    async def count_sessions_by_type(self, product: str = None, days: int = None,
+                                     result_match: dict = None) -> Dict[str, int]:
+        """
+        Session counts per result type (result_json->>'type', falling back to meta_json).
+        result_match narrows to sessions whose result_json contains it (GIN-indexed @>).
+        """
+        conditions = []
+        params = []
+
+        if product and product != 'all':
+            conditions.append(f"product = ${len(params) + 1}")
+            params.append(product)
+
+        if days:
+            conditions.append(f"created_at >= ${len(params) + 1}")
+            params.append(datetime.now() - timedelta(days=days))
+
+        if result_match:
+            conditions.append(f"result_json @> ${len(params) + 1}::jsonb")
+            params.append(result_match)
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = await self.fetch_all(f"""
+            SELECT COALESCE(result_json->>'type', meta_json->>'type', 'unknown') AS result_type,
+                   COUNT(*) AS count
+            FROM test_sessions
+            {where}
+            GROUP BY 1
+            ORDER BY 2 DESC
+        """, *params)
+        return {row['result_type']: row['count'] for row in rows}
+
+    # Single round-trip submit path.
+    # $1 user_id, $2 guest name, $3 guest role, $4 contact product, $5 overwrite name/role,
+    # $6 session product, $7 answers_json, $8 result_json, $9 meta_json,
+    # $10 new contact is a placeholder, $11.. legacy row
+    SUBMIT_QUERY = """
+        WITH previous AS (
+            SELECT is_placeholder FROM user_contacts WHERE user_id = $1
+        ),
+        upserted AS (
+            INSERT INTO user_contacts
+            (user_id, name, role, company, team_size, phone, product, is_placeholder, updated_at)
+            VALUES ($1, $2, $3, '', '', '', $4, $10, CURRENT_TIMESTAMP)
+            ON CONFLICT (user_id) DO UPDATE SET
+                name = EXCLUDED.name,
+                role = EXCLUDED.role,
+                product = EXCLUDED.product,
+                is_placeholder = FALSE,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE $5::boolean
+            RETURNING user_contacts AS contact_row, (xmax = 0) AS inserted
+        ),
+        contact AS (
+            SELECT (contact_row).* FROM upserted
+            UNION ALL
+            SELECT * FROM user_contacts
+            WHERE user_id = $1 AND NOT EXISTS (SELECT 1 FROM upserted)
+        ),
+        legacy AS (
+            {legacy_insert}
+        ),
+        session AS (
+            INSERT INTO test_sessions
+            (user_id, product, source, channel, status, answers_json, result_json, meta_json)
+            SELECT $1, $6, COALESCE(c.source, 'unknown'), COALESCE(c.preferred_channel, 'unknown'),
+                   'finished', $7::jsonb, $8::jsonb, $9::jsonb
+            FROM (SELECT 1) AS one
+            LEFT JOIN contact c ON TRUE
+            RETURNING id, created_at, product, source, meta_json
+        ),
+        rollup AS (
+            {rollup}
+        ){outbox}
+        SELECT legacy.id AS submit_test_id, session.id AS submit_session_id, contact.*
+        FROM legacy
+        CROSS JOIN session
+        LEFT JOIN contact ON TRUE
+    """
+
+    async def _submit(self, legacy_insert: str, legacy_metric: str, legacy_params: list,
+                      user_id: int, product: str, contact_product: str,
+                      answers, result: dict, meta: dict,
+                      name: str = None, role: str = None, placeholder: bool = False) -> dict:
+        """
+        Upsert contact, write legacy + unified rows and return the contact in one statement.
+        placeholder: a contact created here only satisfies the test_results FK and
+        is not a lead (returned contact is None).
+        """
+        overwrite = bool(name and role)
+        row = await self.fetch_one(
+            self.SUBMIT_QUERY.format(
+                legacy_insert=legacy_insert, rollup=submit_rollup(legacy_metric), outbox=submit_outbox()
+            ),
+            user_id, name if overwrite else "Guest User", role if overwrite else "Guest",
+            contact_product, overwrite, product,
+            answers, result, meta or None, placeholder and not overwrite,
+            *legacy_params
+        )
+        data = dict(row)
+        test_id = data.pop("submit_test_id")
+        session_id = data.pop("submit_session_id")
+        is_placeholder = data.pop("is_placeholder", False)
+        contact = UserContact(**data) if data.get("user_id") is not None and not is_placeholder else None
+        return {"test_id": test_id, "session_id": session_id, "contact": contact}
+
+    async def submit_teremok_result(self, result: TestResult, session_result: dict, meta: dict = None) -> dict:
+        """Save Teremok submission (placeholder contact if none, test_results, test_sessions) in one round trip"""
+        return await self._submit(
             """INSERT INTO test_results (user_id, result_type, answers, scores, product)
-               VALUES ($1, $2, $3, $4, $5) RETURNING id""",
-            result.user_id, result.result_type, answers_json, scores_json, result.product
+               VALUES ($1, $11, $12, $13, $14)
+               RETURNING id, created_at, product, result_type, scores, result_type AS sheets_result_type""",
+            "tests",
+            [result.result_type, result.answers, result.scores, result.product],
+            user_id=result.user_id,
+            product='teremok',
+            contact_product=result.product,
+            answers=result.answers,
+            result=session_result,
+            meta=meta,
+            placeholder=True
         )
-        return val
 
-    async def save_formula_result(self, result: FormulaResult) -> int:
-        scores_json = json.dumps(result.scores) if isinstance(result.scores, dict) else result.scores
-        answers_json = json.dumps(result.answers) if isinstance(result.answers, (dict, list)) else result.answers
-        
-        val = await self.fetch_val(
-            """INSERT INTO formula_rsp_results 
+    async def submit_formula_result(self, result: FormulaResult, session_result: dict, meta: dict = None,
+                                    name: str = None, role: str = None) -> dict:
+        """Save Formula RSP submission (contact, formula_rsp_results, test_sessions) in one round trip"""
+        return await self._submit(
+            """INSERT INTO formula_rsp_results
                (user_id, primary_type_code, primary_type_name, scores, answers)
-               VALUES ($1, $2, $3, $4, $5) RETURNING id""",
-            result.user_id, result.primary_type_code, result.primary_type_name, scores_json, answers_json
+               VALUES ($1, $11, $12, $13, $14)
+               RETURNING id, created_at, 'formula_rsp' AS product, primary_type_code AS result_type,
+                         scores, primary_type_name AS sheets_result_type""",
+            "formula_tests",
+            [result.primary_type_code, result.primary_type_name, result.scores, result.answers],
+            user_id=result.user_id,
+            product='formula',
+            contact_product='formula_rsp',
+            answers=result.answers,
+            result=session_result,
+            meta=meta,
+            name=name,
+            role=role
         )
-        return val
 
-    async def get_all_tests_full(self, limit: int = 100, product: str = None,
-                                  result_type: str = None, days: int = None,
-                                  sort_by: str = "created_at", sort_order: str = "desc") -> list:
-        """Get test results with contact info and sorting"""
-        
+    # Sorting whitelist: sort key -> (SQL expression, row key, value for NULL).
+    # Test columns match the composite indexes in migrations/0005; contact
+    # columns come from the join and are sorted without index support.
+    TESTS_SORT_COLUMNS = {
+        "created_at": ("t.created_at", "created_at", None),
+        "result_type": ("t.result_type", "result_type", ""),
+        "product": ("COALESCE(t.product, '')", "product", ""),
+        "name": ("COALESCE(c.name, '')", "name", ""),
+        "company": ("COALESCE(c.company, '')", "company", ""),
+        "role": ("COALESCE(c.role, '')", "role", ""),
+    }
+    TESTS_TIEBREAKERS = (("t.id", "id", 0),)
+
+    def _tests_sort(self, sort_by: str, sort_order: str):
+        sort_by = sort_by if sort_by in self.TESTS_SORT_COLUMNS else "created_at"
+        order = "ASC" if sort_order and sort_order.lower() == "asc" else "DESC"
+        keys = (self.TESTS_SORT_COLUMNS[sort_by],) + self.TESTS_TIEBREAKERS
+        return sort_by, order, keys
+
+    def _tests_query(self, product: str = None, result_type: str = None, days: int = None,
+                     sort_by: str = "created_at", sort_order: str = "desc",
+                     cursor: str = None, search: str = None):
+        """Test results listing SQL (without LIMIT) and its params, shared by pages and exports"""
         query = """
             SELECT t.*, 
                    c.name, c.role, c.company, c.team_size, c.phone, c.telegram_username
@@ -231,29 +409,50 @@ class TestRepository(BaseRepository):
             date_from = datetime.now() - timedelta(days=days)
             conditions.append(f"t.created_at >= ${len(params) + 1}")
             params.append(date_from)
+
+        if search and search.strip():
+            condition, _, search_params = lead_search(search, len(params) + 1)
+            conditions.append(condition)
+            params.extend(search_params)
+
+        sort_by, order, keys = self._tests_sort(sort_by, sort_order)
+        exprs = [expr for expr, _, _ in keys]
+
+        after = decode_cursor(cursor, sort_by, order, [(key, default) for _, key, default in keys])
+        if after:
+            conditions.append(keyset_condition(exprs, order, len(params) + 1))
+            params.extend(after)
         
         if conditions:
             query += " WHERE " + " AND ".join(conditions)
-            
-        # Sorting whitelist
-        sort_columns = {
-            "created_at": "t.created_at",
-            "result_type": "t.result_type",
-            "product": "t.product",
-            "name": "c.name",
-            "company": "c.company",
-            "role": "c.role"
-        }
-        
-        sort_col = sort_columns.get(sort_by, "t.created_at")
-        order = "ASC" if sort_order and sort_order.lower() == "asc" else "DESC"
         
-        query += f" ORDER BY {sort_col} {order} LIMIT ${len(params) + 1}"
-        params.append(limit)
-        
-        rows = await self.fetch_all(query, *params)
+        query += f" ORDER BY {keyset_order(exprs, order)}"
+        return query, params
+
+    async def get_all_tests_full(self, limit: int = 100, product: str = None,
+                                  result_type: str = None, days: int = None,
+                                  sort_by: str = "created_at", sort_order: str = "desc",
+                                  cursor: str = None) -> list:
+        """Get test results with contact info and sorting (keyset-paginated by cursor)"""
+        query, params = self._tests_query(product, result_type, days, sort_by, sort_order, cursor)
+        rows = await self.fetch_all(f"{query} LIMIT ${len(params) + 1}", *params, limit)
         return [dict(row) for row in rows]
 
+    def stream_tests(self, product: str = None, result_type: str = None, search: str = None,
+                     days: int = None, sort_by: str = "created_at", sort_order: str = "desc"):
+        """All matching test results from a server-side cursor (exports)"""
+        query, params = self._tests_query(product, result_type, days, sort_by, sort_order, search=search)
+        return self.stream(query, *params)
+
+    async def get_tests_page(self, limit: int = 100, product: str = None,
+                             result_type: str = None, days: int = None,
+                             sort_by: str = "created_at", sort_order: str = "desc",
+                             cursor: str = None) -> dict:
+        """One page of test results: {"items": [...], "next_cursor": str | None}"""
+        rows = await self.get_all_tests_full(limit + 1, product, result_type, days, sort_by, sort_order, cursor)
+        sort_by, order, keys = self._tests_sort(sort_by, sort_order)
+        return make_page(rows, limit, sort_by, order, [(key, default) for _, key, default in keys])
+
     async def get_recent_tests_full(self, limit: int = 10) -> list:
         """Get recent tests for dashboard"""
         return await self.get_all_tests_full(limit=limit)
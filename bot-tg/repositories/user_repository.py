@@ -1,4 +1,9 @@
 from .base import BaseRepository
+from .rollups import REBUILD_ROLLUPS, rollup_delta, rollup_upsert
+from .pagination import decode_cursor, keyset_condition, keyset_order, make_page
+from .search import lead_search
+from .outbox_repository import sheets_outbox_cte
+from infrastructure.db import db
 from models.user import User, UserContact, Admin, WebAdmin
 from typing import Optional, List
 import json
@@ -7,6 +12,24 @@ from datetime import datetime, timedelta
 
 logger = logging.getLogger(__name__)
 
+# New lead counters, fed from a "saved" CTE returning (xmax = 0) AS inserted;
+# a placeholder contact (see "previous") turns into a lead when it is saved
+LEAD_ROLLUP = rollup_upsert(rollup_delta(
+    "FROM saved WHERE inserted OR EXISTS (SELECT 1 FROM previous WHERE is_placeholder)",
+    "created_at::date", "product", "source", "utm_source",
+    leads="1",
+    leads_new="(status IS NOT DISTINCT FROM 'new')::int",
+    leads_done="(status IS NOT DISTINCT FROM 'done')::int"
+))
+
+# Status transition, fed from an "updated" CTE returning status and previous_status
+STATUS_ROLLUP = rollup_upsert(rollup_delta(
+    "FROM updated",
+    "created_at::date", "product", "source", "utm_source",
+    leads_new="(status IS NOT DISTINCT FROM 'new')::int - (previous_status IS NOT DISTINCT FROM 'new')::int",
+    leads_done="(status IS NOT DISTINCT FROM 'done')::int - (previous_status IS NOT DISTINCT FROM 'done')::int"
+))
+
 class UserRepository(BaseRepository):
     
     # Telegram Users
@@ -23,32 +46,15 @@ class UserRepository(BaseRepository):
             user_id, contact_info, message
         )
 
-    async def ensure_schema(self) -> None:
-        """Ensure database schema has all required columns for unified Lead"""
-        queries = [
-            "ALTER TABLE user_contacts ADD COLUMN IF NOT EXISTS email TEXT",
-            "ALTER TABLE user_contacts ADD COLUMN IF NOT EXISTS consent BOOLEAN DEFAULT FALSE",
-            "ALTER TABLE user_contacts ADD COLUMN IF NOT EXISTS preferred_channel TEXT",
-            "ALTER TABLE user_contacts ADD COLUMN IF NOT EXISTS source TEXT DEFAULT 'landing'",
-            "ALTER TABLE user_contacts ADD COLUMN IF NOT EXISTS session_id TEXT",
-            "ALTER TABLE user_contacts ADD COLUMN IF NOT EXISTS utm_source TEXT",
-            "ALTER TABLE user_contacts ADD COLUMN IF NOT EXISTS utm_medium TEXT",
-            "ALTER TABLE user_contacts ADD COLUMN IF NOT EXISTS utm_campaign TEXT",
-            "ALTER TABLE user_contacts ADD COLUMN IF NOT EXISTS utm_content TEXT",
-            "ALTER TABLE user_contacts ADD COLUMN IF NOT EXISTS utm_term TEXT",
-            "ALTER TABLE user_contacts ADD COLUMN IF NOT EXISTS comment TEXT"  # If separate from notes
-        ]
-        for q in queries:
-            try:
-                await self.execute(q)
-            except Exception as e:
-                logger.warning(f"Schema update warning: {e}")
-
     async def save_contact(self, contact: UserContact) -> None:
         # Map comment to notes if needed, or save both
         notes_val = contact.comment or contact.notes if hasattr(contact, 'notes') else contact.comment
         
-        await self.execute("""
+        await self.execute(f"""
+            WITH previous AS (
+                SELECT is_placeholder FROM user_contacts WHERE user_id = $1
+            ),
+            saved AS (
             INSERT INTO user_contacts 
             (user_id, name, role, company, team_size, phone, telegram_username, product, updated_at, status, 
              notes, email, consent, preferred_channel, source, session_id,
@@ -73,7 +79,11 @@ class UserRepository(BaseRepository):
                 utm_medium = excluded.utm_medium,
                 utm_campaign = excluded.utm_campaign,
                 utm_content = excluded.utm_content,
-                utm_term = excluded.utm_term
+                utm_term = excluded.utm_term,
+                is_placeholder = FALSE
+            RETURNING user_contacts AS contact_row, (xmax = 0) AS inserted, created_at, product, source, utm_source, status
+            ){sheets_outbox_cte("lead", "jsonb_build_object('lead', to_jsonb(contact_row))", "FROM saved")}
+            {LEAD_ROLLUP}
         """, 
             contact.user_id, contact.name, contact.role, contact.company, 
             contact.team_size, contact.phone, contact.telegram_username, 
@@ -90,29 +100,36 @@ class UserRepository(BaseRepository):
         return None
 
     async def has_contact(self, user_id: int) -> bool:
-        val = await self.fetch_val("SELECT 1 FROM user_contacts WHERE user_id = $1", user_id)
+        val = await self.fetch_val(
+            "SELECT 1 FROM user_contacts WHERE user_id = $1 AND NOT is_placeholder", user_id
+        )
         return val is not None
 
     async def update_status(self, user_id: int, status: str, notes: str = None) -> None:
-        if notes is not None:
-            await self.execute(
-                "UPDATE user_contacts SET status = $1, notes = $2, updated_at = CURRENT_TIMESTAMP WHERE user_id = $3",
-                status, notes, user_id
+        # Status counters in daily_rollups move with the transition
+        query = f"""
+            WITH previous AS (
+                SELECT user_id, status FROM user_contacts WHERE user_id = $1 FOR UPDATE
+            ),
+            updated AS (
+                UPDATE user_contacts c SET status = $2, {{notes}}updated_at = CURRENT_TIMESTAMP
+                FROM previous
+                WHERE c.user_id = previous.user_id
+                RETURNING c.created_at, c.product, c.source, c.utm_source, c.status,
+                          previous.status AS previous_status
             )
+            {STATUS_ROLLUP}
+        """
+        if notes is not None:
+            await self.execute(query.format(notes="notes = $3, "), user_id, status, notes)
         else:
-            await self.execute(
-                "UPDATE user_contacts SET status = $1, updated_at = CURRENT_TIMESTAMP WHERE user_id = $2",
-                status, user_id
-            )
+            await self.execute(query.format(notes=""), user_id, status)
 
     # Web Admins
     async def get_web_admin_by_username(self, username: str) -> Optional[WebAdmin]:
         row = await self.fetch_one("SELECT * FROM web_admins WHERE username = $1", username)
         return WebAdmin(**dict(row)) if row else None
 
-    async def get_web_admin_by_token(self, token: str) -> Optional[WebAdmin]:
-        row = await self.fetch_one("SELECT * FROM web_admins WHERE session_token = $1", token)
-        return WebAdmin(**dict(row)) if row else None
 
     async def create_web_admin(self, admin: WebAdmin) -> None:
         await self.execute(
@@ -120,12 +137,45 @@ class UserRepository(BaseRepository):
             admin.username, admin.password_hash, admin.salt
         )
 
-    async def set_session_token(self, username: str, token: str) -> None:
+    async def update_web_admin_password(self, username: str, password_hash: str, salt: str) -> None:
         await self.execute(
-            "UPDATE web_admins SET session_token = $1 WHERE username = $2",
-            token, username
+            "UPDATE web_admins SET password_hash = $2, salt = $3 WHERE username = $1",
+            username, password_hash, salt
         )
 
+    # Admin sessions (token hashes, migrations/0011)
+    async def create_admin_session(self, username: str, token_hash: str, ttl_seconds: float) -> bool:
+        """Store a session for username (False if there is no such admin); drops expired ones"""
+        return await self.fetch_val("""
+            WITH purged AS (
+                DELETE FROM admin_sessions WHERE expires_at < CURRENT_TIMESTAMP
+            )
+            INSERT INTO admin_sessions (token_hash, admin_id, expires_at)
+            SELECT $2, id, CURRENT_TIMESTAMP + $3::float8 * interval '1 second'
+            FROM web_admins WHERE username = $1
+            RETURNING TRUE
+        """, username, token_hash, float(ttl_seconds)) or False
+
+    async def get_admin_session(self, token_hash: str) -> Optional[dict]:
+        """Live session by token hash: username and seconds until it expires"""
+        row = await self.fetch_one("""
+            SELECT a.username, EXTRACT(EPOCH FROM s.expires_at - CURRENT_TIMESTAMP)::float8 AS expires_in
+            FROM admin_sessions s
+            JOIN web_admins a ON a.id = s.admin_id
+            WHERE s.token_hash = $1 AND s.expires_at > CURRENT_TIMESTAMP
+        """, token_hash)
+        return dict(row) if row else None
+
+    async def delete_admin_session(self, token_hash: str) -> None:
+        await self.execute("DELETE FROM admin_sessions WHERE token_hash = $1", token_hash)
+
+    async def delete_admin_sessions(self, username: str) -> None:
+        """End every session of an admin (password change)"""
+        await self.execute("""
+            DELETE FROM admin_sessions
+            WHERE admin_id = (SELECT id FROM web_admins WHERE username = $1)
+        """, username)
+
     # Telegram Admins
     async def add_telegram_admin(self, user_id: int, username: str, role: str = 'admin', added_by: int = 0) -> None:
         await self.execute(
@@ -170,128 +220,205 @@ class UserRepository(BaseRepository):
         val = await self.fetch_val("SELECT 1 FROM admins WHERE user_id = $1", user_id)
         return val is not None
 
-    # Statistics
-    async def get_statistics(self, days: int = None) -> dict:
-        stats = {}
-        
-        # Total counts
-        stats['total_leads'] = await self.fetch_val("SELECT COUNT(*) FROM user_contacts")
-        stats['total_tests'] = await self.fetch_val("SELECT COUNT(*) FROM test_results")
-        
-        # Counts by status
-        stats['new_leads'] = await self.fetch_val("SELECT COUNT(*) FROM user_contacts WHERE status = 'new'")
-        stats['completed_leads'] = await self.fetch_val("SELECT COUNT(*) FROM user_contacts WHERE status = 'done'")
-        
-        # Recent activity (7 days)
-        date_7d = datetime.now() - timedelta(days=7)
-        
-        stats['leads_7d'] = await self.fetch_val(
-            "SELECT COUNT(*) FROM user_contacts WHERE created_at >= $1", date_7d
-        )
-        
-        stats['tests_7d'] = await self.fetch_val(
-            "SELECT COUNT(*) FROM test_results WHERE created_at >= $1", date_7d
-        )
-        
-        # Today
-        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-        stats['leads_today'] = await self.fetch_val(
-            "SELECT COUNT(*) FROM user_contacts WHERE created_at >= $1", today
-        )
-        
-        stats['tests_today'] = await self.fetch_val(
-            "SELECT COUNT(*) FROM test_results WHERE created_at >= $1", today
+    # Statistics (read from daily_rollups: cost scales with days, not rows)
+    STATISTICS_QUERY = """
+        SELECT COALESCE(SUM(leads), 0) AS total_leads,
+               COALESCE(SUM(tests), 0) AS total_tests,
+               COALESCE(SUM(leads_new), 0) AS new_leads,
+               COALESCE(SUM(leads_done), 0) AS completed_leads,
+               COALESCE(SUM(leads) FILTER (WHERE day >= $1), 0) AS leads_7d,
+               COALESCE(SUM(tests) FILTER (WHERE day >= $1), 0) AS tests_7d,
+               COALESCE(SUM(leads) FILTER (WHERE day >= $2), 0) AS leads_today,
+               COALESCE(SUM(tests) FILTER (WHERE day >= $2), 0) AS tests_today
+        FROM daily_rollups
+    """
+
+    # Daily series joined onto a generated calendar
+    DAILY_STATISTICS_QUERY = """
+        WITH calendar AS (
+            SELECT generate_series($1::date, $2::date, interval '1 day')::date AS day
+        ),
+        totals AS (
+            SELECT day, SUM(leads) AS leads, SUM(tests) AS tests
+            FROM daily_rollups
+            WHERE day BETWEEN $1::date AND $2::date
+            GROUP BY day
         )
-        
-        return stats
+        SELECT calendar.day,
+               COALESCE(totals.leads, 0) AS leads,
+               COALESCE(totals.tests, 0) AS tests
+        FROM calendar
+        LEFT JOIN totals ON totals.day = calendar.day
+        ORDER BY calendar.day
+    """
+
+    async def get_statistics(self, days: int = None) -> dict:
+        today = datetime.now().date()
+        date_7d = today - timedelta(days=6)  # last 7 calendar days, today included
+
+        row = await self.fetch_one(self.STATISTICS_QUERY, date_7d, today)
+        return {
+            'total_leads': row['total_leads'],
+            'total_tests': row['total_tests'],
+            'new_leads': row['new_leads'],
+            'completed_leads': row['completed_leads'],
+            'leads_7d': row['leads_7d'],
+            'tests_7d': row['tests_7d'],
+            'leads_today': row['leads_today'],
+            'tests_today': row['tests_today'],
+        }
 
     async def get_daily_statistics(self, days: int = 7) -> dict:
-        """Get daily stats for charts"""
-        
+        """Get daily stats for charts (single query for any window)"""
         today = datetime.now().date()
-        dates = [(today - timedelta(days=i)).isoformat() for i in range(days-1, -1, -1)]
-        
-        # Prepare result structure
-        result = {
-            "labels": [d[5:] for d in dates], # MM-DD
-            "leads": [],
-            "tests": []
+        start = today - timedelta(days=days - 1)
+
+        rows = await self.fetch_all(self.DAILY_STATISTICS_QUERY, start, today)
+        return {
+            "labels": [row['day'].isoformat()[5:] for row in rows],  # MM-DD
+            "leads": [row['leads'] for row in rows],
+            "tests": [row['tests'] for row in rows]
         }
-        
-        for date_str in dates:
-            # We need datetime objects for asyncpg if column is timestamp
-            # But here we are comparing created_at (timestamp) with date strings?
-            # Postgres can cast string to timestamp.
-            # Ideally:
-            d_start = datetime.strptime(date_str, "%Y-%m-%d")
-            d_end = d_start + timedelta(days=1)
-            
-            leads_count = await self.fetch_val(
-                "SELECT COUNT(*) FROM user_contacts WHERE created_at >= $1 AND created_at < $2",
-                d_start, d_end
-            )
-            
-            tests_count = await self.fetch_val(
-                "SELECT COUNT(*) FROM test_results WHERE created_at >= $1 AND created_at < $2",
-                d_start, d_end
-            )
-            
-            result["leads"].append(leads_count)
-            result["tests"].append(tests_count)
-            
-        return result
 
-    async def get_all_leads_full(self, limit: int = 100, status: str = None,
-                                  search: str = None, days: int = None,
-                                  sort_by: str = "created_at", sort_order: str = "desc") -> list:
-        """Get leads with full info, filters, search and sorting"""
-        
-        query = """
-            SELECT c.*, 
-                   t.result_type, t.scores as test_scores, t.created_at as test_date,
-                   t.id as test_id
-            FROM user_contacts c 
-            LEFT JOIN test_results t ON c.user_id = t.user_id
+    async def has_daily_rollups(self) -> bool:
+        val = await self.fetch_val("SELECT 1 FROM daily_rollups LIMIT 1")
+        return val is not None
+
+    async def rebuild_daily_rollups(self) -> int:
+        """Recompute daily_rollups from the source tables, returns number of rollup rows"""
+        async with db.transaction():
+            # Writers block on the rollup upsert until the rebuild commits,
+            # so nothing is counted twice or lost
+            await self.execute("LOCK TABLE daily_rollups IN EXCLUSIVE MODE")
+            await self.execute("DELETE FROM daily_rollups")
+            await self.execute(REBUILD_ROLLUPS)
+            return await self.fetch_val("SELECT COUNT(*) FROM daily_rollups")
+
+    # Sorting whitelist: sort key -> (SQL expression, row key, value for NULL).
+    # Text columns are COALESCEd so keyset comparisons never meet NULLs;
+    # the expressions match the composite indexes (migrations/0005_keyset_indexes.sql).
+    LEADS_SORT_COLUMNS = {
+        "created_at": ("c.created_at", "created_at", None),
+        "updated_at": ("c.updated_at", "updated_at", None),
+        "status": ("COALESCE(c.status, '')", "status", ""),
+        "name": ("COALESCE(c.name, '')", "name", ""),
+        "company": ("COALESCE(c.company, '')", "company", ""),
+        "role": ("COALESCE(c.role, '')", "role", ""),
+        "product": ("COALESCE(c.product, '')", "product", ""),
+        "team_size": ("COALESCE(c.team_size, '')", "team_size", ""),
+    }
+    LEADS_TIEBREAKERS = (("c.user_id", "user_id", 0),)
+
+    def _leads_sort(self, sort_by: str, sort_order: str, rank: str = None):
+        """
+        Resolve sort key, direction and keyset columns.
+        "relevance" (the default while searching) needs the search rank expression.
         """
-        conditions = []
+        if rank and sort_by in (None, "", "relevance"):
+            sort_by, key = "relevance", (rank, "relevance", 0.0)
+        else:
+            sort_by = sort_by if sort_by in self.LEADS_SORT_COLUMNS else "created_at"
+            key = self.LEADS_SORT_COLUMNS[sort_by]
+        order = "ASC" if sort_order and sort_order.lower() == "asc" else "DESC"
+        return sort_by, order, (key,) + self.LEADS_TIEBREAKERS
+
+    def _leads_query(self, status: str = None, search: str = None, days: int = None,
+                     sort_by: str = "created_at", sort_order: str = "desc",
+                     cursor: str = None, product: str = None):
+        """Leads listing SQL (without LIMIT) and its params, shared by pages and exports"""
+        # Placeholder contacts (Teremok submits without contacts) are not leads
+        conditions = ["NOT c.is_placeholder"]
         params = []
         
         if status and status != 'all':
             conditions.append(f"c.status = ${len(params) + 1}")
             params.append(status)
         
+        if product and product != 'all':
+            conditions.append(f"c.product = ${len(params) + 1}")
+            params.append(product)
+        
         if days:
             date_from = datetime.now() - timedelta(days=days)
             conditions.append(f"c.created_at >= ${len(params) + 1}")
             params.append(date_from)
         
-        if search:
-            conditions.append(f"(c.name ILIKE ${len(params) + 1} OR c.company ILIKE ${len(params) + 2} OR c.phone ILIKE ${len(params) + 3})")
-            search_term = f"%{search}%"
-            params.extend([search_term, search_term, search_term])
+        rank = None
+        if search and search.strip():
+            condition, rank, search_params = lead_search(search, len(params) + 1)
+            conditions.append(condition)
+            params.extend(search_params)
         
-        if conditions:
-            query += " WHERE " + " AND ".join(conditions)
-        
-        # Sorting whitelist
-        sort_columns = {
-            "created_at": "c.created_at",
-            "updated_at": "c.updated_at",
-            "status": "c.status",
-            "name": "c.name",
-            "company": "c.company",
-            "role": "c.role",
-            "product": "c.product",
-            "team_size": "c.team_size"
-        }
+        # One row per lead: latest test and test count from a single index scan
+        # on test_results (user_id, created_at DESC)
+        query = f"""
+            SELECT c.*, 
+                   t.result_type, t.scores as test_scores, t.created_at as test_date,
+                   t.id as test_id, COALESCE(t.tests_count, 0) AS tests_count{f", {rank} AS relevance" if rank else ""}
+            FROM user_contacts c 
+            LEFT JOIN LATERAL (
+                SELECT id, result_type, scores, created_at, COUNT(*) OVER () AS tests_count
+                FROM test_results
+                WHERE user_id = c.user_id
+                ORDER BY created_at DESC, id DESC
+                LIMIT 1
+            ) t ON TRUE
+        """
         
-        sort_col = sort_columns.get(sort_by, "c.created_at")
-        order = "ASC" if sort_order and sort_order.lower() == "asc" else "DESC"
+        sort_by, order, keys = self._leads_sort(sort_by, sort_order, rank)
+        exprs = [expr for expr, _, _ in keys]
+
+        after = decode_cursor(cursor, sort_by, order, [(key, default) for _, key, default in keys])
+        if after:
+            conditions.append(keyset_condition(exprs, order, len(params) + 1))
+            params.extend(after)
         
-        query += f" ORDER BY {sort_col} {order} LIMIT ${len(params) + 1}"
-        params.append(limit)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
         
-        rows = await self.fetch_all(query, *params)
+        query += f" ORDER BY {keyset_order(exprs, order)}"
+        return query, params
+
+    async def get_all_leads_full(self, limit: int = 100, status: str = None,
+                                  search: str = None, days: int = None,
+                                  sort_by: str = "created_at", sort_order: str = "desc",
+                                  cursor: str = None) -> list:
+        """
+        Get leads with full info, filters, search and sorting (keyset-paginated by cursor).
+        With search, rows carry a 'relevance' rank; sort_by None/"relevance" orders by it.
+        """
+        query, params = self._leads_query(status, search, days, sort_by, sort_order, cursor)
+        rows = await self.fetch_all(f"{query} LIMIT ${len(params) + 1}", *params, limit)
+        return [dict(row) for row in rows]
+
+    def stream_leads(self, status: str = None, product: str = None, search: str = None,
+                     days: int = None, sort_by: str = "created_at", sort_order: str = "desc"):
+        """All matching leads, row by row from a server-side cursor (exports)"""
+        query, params = self._leads_query(status, search, days, sort_by, sort_order, product=product)
+        return self.stream(query, *params)
+
+    async def get_leads_page(self, limit: int = 100, status: str = None,
+                             search: str = None, days: int = None,
+                             sort_by: str = "created_at", sort_order: str = "desc",
+                             cursor: str = None) -> dict:
+        """One page of leads: {"items": [...], "next_cursor": str | None}"""
+        rows = await self.get_all_leads_full(limit + 1, status, search, days, sort_by, sort_order, cursor)
+        # Only row keys are needed to build the cursor, not the rank SQL itself
+        searching = bool(search and search.strip())
+        sort_by, order, keys = self._leads_sort(sort_by, sort_order, "relevance" if searching else None)
+        return make_page(rows, limit, sort_by, order, [(key, default) for _, key, default in keys])
+
+    async def search_leads(self, term: str, limit: int = 10) -> list:
+        """Typeahead: best matching contacts by relevance"""
+        condition, rank, params = lead_search(term, 1)
+        rows = await self.fetch_all(f"""
+            SELECT c.user_id, c.name, c.company, c.phone, c.product, c.status, c.created_at,
+                   {rank} AS relevance
+            FROM user_contacts c
+            WHERE {condition} AND NOT c.is_placeholder
+            ORDER BY relevance DESC, c.created_at DESC
+            LIMIT ${len(params) + 1}
+        """, *params, limit)
         return [dict(row) for row in rows]
 
     async def get_recent_leads_full(self, limit: int = 10) -> list:
@@ -1,37 +1,121 @@
 import secrets
 import hashlib
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+from core.config import settings
 from repositories.user_repository import UserRepository
 from models.user import WebAdmin
 
+
+def hash_token(token: str) -> str:
+    """Sessions are stored and cached by SHA-256 of the cookie token, never the token itself"""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class SessionCache:
+    """
+    In-process LRU of validated sessions: token hash -> (username, cached until).
+    An entry lives at most ADMIN_SESSION_CACHE_TTL and never past the session
+    expiry. Logout and password change drop entries in this process; other
+    processes notice within the cache TTL.
+    """
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token_hash: str) -> Optional[str]:
+        entry = self._entries.get(token_hash)
+        if entry is None or entry[1] <= time.monotonic():
+            self._entries.pop(token_hash, None)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(token_hash)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, token_hash: str, username: str, expires_in: float) -> None:
+        ttl = min(self.ttl, expires_in)
+        if ttl <= 0:
+            return
+        self._entries[token_hash] = (username, time.monotonic() + ttl)
+        self._entries.move_to_end(token_hash)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def drop(self, token_hash: str) -> None:
+        self._entries.pop(token_hash, None)
+
+    def drop_user(self, username: str) -> None:
+        for token_hash in [h for h, (user, _) in self._entries.items() if user == username]:
+            del self._entries[token_hash]
+
+    def metrics(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses, "ttl": self.ttl}
+
+
 class AuthService:
     def __init__(self, user_repo: UserRepository):
         self.user_repo = user_repo
+        self.sessions = SessionCache(settings.ADMIN_SESSION_CACHE_TTL, settings.ADMIN_SESSION_CACHE_SIZE)
+
+    @staticmethod
+    def _hash_password(password: str, salt: str) -> str:
+        return hashlib.sha256((password + salt).encode()).hexdigest()
 
     async def verify_password(self, username: str, password: str) -> bool:
         """Verify admin credentials"""
         admin = await self.user_repo.get_web_admin_by_username(username)
         if not admin:
             return False
-        
-        input_hash = hashlib.sha256((password + admin.salt).encode()).hexdigest()
-        return input_hash == admin.password_hash
+
+        input_hash = self._hash_password(password, admin.salt)
+        return secrets.compare_digest(input_hash, admin.password_hash)
 
     async def create_session(self, username: str) -> str:
         """Create new session and return token"""
         token = secrets.token_hex(32)
-        await self.user_repo.set_session_token(username, token)
+        await self.user_repo.create_admin_session(username, hash_token(token), settings.ADMIN_SESSION_TTL)
         return token
 
     async def get_user_from_token(self, token: str) -> str | None:
         """Get username from valid token"""
-        admin = await self.user_repo.get_web_admin_by_token(token)
-        return admin.username if admin else None
+        token_hash = hash_token(token)
+        username = self.sessions.get(token_hash)
+        if username:
+            return username
+
+        session = await self.user_repo.get_admin_session(token_hash)
+        if not session:
+            return None
+        self.sessions.put(token_hash, session['username'], session['expires_in'])
+        return session['username']
+
+    async def end_session(self, token: str) -> None:
+        """Logout: the token stops working immediately"""
+        token_hash = hash_token(token)
+        self.sessions.drop(token_hash)
+        await self.user_repo.delete_admin_session(token_hash)
+
+    async def change_password(self, username: str, current_password: str, new_password: str) -> bool:
+        """Set a new password and end every session of the admin"""
+        if not await self.verify_password(username, current_password):
+            return False
+
+        salt = secrets.token_hex(16)
+        await self.user_repo.update_web_admin_password(username, self._hash_password(new_password, salt), salt)
+        await self.user_repo.delete_admin_sessions(username)
+        self.sessions.drop_user(username)
+        return True
 
     async def register_admin(self, username: str, password: str) -> None:
         """Register new admin"""
         salt = secrets.token_hex(16)
-        password_hash = hashlib.sha256((password + salt).encode()).hexdigest()
-        
+        password_hash = self._hash_password(password, salt)
+
         admin = WebAdmin(
             username=username,
             password_hash=password_hash,
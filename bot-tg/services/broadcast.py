@@ -0,0 +1,212 @@
+"""
+Bot broadcasts: one message to a filtered audience, at the highest rate the
+outbound limits allow.
+
+A broadcast is created as a draft (bot /broadcast asks for confirmation) or
+started right away (admin web page). The runner leases a running broadcast,
+reads recipients in pages of BROADCAST_PAGE_SIZE after its cursor and sends
+each page with BROADCAST_CONCURRENCY parallel sends at BULK priority, so the
+shared Telegram limits keep manager alerts and user replies ahead of it. After
+every page the cursor and counters are saved: pause, cancel and restarts pick
+up from there (at most one page is sent twice after a crash).
+
+Users who blocked the bot, or whose chat no longer exists, are recorded in
+bot_blocked_users and skipped by later broadcasts.
+"""
+import asyncio
+import logging
+from typing import Callable, List, Optional
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from core.config import settings
+from infrastructure.db import db
+from core.telegram_sender import send_priority, BULK
+from repositories.broadcast_repository import (
+    BroadcastRepository, DRAFT, RUNNING, PAUSED, DONE, CANCELLED, FAILED
+)
+
+logger = logging.getLogger(__name__)
+
+# A runner that dies keeps its broadcast locked at most this long
+LEASE_SECONDS = 120
+
+SENT = "sent"
+BLOCKED = "blocked"
+ERROR = "error"
+
+
+class BroadcastAborted(Exception):
+    """The message itself is rejected by Telegram (e.g. broken HTML): stop the broadcast"""
+
+
+class BroadcastService:
+    def __init__(self, repo: BroadcastRepository, get_bot: Callable[[], Optional[Bot]]):
+        self.repo = repo
+        self.get_bot = get_bot
+        self._task: Optional[asyncio.Task] = None
+        self._wake = asyncio.Event()
+        self._stopping = False
+        self.current: Optional[int] = None
+        self.sent = 0
+        self.failed = 0
+        self.blocked = 0
+
+    def start(self) -> None:
+        if self._task is not None:
+            return
+        self._stopping = False
+        self._task = db.spawn(self._run())
+
+    def wake(self) -> None:
+        """A broadcast was started or resumed: look for work now instead of at the next poll"""
+        self._wake.set()
+
+    async def stop(self) -> None:
+        """Let the current page finish (bounded), keep progress, release the lease"""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wake.set()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout=settings.BROADCAST_SHUTDOWN_TIMEOUT)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                # The bot is set once polling starts (same process as the web app)
+                broadcast = await self.repo.claim(LEASE_SECONDS) if self.get_bot() else None
+                if broadcast:
+                    await self._deliver(broadcast)
+                    continue
+            except Exception as e:
+                logger.error(f"Broadcast runner error: {e}")
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=settings.BROADCAST_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _deliver(self, broadcast: dict) -> None:
+        bid = broadcast['id']
+        self.current = bid
+        bot = self.get_bot()
+        cursor = broadcast['cursor']
+        counts = {SENT: broadcast['sent'], ERROR: broadcast['failed'], BLOCKED: broadcast['blocked']}
+        semaphore = asyncio.Semaphore(settings.BROADCAST_CONCURRENCY)
+        logger.info(f"Broadcast {bid}: sending from user_id > {cursor} ({counts[SENT]} sent so far)")
+
+        async def record(page: List[int], results: List[Optional[str]]) -> None:
+            gone = [user_id for user_id, result in zip(page, results) if result == BLOCKED]
+            await self.repo.mark_blocked(gone, "broadcast")
+            for result in (SENT, ERROR, BLOCKED):
+                counts[result] += results.count(result)
+            self.sent += results.count(SENT)
+            self.failed += results.count(ERROR)
+            self.blocked += len(gone)
+
+        try:
+            while True:
+                page = await self.repo.recipients(broadcast['filters'], cursor, settings.BROADCAST_PAGE_SIZE)
+                if not page:
+                    await self.repo.finish(bid, DONE)
+                    logger.info(f"Broadcast {bid} done: {counts[SENT]} sent, "
+                                f"{counts[ERROR]} failed, {counts[BLOCKED]} blocked")
+                    return
+
+                try:
+                    results = await self._send_page(bot, page, broadcast['text'], semaphore)
+                except BroadcastAborted as e:
+                    # Sends finished before the abort are still counted
+                    await record(page, e.results)
+                    raise
+                await record(page, results)
+
+                cursor = page[-1]
+                status = await self.repo.checkpoint(
+                    bid, cursor, counts[SENT], counts[ERROR], counts[BLOCKED], LEASE_SECONDS
+                )
+                if status != RUNNING:
+                    logger.info(f"Broadcast {bid} {status} at user_id {cursor}")
+                    return
+                if self._stopping:
+                    await self.repo.release(bid)
+                    return
+        except BroadcastAborted as e:
+            await self.repo.checkpoint(bid, cursor, counts[SENT], counts[ERROR], counts[BLOCKED], LEASE_SECONDS)
+            await self.repo.finish(bid, FAILED, str(e))
+            logger.error(f"Broadcast {bid} aborted: {e}")
+        finally:
+            self.current = None
+
+    async def _send_page(self, bot: Bot, page: List[int], text: str,
+                         semaphore: asyncio.Semaphore) -> List[str]:
+        """
+        Send one page in parallel. On BroadcastAborted the pending sends are
+        cancelled at once; e.results has the outcome of the finished ones (None for the rest).
+        """
+        tasks = [asyncio.create_task(self._send(bot, user_id, text, semaphore)) for user_id in page]
+        try:
+            return await asyncio.gather(*tasks)
+        except BroadcastAborted as e:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            e.results = [
+                task.result() if not task.cancelled() and task.exception() is None else None
+                for task in tasks
+            ]
+            raise
+
+    async def _send(self, bot: Bot, user_id: int, text: str, semaphore: asyncio.Semaphore) -> str:
+        async with semaphore:
+            try:
+                with send_priority(BULK):
+                    await bot.send_message(user_id, text, parse_mode="HTML", disable_web_page_preview=True)
+                return SENT
+            except TelegramForbiddenError:
+                # Blocked the bot or deactivated
+                return BLOCKED
+            except TelegramBadRequest as e:
+                message = str(e).lower()
+                if "chat not found" in message:
+                    return BLOCKED
+                if "can't parse entities" in message or "message is too long" in message:
+                    raise BroadcastAborted(str(e))
+                logger.warning(f"Broadcast to {user_id} failed: {e}")
+                return ERROR
+            except Exception as e:
+                logger.warning(f"Broadcast to {user_id} failed: {e}")
+                return ERROR
+
+    # ===== Controls (bot command and admin page) =====
+
+    async def create(self, text: str, filters: dict, created_by: str, start: bool = False) -> dict:
+        broadcast = await self.repo.create(text, filters, created_by, RUNNING if start else DRAFT)
+        if start:
+            self.wake()
+        return broadcast
+
+    async def launch(self, broadcast_id: int) -> Optional[dict]:
+        """Draft or paused -> running"""
+        broadcast = await self.repo.set_status(broadcast_id, RUNNING, (DRAFT, PAUSED))
+        if broadcast:
+            self.wake()
+        return broadcast
+
+    async def pause(self, broadcast_id: int) -> Optional[dict]:
+        return await self.repo.set_status(broadcast_id, PAUSED, (RUNNING,))
+
+    async def cancel(self, broadcast_id: int) -> Optional[dict]:
+        return await self.repo.set_status(broadcast_id, CANCELLED, (DRAFT, RUNNING, PAUSED))
+
+    def metrics(self) -> dict:
+        return {
+            "current": self.current,
+            "sent": self.sent,
+            "failed": self.failed,
+            "blocked": self.blocked,
+        }
@@ -0,0 +1,156 @@
+"""
+Full Google Sheets exports as background jobs.
+
+An admin request only starts the job and gets its id back; the rows are read in
+keyset pages of PAGE_SIZE (the whole dataset, no cap) and each page is sent in
+batches of SHEETS_EXPORT_BATCH_SIZE, at most SHEETS_EXPORT_CONCURRENCY webhook
+calls at a time. The total grows as pages are read; it is final once "loading"
+turns false. A failed batch is retried SHEETS_EXPORT_RETRIES times
+with a doubling delay before it counts as failed. Progress is polled through
+GET /app/admin/api/export/jobs/{job_id}.
+
+Jobs live in process memory: only the last KEEP_FINISHED finished jobs are
+kept, and one export per kind runs at a time.
+"""
+import asyncio
+import logging
+import secrets
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+from core.config import settings
+from infrastructure.db import db
+from core.google_sheets import send_to_sheets
+
+logger = logging.getLogger(__name__)
+
+KEEP_FINISHED = 20
+
+# Rows read per keyset page
+PAGE_SIZE = 1000
+
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class ExportJob:
+    def __init__(self, kind: str):
+        self.id = secrets.token_hex(8)
+        self.kind = kind
+        self.status = RUNNING
+        self.total = 0
+        self.loading = True
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.error: Optional[str] = None
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+
+    def report(self) -> dict:
+        end = self.finished_at or time.time()
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "sent": self.sent,
+            "failed": self.failed,
+            "total": self.total,
+            "loading": self.loading,
+            "retries": self.retries,
+            "elapsed": round(end - self.started_at, 1),
+            "error": self.error,
+        }
+
+
+class ExportJobManager:
+    def __init__(self):
+        self.jobs: Dict[str, ExportJob] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def get(self, job_id: str) -> Optional[ExportJob]:
+        return self.jobs.get(job_id)
+
+    def running(self, kind: str) -> Optional[ExportJob]:
+        for job in self.jobs.values():
+            if job.kind == kind and job.status == RUNNING:
+                return job
+        return None
+
+    def start(self, kind: str, load: Callable[[int, Optional[str]], Awaitable[dict]],
+              to_row: Callable[[dict], dict]) -> ExportJob:
+        """
+        Start an export (or return the one of this kind already running).
+        load(limit, cursor) returns one page: {"items": [...], "next_cursor": str | None}.
+        """
+        job = self.running(kind)
+        if job:
+            return job
+
+        job = ExportJob(kind)
+        self.jobs[job.id] = job
+        self._forget_old()
+        self._tasks[job.id] = db.spawn(self._run(job, load, to_row))
+        logger.info(f"Export job {job.id} ({kind}) started")
+        return job
+
+    async def _run(self, job: ExportJob, load, to_row) -> None:
+        try:
+            size = settings.SHEETS_EXPORT_BATCH_SIZE
+            semaphore = asyncio.Semaphore(settings.SHEETS_EXPORT_CONCURRENCY)
+            cursor = None
+            while True:
+                page = await load(PAGE_SIZE, cursor)
+                rows = [to_row(dict(r)) for r in page["items"]]
+                job.total += len(rows)
+                cursor = page["next_cursor"]
+                if not cursor:
+                    job.loading = False
+                batches = [rows[i:i + size] for i in range(0, len(rows), size)]
+                await asyncio.gather(*(self._send(job, batch, semaphore) for batch in batches))
+                if not cursor:
+                    break
+            job.status = DONE
+        except asyncio.CancelledError:
+            job.status = FAILED
+            job.error = "cancelled"
+            raise
+        except Exception as e:
+            logger.error(f"Export job {job.id} ({job.kind}) failed: {e}")
+            job.status = FAILED
+            job.error = str(e)
+        finally:
+            job.loading = False
+            job.finished_at = time.time()
+            self._tasks.pop(job.id, None)
+            logger.info(f"Export job {job.id} ({job.kind}) finished: "
+                        f"{job.sent}/{job.total} sent, {job.failed} failed")
+
+    async def _send(self, job: ExportJob, batch: List[dict], semaphore: asyncio.Semaphore) -> None:
+        async with semaphore:
+            delay = settings.SHEETS_EXPORT_RETRY_DELAY
+            for attempt in range(settings.SHEETS_EXPORT_RETRIES + 1):
+                if attempt:
+                    job.retries += 1
+                    await asyncio.sleep(delay)
+                    delay *= 2
+                if await send_to_sheets(batch):
+                    job.sent += len(batch)
+                    return
+            job.failed += len(batch)
+
+    def _forget_old(self) -> None:
+        finished = [j for j in self.jobs.values() if j.status != RUNNING]
+        finished.sort(key=lambda j: j.started_at)
+        for job in finished[:max(0, len(finished) - KEEP_FINISHED)]:
+            del self.jobs[job.id]
+
+    async def stop(self) -> None:
+        """Cancel running jobs (shutdown)"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+export_jobs = ExportJobManager()
@@ -1,12 +1,118 @@
 from aiogram import Bot
+from collections import Counter
+from datetime import datetime
+from typing import List, Optional
 from core.config import settings
+from infrastructure.db import db
+from core.telegram_sender import send_priority, URGENT
+import asyncio
+import html
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
+PRODUCT_NAMES = {
+    "teremok": "Теремок",
+    "formula": "Формула команды",
+    "formula_rsp": "Формула РСП",
+}
+
+# A failed digest is kept for the next one, but the buffer never grows past this many digests
+MAX_BUFFERED_DIGESTS = 10
+
+# After a failed digest, early (size-triggered) flushes wait this long, doubling up to the digest interval
+FLUSH_RETRY_BACKOFF = 30
+
+
+def product_label(product: Optional[str]) -> str:
+    return PRODUCT_NAMES.get(product, product or "Без продукта")
+
+
+def parse_urgent_rules(value: str) -> List[tuple]:
+    """'lead, test:formula_rsp' -> [('lead',), ('test', 'formula_rsp')]"""
+    return [tuple(rule.strip().split(":")) for rule in value.split(",") if rule.strip()]
+
+
+class DigestBuffer:
+    """
+    Lead/test events waiting for the next manager digest. Per process: with
+    several processes each sends its own summary.
+    """
+    def __init__(self):
+        self.events: List[dict] = []
+        self.started_at = datetime.now()
+
+    def add(self, event: dict) -> int:
+        if not self.events:
+            self.started_at = datetime.now()
+        self.events.append(event)
+        return len(self.events)
+
+    def take(self) -> tuple:
+        events, started_at = self.events, self.started_at
+        self.events = []
+        return events, started_at
+
+    def put_back(self, events: List[dict], started_at: datetime) -> None:
+        limit = settings.NOTIFICATION_DIGEST_MAX_EVENTS * MAX_BUFFERED_DIGESTS
+        self.events = (events + self.events)[-limit:]
+        self.started_at = min(started_at, self.started_at)
+
+
+def format_digest(events: List[dict], started_at: datetime, top_leads: int) -> str:
+    """Grouped summary: counts per product and result type, latest new leads"""
+    from core.texts import TYPES_DATA
+
+    leads = [e for e in events if e['kind'] == 'lead']
+    tests = [e for e in events if e['kind'] == 'test']
+    text = (
+        f"🗂 <b>Сводка с {started_at:%H:%M} по {datetime.now():%H:%M}</b>\n\n"
+        f"📩 Заявок: <b>{len(leads)}</b>\n"
+        f"🧩 Тестов: <b>{len(tests)}</b>\n"
+    )
+
+    by_product = Counter((product_label(e.get('product')), e['kind']) for e in events)
+    if by_product:
+        text += "\n<b>По продуктам:</b>\n"
+        for name in sorted({name for name, _ in by_product}):
+            text += (
+                f"• {html.escape(name)}: заявок {by_product[(name, 'lead')]}, "
+                f"тестов {by_product[(name, 'test')]}\n"
+            )
+
+    by_type = Counter(e.get('result_type') for e in tests if e.get('result_type'))
+    if by_type:
+        text += "\n<b>Результаты тестов:</b>\n"
+        for result_type, count in by_type.most_common():
+            type_info = TYPES_DATA.get(result_type)
+            label = f"{type_info.emoji} {type_info.name_ru}" if type_info else html.escape(result_type)
+            text += f"• {label} — {count}\n"
+
+    if leads:
+        text += "\n<b>Новые заявки:</b>\n"
+        for lead in reversed(leads[-top_leads:]):
+            user = f" (ID: <code>{lead['user_id']}</code>)" if lead.get('user_id') else ""
+            text += (
+                f"• {html.escape(str(lead.get('name') or 'Н/Д'))} — {html.escape(str(lead.get('contact') or '-'))}, "
+                f"{html.escape(str(lead.get('source') or ''))}{user}\n"
+            )
+        if len(leads) > top_leads:
+            text += f"…и ещё {len(leads) - top_leads}\n"
+    return text
+
+
 class NotificationService:
     def __init__(self, bot: Bot = None):
         self.bot = bot
+        self.digest = DigestBuffer()
+        self.urgent_rules = parse_urgent_rules(settings.NOTIFICATION_DIGEST_URGENT)
+        self._digest_task: Optional[asyncio.Task] = None
+        self._size_flush: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self._flush_failures = 0
+        self._retry_at = 0.0
+        self.digests_sent = 0
 
     def set_bot(self, bot: Bot):
         """Set bot instance for sending notifications"""
@@ -16,6 +122,75 @@ class NotificationService:
         """Get bot instance"""
         return self.bot
 
+    # ===== Digest mode =====
+
+    def start_digest(self) -> None:
+        if not settings.NOTIFICATION_DIGEST_ENABLED or self._digest_task is not None:
+            return
+        self._digest_task = db.spawn(self._digest_loop())
+        logger.info(f"Manager digest every {settings.NOTIFICATION_DIGEST_INTERVAL} min")
+
+    async def stop_digest(self) -> None:
+        """Stop the schedule and send what is buffered"""
+        if self._digest_task is not None:
+            self._digest_task.cancel()
+            await asyncio.gather(self._digest_task, return_exceptions=True)
+            self._digest_task = None
+        if self._size_flush is not None:
+            await asyncio.gather(self._size_flush, return_exceptions=True)
+            self._size_flush = None
+        await self.flush_digest()
+
+    async def _digest_loop(self) -> None:
+        while True:
+            await asyncio.sleep(settings.NOTIFICATION_DIGEST_INTERVAL * 60)
+            await self.flush_digest()
+
+    def is_urgent(self, kind: str, product: str = None, result_type: str = None) -> bool:
+        """Event matches a NOTIFICATION_DIGEST_URGENT rule (a rule is a prefix of kind:product:result_type)"""
+        key = (kind, product or "", result_type or "")
+        return any(key[:len(rule)] == rule for rule in self.urgent_rules)
+
+    def _buffer(self, event: dict) -> bool:
+        """Queue the event for the digest; False if it must be sent right away"""
+        if not settings.NOTIFICATION_DIGEST_ENABLED:
+            return False
+        if self.is_urgent(event['kind'], event.get('product'), event.get('result_type')):
+            return False
+        if self.digest.add(event) >= settings.NOTIFICATION_DIGEST_MAX_EVENTS \
+                and (self._size_flush is None or self._size_flush.done()) \
+                and time.monotonic() >= self._retry_at:
+            self._size_flush = db.spawn(self.flush_digest())
+        return True
+
+    async def flush_digest(self) -> bool:
+        """Send one summary of the buffered events (no-op when empty)"""
+        async with self._flush_lock:
+            events, started_at = self.digest.take()
+            if not events:
+                return True
+            text = format_digest(events, started_at, settings.NOTIFICATION_DIGEST_TOP_LEADS)
+            if await self.notify_manager(text):
+                self.digests_sent += 1
+                self._flush_failures = 0
+                self._retry_at = 0.0
+                return True
+            # Keep them for the next digest; no early flushes until the backoff passes
+            self.digest.put_back(events, started_at)
+            backoff = min(FLUSH_RETRY_BACKOFF * 2 ** self._flush_failures,
+                          settings.NOTIFICATION_DIGEST_INTERVAL * 60)
+            self._flush_failures += 1
+            self._retry_at = time.monotonic() + backoff
+            return False
+
+    def metrics(self) -> dict:
+        return {
+            "digest_enabled": settings.NOTIFICATION_DIGEST_ENABLED,
+            "buffered": len(self.digest.events),
+            "digests_sent": self.digests_sent,
+            "flush_failures": self._flush_failures,
+        }
+
     async def notify_manager(self, text: str, parse_mode: str = "HTML") -> bool:
         """Send message to manager chat"""
         if not self.bot:
@@ -27,11 +202,13 @@ class NotificationService:
             return False
             
         try:
-            await self.bot.send_message(
-                chat_id=settings.MANAGER_CHAT_ID,
-                text=text,
-                parse_mode=parse_mode
-            )
+            # Manager alerts go ahead of user replies and broadcasts
+            with send_priority(URGENT):
+                await self.bot.send_message(
+                    chat_id=settings.MANAGER_CHAT_ID,
+                    text=text,
+                    parse_mode=parse_mode
+                )
             return True
         except Exception as e:
             logger.error(f"Failed to send notification to manager: {e}")
@@ -39,8 +216,13 @@ class NotificationService:
 
     async def notify_new_lead(self, name: str, contact: str, message: str = None, 
                               result_type: str = None, source: str = "Bot", 
-                              username: str = None, user_id: int = None) -> bool:
-        """Format and send new lead notification"""
+                              username: str = None, user_id: int = None,
+                              product: str = None) -> bool:
+        """Format and send new lead notification (or add it to the digest)"""
+        if self._buffer({"kind": "lead", "product": product, "name": name, "contact": contact,
+                         "source": source, "user_id": user_id, "result_type": result_type}):
+            return True
+
         text = (
             f"📩 <b>Новая заявка ({source})</b>\n\n"
             f"👤 <b>Имя:</b> {name}\n"
@@ -63,9 +245,12 @@ class NotificationService:
     async def notify_test_result(self, result_type: str, answers: dict = None, 
                                  contact: dict = None, user_id: int = None, 
                                  product: str = "teremok", scores: dict = None) -> bool:
-        """Format and send test result notification"""
+        """Format and send test result notification (or add it to the digest)"""
         from core.texts import TYPES_DATA
         
+        if self._buffer({"kind": "test", "product": product, "result_type": result_type, "user_id": user_id}):
+            return True
+        
         product_name = "Теремок" if product == "teremok" else "Формула команды"
         type_info = TYPES_DATA.get(result_type)
         type_emoji = type_info.emoji if type_info else "🎯"
@@ -0,0 +1,168 @@
+"""
+Background worker draining sheets_outbox into Google Sheets.
+
+Rows are sent in micro-batches (one webhook call per batch). A failed batch is
+retried with exponential backoff; after SHEETS_OUTBOX_MAX_ATTEMPTS the rows
+become dead letters that an admin can requeue. Several processes can run the
+worker at once: claimed rows are leased, not locked for the whole send.
+
+Real-time writers only call wake(); the worker coalesces those signals and
+flushes once SHEETS_OUTBOX_BATCH_SIZE rows are waiting or SHEETS_OUTBOX_LINGER_MS
+has passed, whichever comes first, so a burst of leads costs one webhook call
+instead of one per lead. Rows wait in the table, not in memory, and only one
+batch is in flight per process: a slow webhook simply makes the next batch
+fuller. On shutdown the due rows are flushed within a deadline.
+"""
+import asyncio
+import logging
+import time
+from typing import Optional
+from core.config import settings
+from infrastructure.db import db
+from core.google_sheets import send_to_sheets, outbox_row
+from repositories.outbox_repository import OutboxRepository
+from services.sheets_sync import SheetsSyncService
+
+logger = logging.getLogger(__name__)
+
+# Claimed rows reappear for other workers if this one dies mid-send
+LEASE_SECONDS = 60
+
+
+class SheetsOutboxWorker:
+    def __init__(self, outbox_repo: OutboxRepository, sheets_sync: Optional[SheetsSyncService] = None):
+        self.outbox_repo = outbox_repo
+        self.sheets_sync = sheets_sync
+        self.batch_size = settings.SHEETS_OUTBOX_BATCH_SIZE
+        self.poll_interval = settings.SHEETS_OUTBOX_POLL_INTERVAL
+        self.linger = settings.SHEETS_OUTBOX_LINGER_MS / 1000
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+        self._wake = asyncio.Event()
+        self._full = asyncio.Event()
+        # Rows announced via wake() since the last claim
+        self._waiting = 0
+        self.sent = 0
+        self.failed_batches = 0
+        self.dead_lettered = 0
+        self.last_success_at: Optional[float] = None
+        self.batches = 0
+
+    def start(self) -> None:
+        if not settings.GOOGLE_SHEETS_ENABLED or self._task is not None:
+            return
+        self._stopping.clear()
+        self._task = db.spawn(self._run())
+        logger.info("Sheets outbox worker started")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._stopping.set()
+        self._wake.set()
+        self._full.set()
+        await self._task
+        self._task = None
+
+        flushed = await self.flush(settings.SHEETS_OUTBOX_SHUTDOWN_FLUSH_TIMEOUT)
+        logger.info(f"Sheets outbox worker stopped, flushed {flushed} rows")
+
+    def wake(self, rows: int = 1) -> None:
+        """Announce enqueued rows; sent with the next batch (full or after the linger)"""
+        self._waiting += rows
+        if self._waiting >= self.batch_size:
+            self._full.set()
+        self._wake.set()
+
+    async def flush(self, timeout: float) -> int:
+        """Send due rows until the queue is empty or the deadline passes"""
+        deadline = time.monotonic() + timeout
+        flushed = 0
+        while time.monotonic() < deadline:
+            try:
+                processed = await asyncio.wait_for(self.drain_once(), deadline - time.monotonic())
+            except asyncio.TimeoutError:
+                logger.warning("Sheets outbox: flush deadline reached, the rest stays queued")
+                break
+            except Exception as e:
+                logger.error(f"Sheets outbox flush error: {e}")
+                break
+            flushed += processed
+            if processed < self.batch_size:
+                break
+        return flushed
+
+    async def drain_once(self) -> int:
+        """Send one batch; returns the number of rows processed"""
+        self._waiting = 0
+        self._full.clear()
+        rows = await self.outbox_repo.claim_batch(self.batch_size, LEASE_SECONDS)
+        if not rows:
+            return 0
+
+        ids = [row['id'] for row in rows]
+        batch = [outbox_row(row['kind'], row['payload'] or {}) for row in rows]
+
+        if await send_to_sheets(batch):
+            await self.outbox_repo.delete_sent(ids)
+            self.sent += len(ids)
+            self.batches += 1
+            self.last_success_at = time.time()
+            if self.sheets_sync:
+                await self._remember(rows, batch)
+        else:
+            dead = await self.outbox_repo.mark_failed(
+                ids, "Webhook call failed",
+                settings.SHEETS_OUTBOX_MAX_ATTEMPTS,
+                settings.SHEETS_OUTBOX_BACKOFF_BASE,
+                settings.SHEETS_OUTBOX_BACKOFF_MAX
+            )
+            self.failed_batches += 1
+            self.dead_lettered += dead or 0
+            if dead:
+                logger.error(f"Sheets outbox: {dead} rows moved to dead letters")
+        return len(ids)
+
+    async def _remember(self, rows: list, batch: list) -> None:
+        """Let the incremental sync know these rows are already in the sheet"""
+        try:
+            await self.sheets_sync.remember_delivered(
+                [(row['kind'], row['payload'] or {}, sheet_row) for row, sheet_row in zip(rows, batch)]
+            )
+        except Exception as e:
+            logger.warning(f"Sheets outbox: could not record delivered rows for sync: {e}")
+
+    async def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                processed = await self.drain_once()
+            except Exception as e:
+                logger.error(f"Sheets outbox worker error: {e}")
+                processed = 0
+
+            # Keep draining while full batches come back, otherwise wait
+            if processed < self.batch_size and not self._stopping.is_set():
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+
+                # Woken by a writer: give the batch time to fill up
+                if self._waiting and not self._full.is_set() and not self._stopping.is_set():
+                    try:
+                        await asyncio.wait_for(self._full.wait(), timeout=self.linger)
+                    except asyncio.TimeoutError:
+                        pass
+
+    def metrics(self) -> dict:
+        return {
+            "running": self._task is not None,
+            "sent": self.sent,
+            "batches": self.batches,
+            "avg_batch_size": round(self.sent / self.batches, 1) if self.batches else 0,
+            "failed_batches": self.failed_batches,
+            "dead_lettered": self.dead_lettered,
+            "last_success_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.last_success_at))
+            if self.last_success_at else None,
+        }
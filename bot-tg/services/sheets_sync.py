@@ -0,0 +1,169 @@
+"""
+Incremental Google Sheets sync.
+
+Instead of re-sending every lead and test, each stream ("leads", "tests",
+"unified") keeps a watermark in sync_state and a content hash per row in
+sync_row_hashes: a run reads rows changed since the watermark, sends only those
+whose Sheets row differs from what was sent before, then moves the watermark.
+A failed webhook call stops the stream without moving the watermark past the
+undelivered rows; the next run picks them up again.
+
+Runs every SHEETS_SYNC_INTERVAL minutes (0 disables the schedule) and on demand
+from the admin panel. The first run of a stream sends its whole history unless
+the stream was baselined.
+"""
+import asyncio
+import hashlib
+import logging
+import time
+from typing import Callable, Dict, Optional
+import orjson
+from core.config import settings
+from infrastructure.db import db
+from core.google_sheets import send_to_sheets, lead_row, test_row, unified_test_row
+from repositories.sync_repository import SyncRepository, SYNC_STREAMS
+
+logger = logging.getLogger(__name__)
+
+# Rows read per round trip; each chunk of changed rows is one webhook call
+READ_BATCH = 500
+# Rows younger than this wait for the next run (late-committing transactions)
+LAG_SECONDS = 30
+# A run that dies keeps its stream locked at most this long
+LEASE_SECONDS = 600
+
+ROW_BUILDERS: Dict[str, Callable[[dict], dict]] = {
+    "leads": lead_row,
+    "tests": test_row,
+    "unified": unified_test_row,
+}
+
+
+def row_hash(row: dict) -> str:
+    """Content hash of a Sheets row"""
+    return hashlib.blake2b(orjson.dumps(row, option=orjson.OPT_SORT_KEYS), digest_size=16).hexdigest()
+
+
+def delivered_key(kind: str, payload: dict) -> Optional[tuple]:
+    """(stream, row key) for a row the real-time outbox delivered, None if no stream covers it"""
+    if kind == "lead":
+        lead = payload.get("lead") or {}
+        return ("leads", lead["user_id"]) if lead.get("user_id") is not None else None
+    test = payload.get("test") or {}
+    # Formula RSP rows live in formula_rsp_results, not in the "tests" stream
+    if test.get("test_id") is not None and test.get("product") != "formula_rsp":
+        return ("tests", test["test_id"])
+    return None
+
+
+class SheetsSyncService:
+    def __init__(self, sync_repo: SyncRepository):
+        self.sync_repo = sync_repo
+        self.interval = settings.SHEETS_SYNC_INTERVAL * 60
+        self._task: Optional[asyncio.Task] = None
+        self._manual: Optional[asyncio.Task] = None
+        self.last_report: Dict[str, dict] = {}
+
+    def start(self) -> None:
+        if not settings.GOOGLE_SHEETS_ENABLED or self.interval <= 0 or self._task is not None:
+            return
+        self._task = db.spawn(self._run())
+        logger.info(f"Sheets sync scheduled every {settings.SHEETS_SYNC_INTERVAL} min")
+
+    async def stop(self) -> None:
+        tasks = [t for t in (self._task, self._manual) if t is not None and not t.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = self._manual = None
+
+    def trigger(self, stream: str = None) -> bool:
+        """Start a run in the background (admin button); False if a manual run is still going"""
+        if self._manual is not None and not self._manual.done():
+            return False
+        coro = self.sync_stream(stream) if stream else self.sync_all()
+        self._manual = db.spawn(coro)
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sync_all()
+            except Exception as e:
+                logger.error(f"Sheets sync failed: {e}")
+
+    async def sync_all(self) -> Dict[str, dict]:
+        return {stream: await self.sync_stream(stream) for stream in SYNC_STREAMS}
+
+    async def sync_stream(self, stream: str) -> dict:
+        """Send new/changed rows of one stream; returns sent/skipped/failed and elapsed"""
+        started = time.monotonic()
+        state = await self.sync_repo.claim(stream, LEASE_SECONDS)
+        if state is None:
+            return {"stream": stream, "status": "busy"}
+
+        _, _, _, at_col, key_col = SYNC_STREAMS[stream]
+        to_row = ROW_BUILDERS[stream]
+        after_at, after_id = state['watermark_at'], state['watermark_id']
+        sent = skipped = failed = 0
+        error = None
+        try:
+            while True:
+                records = await self.sync_repo.fetch_changed(stream, after_at, after_id, LAG_SECONDS, READ_BATCH)
+                if not records:
+                    break
+
+                rows = {r[key_col]: to_row(r) for r in records}
+                hashes = {key: row_hash(row) for key, row in rows.items()}
+                known = await self.sync_repo.get_hashes(stream, list(rows))
+                changed = [key for key in rows if known.get(key) != hashes[key]]
+                skipped += len(rows) - len(changed)
+
+                size = settings.SHEETS_EXPORT_BATCH_SIZE
+                for i in range(0, len(changed), size):
+                    chunk = changed[i:i + size]
+                    if not await send_to_sheets([rows[key] for key in chunk]):
+                        failed = len(changed) - i
+                        error = "Webhook call failed"
+                        break
+                    await self.sync_repo.save_hashes(stream, {key: hashes[key] for key in chunk})
+                    sent += len(chunk)
+                if error:
+                    # Watermark stays put; delivered rows are skipped by hash next time
+                    break
+
+                last = records[-1]
+                after_at, after_id = last[at_col], last[key_col]
+                await self.sync_repo.advance(stream, after_at, after_id)
+                if len(records) < READ_BATCH:
+                    break
+        except Exception as e:
+            logger.error(f"Sheets sync {stream} error: {e}")
+            error = str(e)
+        finally:
+            await self.sync_repo.release(stream, sent, skipped, error)
+
+        report = {
+            "stream": stream,
+            "status": "failed" if error else "ok",
+            "sent": sent,
+            "skipped": skipped,
+            "failed": failed,
+            "elapsed": round(time.monotonic() - started, 1),
+            "error": error,
+        }
+        self.last_report[stream] = report
+        logger.info(f"Sheets sync {stream}: {sent} sent, {skipped} unchanged, {failed} failed")
+        return report
+
+    async def remember_delivered(self, entries: list) -> None:
+        """Record outbox-delivered rows so the sync does not send them again"""
+        by_stream: Dict[str, Dict[int, str]] = {}
+        for kind, payload, row in entries:
+            key = delivered_key(kind, payload)
+            if key:
+                stream, row_key = key
+                by_stream.setdefault(stream, {})[row_key] = row_hash(row)
+        for stream, hashes in by_stream.items():
+            await self.sync_repo.save_hashes(stream, hashes)
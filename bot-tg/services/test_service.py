@@ -2,6 +2,7 @@ from repositories.test_repository import TestRepository
 from models.test_result import TestResult, FormulaResult
 from core.logic import calculate_result
 from core.formula_rsp_logic import compute_formula_rsp
+from core.stats_cache import stats_cache, LEADS, TESTS
 import logging
 
 logger = logging.getLogger(__name__)
@@ -10,10 +11,10 @@ class TestService:
     def __init__(self, test_repo: TestRepository):
         self.test_repo = test_repo
 
-    async def process_teremok_test(self, user_id: int, answers: dict) -> int:
-        """Calculate and save Teremok test result"""
+    async def submit_teremok_test(self, user_id: int, answers: dict) -> dict:
+        """Calculate Teremok result and save contact, legacy row and session in one round trip"""
         result_data = calculate_result(answers)
-        
+
         result = TestResult(
             user_id=user_id,
             result_type=result_data['type'],
@@ -21,15 +22,22 @@ class TestService:
             answers=answers,
             product="teremok"
         )
-        
-        return await self.test_repo.save_test_result(result)
 
-    async def process_formula_rsp(self, user_id: int, answers: list) -> FormulaResult:
-        """Calculate and save Formula RSP result"""
-        # Calculate
+        saved = await self.test_repo.submit_teremok_result(
+            result,
+            session_result=result_data,
+            meta={"type": result_data['type']}
+        )
+        # Guest contact may have been created as well
+        stats_cache.invalidate(LEADS, TESTS)
+        saved["result"] = result_data
+        return saved
+
+    async def submit_formula_rsp(self, user_id: int, answers: list,
+                                 name: str = None, role: str = None) -> dict:
+        """Calculate Formula RSP result and save contact, legacy row and session in one round trip"""
         computed = compute_formula_rsp(answers)
-        
-        # Create model
+
         result = FormulaResult(
             user_id=user_id,
             primary_type_code=computed.primary_code,
@@ -37,14 +45,18 @@ class TestService:
             scores=computed.scores,
             answers=answers
         )
-        
-        # Save
-        result_id = await self.test_repo.save_formula_result(result)
-        result.id = result_id
-        computed.id = result_id
-        
-        # Return full computer result object for frontend (adding derived fields)
-        return computed
+
+        saved = await self.test_repo.submit_formula_result(
+            result,
+            session_result=computed.scores,
+            meta={"type": computed.primary_name},
+            name=name,
+            role=role
+        )
+        stats_cache.invalidate(LEADS, TESTS)
+        computed.id = saved["test_id"]
+        saved["result"] = computed
+        return saved
 
     async def get_test_result_by_id(self, result_id: int) -> TestResult | None:
         return await self.test_repo.get_test_result_by_id(result_id)
@@ -57,8 +69,29 @@ class TestService:
                                   sort_by: str = "created_at", sort_order: str = "desc") -> list:
         return await self.test_repo.get_all_tests_full(limit, product, result_type, days, sort_by, sort_order)
 
+    def stream_tests(self, product: str = None, result_type: str = None, search: str = None,
+                     days: int = None, sort_by: str = "created_at", sort_order: str = "desc"):
+        return self.test_repo.stream_tests(product, result_type, search, days, sort_by, sort_order)
+
+    async def get_tests_page(self, limit: int = 100, product: str = None,
+                             result_type: str = None, days: int = None,
+                             sort_by: str = "created_at", sort_order: str = "desc",
+                             cursor: str = None) -> dict:
+        return await self.test_repo.get_tests_page(limit, product, result_type, days, sort_by, sort_order, cursor)
+
     async def get_recent_tests_full(self, limit: int = 10) -> list:
         return await self.test_repo.get_recent_tests_full(limit)
 
     async def get_unified_tests(self, limit: int = 200, product: str = None, days: int = None) -> list:
         return await self.test_repo.get_unified_tests(limit, product, days)
+
+    def stream_unified_tests(self, product: str = None, days: int = None, search: str = None):
+        return self.test_repo.stream_unified_tests(product, days, search)
+
+    async def get_unified_tests_page(self, limit: int = 200, product: str = None, days: int = None,
+                                     cursor: str = None) -> dict:
+        return await self.test_repo.get_unified_tests_page(limit, product, days, cursor)
+
+    async def count_sessions_by_type(self, product: str = None, days: int = None,
+                                     result_match: dict = None) -> dict:
+        return await self.test_repo.count_sessions_by_type(product, days, result_match)
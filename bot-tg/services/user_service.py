@@ -1,17 +1,89 @@
 from repositories.user_repository import UserRepository
 from models.user import UserContact
 from core.config import settings
+from core.stats_cache import stats_cache, LEADS
+from typing import Awaitable, Callable, FrozenSet, Optional
+import asyncio
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
+
+class AdminRoster:
+    """
+    In-process copy of the admins table (a handful of ids), so bot admin commands
+    do not query Postgres on every message. The set is reloaded once it is older
+    than ADMIN_ROSTER_TTL; /addadmin and /deladmin update it in this process
+    immediately, other bot processes sharing the DB pick the change up on their
+    next reload. Concurrent lookups during a reload wait for the same query.
+    """
+    def __init__(self, load: Callable[[], Awaitable[list]], ttl: float):
+        self._load = load
+        self.ttl = ttl
+        self._ids: Optional[FrozenSet[int]] = None
+        self._loaded_at = 0.0
+        self._lock = asyncio.Lock()
+        self.hits = 0
+        self.reloads = 0
+
+    def _fresh(self) -> bool:
+        return self._ids is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    async def reload(self) -> FrozenSet[int]:
+        admins = await self._load()
+        self._ids = frozenset(admin['user_id'] for admin in admins)
+        self._loaded_at = time.monotonic()
+        self.reloads += 1
+        return self._ids
+
+    async def ids(self) -> FrozenSet[int]:
+        if self._fresh():
+            self.hits += 1
+            return self._ids
+        async with self._lock:
+            if self._fresh():
+                self.hits += 1
+                return self._ids
+            try:
+                return await self.reload()
+            except Exception as e:
+                if self._ids is None:
+                    raise
+                # DB hiccup: keep serving the last known roster
+                logger.error(f"Admin roster reload failed: {e}")
+                return self._ids
+
+    async def contains(self, user_id: int) -> bool:
+        return user_id in await self.ids()
+
+    def added(self, user_id: int) -> None:
+        if self._ids is not None:
+            self._ids = self._ids | {user_id}
+
+    def removed(self, user_id: int) -> None:
+        if self._ids is not None:
+            self._ids = self._ids - {user_id}
+
+    def metrics(self) -> dict:
+        return {
+            "admins": len(self._ids) if self._ids is not None else None,
+            "age": round(time.monotonic() - self._loaded_at, 1) if self._ids is not None else None,
+            "hits": self.hits,
+            "reloads": self.reloads,
+            "ttl": self.ttl,
+        }
+
+
 class UserService:
     def __init__(self, user_repo: UserRepository):
         self.user_repo = user_repo
+        self.admin_roster = AdminRoster(user_repo.get_all_telegram_admins, settings.ADMIN_ROSTER_TTL)
 
     async def register_contact(self, contact: UserContact) -> None:
         """Register or update user contact info"""
         await self.user_repo.save_contact(contact)
+        stats_cache.invalidate(LEADS)
         
     async def get_contact(self, user_id: int) -> UserContact | None:
         return await self.user_repo.get_contact(user_id)
@@ -29,13 +101,16 @@ class UserService:
 
     async def update_lead_status(self, user_id: int, status: str, notes: str = None) -> None:
         await self.user_repo.update_status(user_id, status, notes)
+        stats_cache.invalidate(LEADS)
 
     # Telegram Admin Management
     async def add_admin(self, user_id: int, username: str, role: str = 'admin', added_by: int = 0) -> None:
         await self.user_repo.add_telegram_admin(user_id, username, role, added_by)
+        self.admin_roster.added(user_id)
 
     async def remove_admin(self, user_id: int) -> None:
         await self.user_repo.remove_telegram_admin(user_id)
+        self.admin_roster.removed(user_id)
 
     async def get_admins(self) -> list[dict]:
         return await self.user_repo.get_all_telegram_admins()
@@ -44,19 +119,37 @@ class UserService:
         return await self.user_repo.get_telegram_admin(user_id)
     
     async def is_admin(self, user_id: int) -> bool:
-        return await self.user_repo.is_telegram_admin(user_id)
+        """Served from the in-process admin roster"""
+        return await self.admin_roster.contains(user_id)
 
     async def get_statistics(self, days: int = None) -> dict:
-        return await self.user_repo.get_statistics(days)
+        return await stats_cache.get_or_compute(
+            f"statistics:{days}", lambda: self.user_repo.get_statistics(days)
+        )
 
     async def get_daily_statistics(self, days: int = 7) -> dict:
-        return await self.user_repo.get_daily_statistics(days)
+        return await stats_cache.get_or_compute(
+            f"daily:{days}", lambda: self.user_repo.get_daily_statistics(days)
+        )
 
     async def get_all_leads_full(self, limit: int = 100, status: str = None,
                                   search: str = None, days: int = None,
                                   sort_by: str = "created_at", sort_order: str = "desc") -> list:
         return await self.user_repo.get_all_leads_full(limit, status, search, days, sort_by, sort_order)
 
+    def stream_leads(self, status: str = None, product: str = None, search: str = None,
+                     days: int = None, sort_by: str = "created_at", sort_order: str = "desc"):
+        return self.user_repo.stream_leads(status, product, search, days, sort_by, sort_order)
+
+    async def get_leads_page(self, limit: int = 100, status: str = None,
+                             search: str = None, days: int = None,
+                             sort_by: str = "created_at", sort_order: str = "desc",
+                             cursor: str = None) -> dict:
+        return await self.user_repo.get_leads_page(limit, status, search, days, sort_by, sort_order, cursor)
+
+    async def search_leads(self, term: str, limit: int = 10) -> list:
+        return await self.user_repo.search_leads(term, limit)
+
     async def get_recent_leads_full(self, limit: int = 10) -> list:
         return await self.user_repo.get_recent_leads_full(limit)
 
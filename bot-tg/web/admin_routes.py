@@ -3,7 +3,7 @@ Web Admin Panel Routes
 Protected by ADMIN_PANEL_SECRET
 """
 from fastapi import APIRouter, Request, Depends, HTTPException, Form
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from datetime import datetime
 from core.config import settings
@@ -16,7 +16,17 @@ import logging
 
 logger = logging.getLogger(__name__)
 
-from core.dependencies import user_repo, auth_service, user_service, test_service
+from core.dependencies import user_repo, test_repo, outbox_repo, auth_service, user_service, test_service, sheets_outbox_worker, sync_repo, sheets_sync, broadcast_service, broadcast_repo, notification_service
+from core.stats_cache import stats_cache, LEADS, TESTS
+from core.telegram_checks import subscription_cache
+from core.task_runner import task_runner
+from core.telegram_sender import telegram_sender
+from core.google_sheets import lead_row, test_row, unified_test_row
+from services.export_jobs import export_jobs
+from core.export_formats import FORMATS, encode_rows
+from repositories.sync_repository import SYNC_STREAMS
+from repositories.broadcast_repository import clean_filters
+from infrastructure.db import db
 
 logger = logging.getLogger(__name__)
 
@@ -27,6 +37,21 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/app/admin", tags=["admin"])
 
+
+async def db_request_scope():
+    """
+    Route dependency for DB-only pages and list APIs: every repository call of
+    the request (auth check included) shares one pooled connection. Not for
+    routes that call Telegram or webhooks, which would hold the connection meanwhile.
+    """
+    async with db.scope():
+        yield
+
+DB_SCOPE = [Depends(db_request_scope)]
+
+# Datasets downloadable from GET /api/export/{dataset}.{fmt}
+EXPORT_DATASETS = ("leads", "tests", "unified")
+
 # Templates
 templates_path = os.path.join(os.path.dirname(__file__), "templates")
 templates = Jinja2Templates(directory=templates_path)
@@ -117,7 +142,7 @@ async def login_submit(request: Request, username: str = Form(...), password: st
         token = await auth_service.create_session(username)
         
         response = RedirectResponse(url="/app/admin/dashboard", status_code=303)
-        response.set_cookie("admin_session", token, max_age=86400*7, httponly=True, samesite="lax")
+        response.set_cookie("admin_session", token, max_age=settings.ADMIN_SESSION_TTL, httponly=True, samesite="lax")
         return response
         
     return templates.TemplateResponse("admin/login.html", {
@@ -128,6 +153,10 @@ async def login_submit(request: Request, username: str = Form(...), password: st
 @router.get("/logout")
 async def logout(request: Request):
     """Logout"""
+    token = request.cookies.get("admin_session")
+    if token:
+        await auth_service.end_session(token)
+    
     response = RedirectResponse(url="/app/admin/login", status_code=303)
     response.delete_cookie("admin_session")
     response.delete_cookie("admin_key")
@@ -146,8 +175,24 @@ def serialize_record(record):
             data[key] = value.strftime("%Y-%m-%d %H:%M:%S")
     return data
 
-@router.get("")
-@router.get("/dashboard")
+def page_links(request: Request, next_cursor: str = None) -> dict:
+    """Next/first page URLs for keyset-paginated pages (filters and sort kept)"""
+    return {
+        "next_page_url": str(request.url.include_query_params(cursor=next_cursor)) if next_cursor else None,
+        "first_page_url": str(request.url.remove_query_params("cursor")) if request.query_params.get("cursor") else None,
+    }
+
+def export_links(request: Request, dataset: str) -> dict:
+    """CSV/NDJSON download URLs with the page's current filters"""
+    query = request.url.remove_query_params("cursor").query
+    suffix = f"?{query}" if query else ""
+    return {
+        "export_csv_url": f"/app/admin/api/export/{dataset}.csv{suffix}",
+        "export_ndjson_url": f"/app/admin/api/export/{dataset}.ndjson{suffix}",
+    }
+
+@router.get("", dependencies=DB_SCOPE)
+@router.get("/dashboard", dependencies=DB_SCOPE)
 async def admin_dashboard(request: Request, key: str = None):
     # ... (auth check)
     try:
@@ -166,6 +211,9 @@ async def admin_dashboard(request: Request, key: str = None):
         
         recent_tests = await test_service.get_recent_tests_full(limit=5)
         
+        # Sheets outbox depth/lag
+        outbox = await outbox_repo.get_stats() if settings.GOOGLE_SHEETS_ENABLED else None
+        
         # Enrich tests
         recent_tests_enriched = []
         for t in recent_tests:
@@ -187,6 +235,7 @@ async def admin_dashboard(request: Request, key: str = None):
             "chart_labels": daily_stats['labels'],
             "chart_leads": daily_stats['leads'],
             "chart_tests": daily_stats['tests'],
+            "outbox": outbox,
             "key": key or request.query_params.get("key") or request.cookies.get("admin_key")
         })
     except Exception as e:
@@ -198,13 +247,14 @@ async def admin_dashboard(request: Request, key: str = None):
     return response
 
 # ... LEADS ...
-@router.get("/leads")
+@router.get("/leads", dependencies=DB_SCOPE)
 async def admin_leads(request: Request, 
                       status: str = "all",
                       search: str = "",
                       days: str = None,
-                      sort_by: str = "created_at",
+                      sort_by: str = None,
                       sort_order: str = "desc",
+                      cursor: str = None,
                       key: str = None):
     """Leads management page"""
     if not await verify_admin_auth(request):
@@ -215,17 +265,18 @@ async def admin_leads(request: Request,
     # Safely parse days
     days_val = int(days) if days and days.isdigit() else None
 
-    leads = await user_service.get_all_leads_full(
+    page = await user_service.get_leads_page(
         limit=200,
         status=status if status != "all" else None,
         search=search if search else None,
         days=days_val,
         sort_by=sort_by,
-        sort_order=sort_order
+        sort_order=sort_order,
+        cursor=cursor
     )
     
     # Serialize
-    leads = [serialize_record(l) for l in leads]
+    leads = [serialize_record(l) for l in page["items"]]
     
     return templates.TemplateResponse("admin/leads.html", {
         "request": request,
@@ -233,19 +284,23 @@ async def admin_leads(request: Request,
         "current_status": status,
         "current_search": search,
         "current_days": days,
-        "current_sort_by": sort_by,
+        "current_sort_by": sort_by or ("relevance" if search else "created_at"),
+        "requested_sort_by": sort_by or "",
         "current_sort_order": sort_order,
+        **page_links(request, page["next_cursor"]),
+        **export_links(request, "leads"),
         "key": key or request.query_params.get("key") or request.cookies.get("admin_key")
     })
 
 # ... TESTS ...
-@router.get("/tests")
+@router.get("/tests", dependencies=DB_SCOPE)
 async def admin_tests(request: Request,
                       product: str = "all",
                       result_type: str = "all",
                       days: str = None,
                       sort_by: str = "created_at",
                       sort_order: str = "desc",
+                      cursor: str = None,
                       key: str = None):
     """Test results management page"""
     if not await verify_admin_auth(request):
@@ -256,23 +311,26 @@ async def admin_tests(request: Request,
     # Safely parse days
     days_val = int(days) if days and days.isdigit() else None
 
-    tests = await test_service.get_all_tests_full(
+    page = await test_service.get_tests_page(
         limit=200,
         product=product if product != "all" else None,
         result_type=result_type if result_type != "all" else None,
         days=days_val,
         sort_by=sort_by,
-        sort_order=sort_order
+        sort_order=sort_order,
+        cursor=cursor
     )
     
     # Add type info and serialize
     tests_enriched = []
-    for t in tests:
+    for t in page["items"]:
         test_dict = serialize_record(t)
         type_info = TYPES_DATA.get(test_dict.get('result_type'))
         if type_info:
             test_dict['type_emoji'] = type_info.emoji
             test_dict['type_name'] = type_info.name_ru
+        if isinstance(test_dict.get('scores'), dict):
+            test_dict['scores_pretty'] = ", ".join(f"{k}: {v}" for k, v in test_dict['scores'].items())
         tests_enriched.append(test_dict)
     
     # Get all available types
@@ -288,13 +346,16 @@ async def admin_tests(request: Request,
         "current_days": days,
         "current_sort_by": sort_by,
         "current_sort_order": sort_order,
+        **page_links(request, page["next_cursor"]),
+        **export_links(request, "tests"),
         "key": key or request.query_params.get("key") or request.cookies.get("admin_key")
     })
 
-@router.get("/tests/unified")
+@router.get("/tests/unified", dependencies=DB_SCOPE)
 async def admin_unified_tests(request: Request,
                               product: str = "all",
                               days: str = None,
+                              cursor: str = None,
                               key: str = None):
     """Unified Test Sessions Page"""
     if not await verify_admin_auth(request):
@@ -304,30 +365,24 @@ async def admin_unified_tests(request: Request,
     days_val = int(days) if days and days.isdigit() else None
 
     # Fetch Unified Sessions
-    sessions = await test_service.get_unified_tests(
+    page = await test_service.get_unified_tests_page(
         limit=200, 
         product=product if product != 'all' else None, 
-        days=days_val
+        days=days_val,
+        cursor=cursor
     )
     
     # Enrich
     sessions_enriched = []
-    for s in sessions:
+    for s in page["items"]:
         s_dict = serialize_record(s)
         
-        # Parse result summary
-        try:
-             res_json = s_dict.get('result_json')
-             if res_json:
-                 import json
-                 res = json.loads(res_json)
-                 # Try to find type or score summary
-                 primary = res.get('type') or res.get('primary_name') or res.get('primary_type_name') or 'N/A'
-                 s_dict['summary'] = primary
-             else:
-                 s_dict['summary'] = '-'
-        except:
-             s_dict['summary'] = 'Error parsing result'
+        # Result summary (result_json is JSONB, already a dict)
+        res = s_dict.get('result_json')
+        if isinstance(res, dict):
+            s_dict['summary'] = res.get('type') or res.get('primary_name') or res.get('primary_type_name') or 'N/A'
+        else:
+            s_dict['summary'] = '-'
              
         sessions_enriched.append(s_dict)
 
@@ -336,6 +391,8 @@ async def admin_unified_tests(request: Request,
         "tests": sessions_enriched,
         "current_product": product,
         "current_days": days,
+        **page_links(request, page["next_cursor"]),
+        **export_links(request, "unified"),
         "key": key or request.query_params.get("key") or request.cookies.get("admin_key")
     })
 # ... REST OF FILE ...
@@ -357,12 +414,38 @@ async def admin_settings(request: Request, key: str = None):
         "CHECK_SUBSCRIPTION_ENABLED": settings.CHECK_SUBSCRIPTION_ENABLED,
     }
     
+    token = request.cookies.get("admin_session")
+    
     return templates.TemplateResponse("admin/settings.html", {
         "request": request,
         "config": config,
+        "session_user": await auth_service.get_user_from_token(token) if token else None,
+        "password_status": request.query_params.get("password"),
         "key": key or request.query_params.get("key") or request.cookies.get("admin_key")
     })
 
+@router.post("/settings/password")
+async def admin_change_password(request: Request,
+                                current_password: str = Form(...),
+                                new_password: str = Form(...)):
+    """Change the logged-in admin's password; every session of that admin ends"""
+    token = request.cookies.get("admin_session")
+    username = await auth_service.get_user_from_token(token) if token else None
+    if not username:
+        return get_access_denied_response(request)
+    
+    if len(new_password) < 8:
+        return RedirectResponse(url="/app/admin/settings?password=short", status_code=303)
+    if not await auth_service.change_password(username, current_password, new_password):
+        return RedirectResponse(url="/app/admin/settings?password=wrong", status_code=303)
+    
+    logger.info(f"Admin {username} changed password, sessions revoked")
+    # Old sessions are gone, this browser gets a fresh one
+    response = RedirectResponse(url="/app/admin/settings?password=changed", status_code=303)
+    response.set_cookie("admin_session", await auth_service.create_session(username),
+                        max_age=settings.ADMIN_SESSION_TTL, httponly=True, samesite="lax")
+    return response
+
 # ===== API ENDPOINTS =====
 
 @router.post("/api/lead/{user_id}/status")
@@ -380,185 +463,347 @@ async def update_lead_status(request: Request, user_id: int):
     
     return JSONResponse({"status": "ok"})
 
-@router.post("/api/export/leads")
-async def export_leads_to_sheets(request: Request):
-    """Export all leads to Google Sheets"""
+@router.get("/api/leads", dependencies=DB_SCOPE)
+async def api_leads(request: Request, status: str = "all", search: str = "", days: str = None,
+                    sort_by: str = None, sort_order: str = "desc",
+                    cursor: str = None, limit: int = 100):
+    """Leads page as JSON; pass next_cursor back as cursor for the next page"""
+    if not await verify_admin_auth(request):
+        return JSONResponse({"error": "Unauthorized"}, status_code=403)
+
+    page = await user_service.get_leads_page(
+        limit=max(1, min(limit, 500)),
+        status=status if status != "all" else None,
+        search=search if search else None,
+        days=int(days) if days and days.isdigit() else None,
+        sort_by=sort_by,
+        sort_order=sort_order,
+        cursor=cursor
+    )
+    return JSONResponse({
+        "items": [serialize_record(l) for l in page["items"]],
+        "next_cursor": page["next_cursor"]
+    })
+
+@router.get("/api/leads/search", dependencies=DB_SCOPE)
+async def api_leads_search(request: Request, q: str = "", limit: int = 10):
+    """Typeahead for the leads page: best matches by name, company or phone"""
+    if not await verify_admin_auth(request):
+        return JSONResponse({"error": "Unauthorized"}, status_code=403)
+
+    q = q.strip()
+    if len(q) < 2:
+        return JSONResponse({"items": []})
+
+    items = await user_service.search_leads(q, limit=max(1, min(limit, 50)))
+    return JSONResponse({"items": [serialize_record(l) for l in items]})
+
+@router.get("/api/tests", dependencies=DB_SCOPE)
+async def api_tests(request: Request, product: str = "all", result_type: str = "all", days: str = None,
+                    sort_by: str = "created_at", sort_order: str = "desc",
+                    cursor: str = None, limit: int = 100):
+    """Test results page as JSON; pass next_cursor back as cursor for the next page"""
+    if not await verify_admin_auth(request):
+        return JSONResponse({"error": "Unauthorized"}, status_code=403)
+
+    page = await test_service.get_tests_page(
+        limit=max(1, min(limit, 500)),
+        product=product if product != "all" else None,
+        result_type=result_type if result_type != "all" else None,
+        days=int(days) if days and days.isdigit() else None,
+        sort_by=sort_by,
+        sort_order=sort_order,
+        cursor=cursor
+    )
+    return JSONResponse({
+        "items": [serialize_record(t) for t in page["items"]],
+        "next_cursor": page["next_cursor"]
+    })
+
+@router.get("/api/tests/unified", dependencies=DB_SCOPE)
+async def api_unified_tests(request: Request, product: str = "all", days: str = None,
+                            cursor: str = None, limit: int = 100):
+    """Unified test sessions page as JSON; pass next_cursor back as cursor for the next page"""
+    if not await verify_admin_auth(request):
+        return JSONResponse({"error": "Unauthorized"}, status_code=403)
+
+    page = await test_service.get_unified_tests_page(
+        limit=max(1, min(limit, 500)),
+        product=product if product != "all" else None,
+        days=int(days) if days and days.isdigit() else None,
+        cursor=cursor
+    )
+    return JSONResponse({
+        "items": [serialize_record(s) for s in page["items"]],
+        "next_cursor": page["next_cursor"]
+    })
+
+@router.get("/api/tests/unified/types", dependencies=DB_SCOPE)
+async def api_unified_test_types(request: Request, product: str = "all", days: str = None,
+                                 result_type: str = None):
+    """Unified session counts per result type; result_type filters by result_json containment"""
+    if not await verify_admin_auth(request):
+        return JSONResponse({"error": "Unauthorized"}, status_code=403)
+
+    counts = await test_service.count_sessions_by_type(
+        product=product if product != "all" else None,
+        days=int(days) if days and days.isdigit() else None,
+        result_match={"type": result_type} if result_type else None
+    )
+    return JSONResponse({"counts": counts, "total": sum(counts.values())})
+
+@router.get("/api/metrics")
+async def admin_metrics(request: Request):
+    """In-process cache and queue metrics for monitoring"""
     if not await verify_admin_auth(request):
         return JSONResponse({"error": "Unauthorized"}, status_code=403)
     
+    return JSONResponse({
+        "stats_cache": stats_cache.metrics(),
+        "admin_sessions": auth_service.sessions.metrics(),
+        "admin_roster": user_service.admin_roster.metrics(),
+        "subscription_cache": subscription_cache.metrics(),
+        "task_runner": task_runner.metrics(),
+        "telegram_sender": telegram_sender.metrics(),
+        "broadcasts": broadcast_service.metrics(),
+        "notifications": notification_service.metrics(),
+        "sheets_outbox": {
+            **(await outbox_repo.get_stats()),
+            "worker": sheets_outbox_worker.metrics()
+        } if settings.GOOGLE_SHEETS_ENABLED else None
+    })
+
+@router.get("/api/outbox", dependencies=DB_SCOPE)
+async def admin_outbox_stats(request: Request):
+    """Google Sheets outbox: queue depth, lag, dead letters, worker counters"""
+    if not await verify_admin_auth(request):
+        return JSONResponse({"error": "Unauthorized"}, status_code=403)
+    
+    stats = await outbox_repo.get_stats()
+    stats["worker"] = sheets_outbox_worker.metrics()
+    return JSONResponse(stats)
+
+@router.post("/api/outbox/requeue")
+async def admin_outbox_requeue(request: Request):
+    """Move dead letters back to the queue"""
+    if not await verify_admin_auth(request):
+        return JSONResponse({"error": "Unauthorized"}, status_code=403)
+    
+    count = await outbox_repo.requeue_dead()
+    sheets_outbox_worker.wake(count)
+    logger.info(f"Sheets outbox: {count} dead letters requeued")
+    return JSONResponse({"status": "ok", "count": count})
+
+def _start_export(kind: str, load, to_row) -> JSONResponse:
+    """Start a background Sheets export and return its job id (progress: /api/export/jobs/{id})"""
     if not settings.GOOGLE_SHEETS_ENABLED:
         return JSONResponse({"error": "Google Sheets интеграция отключена"}, status_code=400)
+
+    job = export_jobs.start(kind, load, to_row)
+    return JSONResponse(job.report(), status_code=202)
+
+@router.post("/api/export/leads")
+async def export_leads_to_sheets(request: Request):
+    """Export all leads to Google Sheets (background job)"""
+    if not await verify_admin_auth(request):
+        return JSONResponse({"error": "Unauthorized"}, status_code=403)
     
-    try:
-        from core.google_sheets import send_to_sheets
-        
-        leads = await user_service.get_all_leads_full(limit=10000)
-        # Convert to dicts
-        leads = [dict(l) for l in leads]
-        
-        # Prepare all data first
-        all_data = []
-        for lead in leads:
-            all_data.append({
-                "type": "lead",
-                "name": lead.get("name", ""),
-                "role": lead.get("role", ""),
-                "company": lead.get("company", ""),
-                "phone": lead.get("phone", ""),
-                "telegram": lead.get("telegram_username", ""),
-                "team_size": lead.get("team_size", ""),
-                "user_id": str(lead.get("user_id", "")),
-                "status": lead.get("status", "new")
-            })
-            
-        # Send in batches of 50
-        BATCH_SIZE = 50
-        sent_count = 0
-        
-        for i in range(0, len(all_data), BATCH_SIZE):
-            batch = all_data[i:i + BATCH_SIZE]
-            if await send_to_sheets(batch):
-                sent_count += len(batch)
-        
-        logger.info(f"Full leads export completed: {sent_count}/{len(leads)} leads")
-        return JSONResponse({"status": "ok", "count": sent_count})
-    except Exception as e:
-        logger.error(f"Export leads failed: {e}")
-        return JSONResponse({"error": str(e)}, status_code=500)
+    return _start_export("leads",
+                         lambda limit, cursor: user_service.get_leads_page(limit, cursor=cursor), lead_row)
 
 @router.post("/api/export/tests")
 async def export_tests_to_sheets(request: Request):
-    """Export all tests to Google Sheets"""
+    """Export all tests to Google Sheets (background job)"""
     if not await verify_admin_auth(request):
         return JSONResponse({"error": "Unauthorized"}, status_code=403)
     
-    if not settings.GOOGLE_SHEETS_ENABLED:
-        return JSONResponse({"error": "Google Sheets интеграция отключена"}, status_code=400)
-    
-    try:
-        from core.google_sheets import send_to_sheets
-        import json
-        
-        tests = await test_service.get_all_tests_full(limit=10000)
-        # Convert to dicts
-        tests = [dict(t) for t in tests]
-        
-        all_data = []
-        for test in tests:
-            # Parse scores
-            scores_str = ""
-            if test.get("scores"):
-                try:
-                    scores = test["scores"]
-                    if isinstance(scores, str):
-                        scores = json.loads(scores)
-                    scores_str = ", ".join([f"{k}: {v}" for k, v in scores.items()])
-                except:
-                    scores_str = str(test.get("scores", ""))
-
-            all_data.append({
-                "type": "test",
-                "name": test.get("name", ""),
-                "role": test.get("role", ""),
-                "company": test.get("company", ""),
-                "phone": test.get("phone", ""),
-                "result_type": test.get("result_type", ""),
-                "scores": scores_str,
-                "product": test.get("product", "teremok"),
-                "user_id": str(test.get("user_id", ""))
-            })
-            
-        # Send in batches
-        BATCH_SIZE = 50
-        sent_count = 0
-        
-        for i in range(0, len(all_data), BATCH_SIZE):
-            batch = all_data[i:i + BATCH_SIZE]
-            if await send_to_sheets(batch):
-                sent_count += len(batch)
-        
-        logger.info(f"Full tests export completed: {sent_count}/{len(tests)} tests")
-        return JSONResponse({"status": "ok", "count": sent_count})
-    except Exception as e:
-        logger.error(f"Export tests failed: {e}")
-        return JSONResponse({"error": str(e)}, status_code=500)
+    return _start_export("tests",
+                         lambda limit, cursor: test_service.get_tests_page(limit, cursor=cursor), test_row)
 
 @router.post("/api/export/tests/unified")
 async def export_unified_tests_to_sheets(request: Request):
-    """Export UNIFIED tests to Google Sheets"""
+    """Export UNIFIED tests to Google Sheets (background job)"""
+    if not await verify_admin_auth(request):
+        return JSONResponse({"error": "Unauthorized"}, status_code=403)
+    
+    return _start_export("unified",
+                         lambda limit, cursor: test_service.get_unified_tests_page(limit, cursor=cursor),
+                         unified_test_row)
+
+@router.get("/api/export/{dataset}.{fmt}")
+async def export_stream(request: Request, dataset: str, fmt: str,
+                        status: str = "all", product: str = "all", result_type: str = "all",
+                        days: str = None, search: str = "",
+                        sort_by: str = None, sort_order: str = "desc"):
+    """
+    Download leads / tests / unified sessions as CSV or NDJSON with the listing filters.
+    Rows stream from a server-side cursor; gzip-compressed when the client accepts it.
+    """
+    if not await verify_admin_auth(request):
+        return JSONResponse({"error": "Unauthorized"}, status_code=403)
+    
+    if dataset not in EXPORT_DATASETS or fmt not in FORMATS:
+        return JSONResponse({"error": "Неизвестный формат экспорта"}, status_code=404)
+    
+    days_val = int(days) if days and days.isdigit() else None
+    search = search.strip() or None
+    product = product if product != "all" else None
+    
+    if dataset == "leads":
+        rows = user_service.stream_leads(
+            status=status if status != "all" else None, product=product,
+            search=search, days=days_val, sort_by=sort_by, sort_order=sort_order
+        )
+    elif dataset == "tests":
+        rows = test_service.stream_tests(
+            product=product, result_type=result_type if result_type != "all" else None,
+            search=search, days=days_val, sort_by=sort_by, sort_order=sort_order
+        )
+    else:
+        rows = test_service.stream_unified_tests(product=product, days=days_val, search=search)
+    
+    gzip = "gzip" in request.headers.get("accept-encoding", "").lower()
+    filename = f"{dataset}-{datetime.now().strftime('%Y%m%d-%H%M')}.{fmt}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"', "Vary": "Accept-Encoding"}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    
+    logger.info(f"Streaming export {dataset}.{fmt} (gzip={gzip})")
+    return StreamingResponse(encode_rows(rows, fmt, gzip), media_type=FORMATS[fmt], headers=headers)
+
+@router.get("/api/export/jobs/{job_id}")
+async def export_job_status(request: Request, job_id: str):
+    """Progress of a Sheets export: status, sent/failed/total, elapsed seconds"""
+    if not await verify_admin_auth(request):
+        return JSONResponse({"error": "Unauthorized"}, status_code=403)
+    
+    job = export_jobs.get(job_id)
+    if not job:
+        return JSONResponse({"error": "Задача не найдена"}, status_code=404)
+    return JSONResponse(job.report())
+
+@router.get("/api/sync", dependencies=DB_SCOPE)
+async def sheets_sync_status(request: Request):
+    """Incremental Sheets sync: watermark and last run per stream"""
+    if not await verify_admin_auth(request):
+        return JSONResponse({"error": "Unauthorized"}, status_code=403)
+    
+    states = await sync_repo.get_states()
+    return JSONResponse({
+        "streams": [serialize_record(s) for s in states],
+        "last_reports": sheets_sync.last_report,
+        "interval_minutes": settings.SHEETS_SYNC_INTERVAL,
+    })
+
+@router.post("/api/sync/run")
+async def sheets_sync_run(request: Request, stream: str = None):
+    """Send new and changed rows now (all streams or one), in the background"""
     if not await verify_admin_auth(request):
         return JSONResponse({"error": "Unauthorized"}, status_code=403)
     
     if not settings.GOOGLE_SHEETS_ENABLED:
         return JSONResponse({"error": "Google Sheets интеграция отключена"}, status_code=400)
+    if stream and stream not in SYNC_STREAMS:
+        return JSONResponse({"error": "Неизвестный поток"}, status_code=404)
+    
+    if not sheets_sync.trigger(stream):
+        return JSONResponse({"error": "Синхронизация уже выполняется"}, status_code=409)
+    return JSONResponse({"status": "started"}, status_code=202)
+
+@router.post("/api/sync/{stream}/{action}")
+async def sheets_sync_watermark(request: Request, stream: str, action: str):
+    """baseline: mark everything up to now as already in the sheet; reset: send the whole stream again"""
+    if not await verify_admin_auth(request):
+        return JSONResponse({"error": "Unauthorized"}, status_code=403)
+    
+    if stream not in SYNC_STREAMS or action not in ("baseline", "reset"):
+        return JSONResponse({"error": "Not found"}, status_code=404)
+    
+    if action == "baseline":
+        await sync_repo.baseline(stream)
+    else:
+        await sync_repo.reset(stream)
+    logger.info(f"Sheets sync {stream}: {action}")
+    return JSONResponse({"status": "ok"})
+
+# ===== BROADCASTS =====
+
+@router.get("/broadcasts", dependencies=DB_SCOPE)
+async def admin_broadcasts(request: Request, key: str = None):
+    """Broadcast form and recent broadcasts with progress"""
+    if not await verify_admin_auth(request):
+        return get_access_denied_response(request)
+    
+    broadcasts = await broadcast_repo.get_recent()
+    return templates.TemplateResponse("admin/broadcasts.html", {
+        "request": request,
+        "broadcasts": [serialize_record(b) for b in broadcasts],
+        "key": key or request.query_params.get("key") or request.cookies.get("admin_key")
+    })
+
+@router.get("/api/broadcasts", dependencies=DB_SCOPE)
+async def admin_broadcasts_list(request: Request):
+    """Recent broadcasts (polled by the page for progress)"""
+    if not await verify_admin_auth(request):
+        return JSONResponse({"error": "Unauthorized"}, status_code=403)
+    
+    broadcasts = await broadcast_repo.get_recent()
+    return JSONResponse({"broadcasts": [serialize_record(b) for b in broadcasts]})
+
+@router.post("/api/broadcasts/audience")
+async def admin_broadcast_audience(request: Request):
+    """Recipients matching the filters (blocked users excluded)"""
+    if not await verify_admin_auth(request):
+        return JSONResponse({"error": "Unauthorized"}, status_code=403)
     
+    data = await request.json()
     try:
-        from core.google_sheets import send_to_sheets
-        import json
-        
-        # Get all unified sessions
-        sessions = await test_service.get_unified_tests(limit=10000)
-        
-        all_data = []
-        for s in sessions:
-            # Ensure s is a dict (it returns dict from service already)
-            
-            # Helper to safely get lead props
-            lead_name = s.get('lead_name') or ''
-            lead_phone = s.get('lead_phone') or ''
-            lead_role = s.get('lead_role') or ''
-            lead_company = s.get('lead_company') or ''
-            lead_team_size = s.get('lead_team_size') or ''
-            lead_channel = s.get('lead_preferred_channel') or ''
-            
-            # Parse result for summary
-            summary = ""
-            res_json = s.get('result_json')
-            if res_json:
-                 try:
-                     res = json.loads(res_json)
-                     summary = res.get('type') or res.get('primary_name') or res.get('primary_type_name') or 'N/A'
-                 except:
-                     summary = "Parsing Error"
-            
-            all_data.append({
-                "type": "unified_test", # Marker for Google Script if it cares, or we can use "test" if compatible
-                # But requirement says "Unified list Tests", strict column order.
-                # Assuming GAS just dumps keys or we match keys.
-                # User said: "Колонки (строго в этом порядке): created_at, product, source ... result_json"
-                # I will map keys closely to that order.
-                
-                "created_at": str(s.get('created_at', '')),
-                "product": s.get('product', ''),
-                "source": s.get('source', ''),
-                "user_id": str(s.get('user_id', '')),
-                "lead_name": lead_name,
-                "lead_phone_or_messenger": lead_phone,
-                "lead_preferred_channel": lead_channel,
-                "company": lead_company,
-                "role": lead_role,
-                "team_size": lead_team_size,
-                "utm_source": s.get('utm_source', ''),
-                "utm_medium": s.get('utm_medium', ''),
-                "utm_campaign": s.get('utm_campaign', ''),
-                "test_summary": summary,
-                "result_json": res_json or ""
-            })
-            
-        # Send in batches
-        BATCH_SIZE = 50
-        sent_count = 0
-        
-        for i in range(0, len(all_data), BATCH_SIZE):
-            batch = all_data[i:i + BATCH_SIZE]
-            if await send_to_sheets(batch):
-                sent_count += len(batch)
-        
-        logger.info(f"Unified tests export completed: {sent_count}/{len(sessions)} tests")
-        return JSONResponse({"status": "ok", "count": sent_count})
-    except Exception as e:
-        logger.error(f"Export unified tests failed: {e}")
-        return JSONResponse({"error": str(e)}, status_code=500)
+        filters = clean_filters(data.get("filters"))
+    except ValueError:
+        return JSONResponse({"error": "Дата должна быть в формате ГГГГ-ММ-ДД"}, status_code=400)
+    return JSONResponse({"total": await broadcast_repo.count_audience(filters)})
+
+@router.post("/api/broadcasts")
+async def admin_broadcast_create(request: Request):
+    """Start a broadcast: {"text": str (HTML), "filters": {...}}"""
+    if not await verify_admin_auth(request):
+        return JSONResponse({"error": "Unauthorized"}, status_code=403)
+    
+    data = await request.json()
+    text = (data.get("text") or "").strip()
+    if not text:
+        return JSONResponse({"error": "Пустой текст рассылки"}, status_code=400)
+    if len(text) > 4096:
+        return JSONResponse({"error": "Текст длиннее 4096 символов"}, status_code=400)
+    try:
+        filters = clean_filters(data.get("filters"))
+    except ValueError:
+        return JSONResponse({"error": "Дата должна быть в формате ГГГГ-ММ-ДД"}, status_code=400)
+    
+    token = request.cookies.get("admin_session")
+    created_by = (await auth_service.get_user_from_token(token) if token else None) or "admin_key"
+    broadcast = await broadcast_service.create(text, filters, created_by, start=True)
+    logger.info(f"Broadcast {broadcast['id']} started by {created_by}: {broadcast['total']} recipients")
+    return JSONResponse(serialize_record(broadcast), status_code=201)
+
+@router.post("/api/broadcasts/{broadcast_id}/{action}")
+async def admin_broadcast_control(request: Request, broadcast_id: int, action: str):
+    """pause / resume / cancel"""
+    if not await verify_admin_auth(request):
+        return JSONResponse({"error": "Unauthorized"}, status_code=403)
+    
+    controls = {
+        "pause": broadcast_service.pause,
+        "resume": broadcast_service.launch,
+        "cancel": broadcast_service.cancel,
+    }
+    if action not in controls:
+        return JSONResponse({"error": "Not found"}, status_code=404)
+    
+    broadcast = await controls[action](broadcast_id)
+    if not broadcast:
+        return JSONResponse({"error": "Действие недоступно для этой рассылки"}, status_code=409)
+    return JSONResponse(serialize_record(broadcast))
 
 @router.post("/api/admin/backfill/test_sessions")
 async def backfill_test_sessions(request: Request):
@@ -573,3 +818,18 @@ async def backfill_test_sessions(request: Request):
     except Exception as e:
         logger.error(f"Backfill error: {e}")
         return JSONResponse({"error": str(e)}, status_code=500)
+
+@router.post("/api/admin/rollups/rebuild")
+async def rebuild_daily_rollups(request: Request):
+    """Recompute daily_rollups from leads and test tables"""
+    if not await verify_admin_auth(request):
+        return JSONResponse({"error": "Unauthorized"}, status_code=403)
+    
+    try:
+        rows = await user_repo.rebuild_daily_rollups()
+        stats_cache.invalidate(LEADS, TESTS)
+        logger.info(f"Daily rollups rebuilt: {rows} rows")
+        return JSONResponse({"status": "ok", "rows": rows})
+    except Exception as e:
+        logger.error(f"Rollups rebuild error: {e}")
+        return JSONResponse({"error": str(e)}, status_code=500)
@@ -1,26 +1,28 @@
 from fastapi import FastAPI, APIRouter, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi.responses import JSONResponse, HTMLResponse, Response
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
 from core.texts import TYPES_DATA, get_types_for_api
 from core.config import settings
 from core.telegram_checks import is_subscribed_to_required_channel
-from core.logic import calculate_result, DIAGNOSTIC_QUESTIONS
+from core.logic import DIAGNOSTIC_QUESTIONS
+import asyncio
 import os
 import logging
 from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 from core.limiter import limiter
 from infrastructure.db import db
+from core.database import run_migrations
+from core.http_client import http_client
+from core.task_runner import task_runner
+from services.export_jobs import export_jobs
+from core.static_payloads import StaticPayload, encode_all as encode_static_payloads
 
 # Services
-from repositories.user_repository import UserRepository
-from repositories.test_repository import TestRepository
-from services.user_service import UserService
-from services.test_service import TestService
 from models.user import UserContact
-from core.dependencies import user_service, test_service, user_repo, test_repo, notification_service
+from core.dependencies import user_service, test_service, user_repo, notification_service, sheets_outbox_worker, sheets_sync, broadcast_service
 
 
 logger = logging.getLogger(__name__)
@@ -49,20 +51,36 @@ router = APIRouter()
 
 @app.on_event("startup")
 async def startup():
+    encode_static_payloads()
     await db.connect()
+    await http_client.start()
     try:
-        await user_repo.ensure_schema()
-        logger.info("User schema updated")
+        # No-op (one version lookup) when the schema is current
+        await run_migrations()
     except Exception as e:
-        logger.error(f"User schema update failed: {e}")
+        logger.error(f"Database migration failed: {e}")
     try:
-        await test_repo.ensure_schema()
-        logger.info("Test schema updated")
+        # First boot with rollups: seed them from historical data
+        if not await user_repo.has_daily_rollups():
+            rows = await user_repo.rebuild_daily_rollups()
+            logger.info(f"Daily rollups seeded: {rows} rows")
     except Exception as e:
-        logger.error(f"Test schema update failed: {e}")
+        logger.error(f"Daily rollups seed failed: {e}")
+    task_runner.start()
+    broadcast_service.start()
+    notification_service.start_digest()
+    sheets_outbox_worker.start()
+    sheets_sync.start()
 
 @app.on_event("shutdown")
 async def shutdown():
+    await broadcast_service.stop()
+    await export_jobs.stop()
+    await sheets_sync.stop()
+    await sheets_outbox_worker.stop()
+    await task_runner.stop()
+    await notification_service.stop_digest()
+    await http_client.close()
     await db.disconnect()
 
 # ==== NEW: Unified Lead Registration Endpoint ====
@@ -184,21 +202,18 @@ async def register_lead(request: Request):
              if contact.comment:
                  msg += f"\nComment: {contact.comment}"
              
-             await notification_service.notify_new_lead(
+             task_runner.submit("notify_new_lead", notification_service.notify_new_lead,
                  name=contact.name,
                  contact=contact.phone,
                  message=msg,
                  source=f"Unified API ({contact.product})",
                  username=None,
-                 user_id=user_id
+                 user_id=user_id,
+                 product=contact.product
              )
 
-        # Export (Try/Catch)
-        try:
-            from core.google_sheets import export_lead_to_sheets
-            await export_lead_to_sheets(contact.__dict__)
-        except Exception as e:
-            logger.error(f"Sheets export error: {e}")
+        # Sheets row was queued in the outbox with the contact
+        sheets_outbox_worker.wake()
 
         return JSONResponse({
             "status": "success", 
@@ -219,31 +234,97 @@ templates = Jinja2Templates(directory=templates_path)
 def set_bot(bot):
     notification_service.set_bot(bot)
 
+def _teremok_questions() -> dict:
+    questions = []
+    for q in DIAGNOSTIC_QUESTIONS:
+        questions.append({
+            "id": q.id,
+            "text": q.text,
+            "options": [{"text": opt["text"], "index": i} for i, opt in enumerate(q.options)]
+        })
+    return {"questions": questions, "total": len(questions)}
+
+def _formula_questions() -> dict:
+    from core.formula_logic import FORMULA_QUESTIONS, FORMULA_OPTIONS
+    questions = [
+        {
+            "id": q.id,
+            "text": q.text,
+            "options": FORMULA_OPTIONS
+        }
+        for q in FORMULA_QUESTIONS
+    ]
+    return {"questions": questions, "total": len(questions)}
+
+def _formula_rsp_questions() -> dict:
+    from core.formula_rsp_questions import FORMULA_RSP_QUESTIONS
+    return {"questions": FORMULA_RSP_QUESTIONS}
+
+# Static data only changes on deploy: encoded once, served with ETag (core/static_payloads.py)
+TYPES_PAYLOAD = StaticPayload("types", lambda: {k: v.__dict__ for k, v in TYPES_DATA.items()})
+TEREMOK_TYPES_PAYLOAD = StaticPayload("teremok_types", lambda: {"types": get_types_for_api()})
+TEREMOK_QUESTIONS_PAYLOAD = StaticPayload("teremok_questions", _teremok_questions)
+FORMULA_QUESTIONS_PAYLOAD = StaticPayload("formula_questions", _formula_questions)
+FORMULA_RSP_QUESTIONS_PAYLOAD = StaticPayload("formula_rsp_questions", _formula_rsp_questions)
+
+# Bootstrap: everything a mini app needs on open, static part per product
+BOOTSTRAP_PAYLOADS = {
+    "teremok": StaticPayload("bootstrap_teremok", lambda: {
+        "product": "teremok", **_teremok_questions(), "types": get_types_for_api()
+    }),
+    "formula": StaticPayload("bootstrap_formula", lambda: {"product": "formula", **_formula_questions()}),
+    "formula_rsp": StaticPayload("bootstrap_formula_rsp", lambda: {
+        "product": "formula_rsp", **_formula_rsp_questions()
+    }),
+}
+
 # API Endpoint to get types (legacy, for compatibility)
 @router.get("/api/types")
-async def get_types():
-    # Convert dataclasses to dicts
-    return {k: v.__dict__ for k, v in TYPES_DATA.items()}
+async def get_types(request: Request):
+    return TYPES_PAYLOAD.response(request)
 
 # API Endpoint to get Teremok types with full info
 @router.get("/api/teremok/types")
-async def get_teremok_types():
+async def get_teremok_types(request: Request):
     """Return all Teremok types with full descriptions for UI"""
-    from core.texts import get_types_for_api
-    return {"types": get_types_for_api()}
+    return TEREMOK_TYPES_PAYLOAD.response(request)
 
 # API Endpoint to get Teremok test questions
 @router.get("/api/teremok/questions")
-async def get_teremok_questions():
+async def get_teremok_questions(request: Request):
     """Return all diagnostic questions for Teremok test"""
-    questions = []
-    for q in DIAGNOSTIC_QUESTIONS:
-        questions.append({
-            "id": q.id,
-            "text": q.text,
-            "options": [{"text": opt["text"], "index": i} for i, opt in enumerate(q.options)]
-        })
-    return {"questions": questions, "total": len(questions)}
+    return TEREMOK_QUESTIONS_PAYLOAD.response(request)
+
+@router.get("/api/bootstrap")
+async def bootstrap(product: str = "teremok", user_id: int = 0):
+    """
+    Questions, types, subscription and has_contact in one response (one round trip on open).
+    The subscription check and the DB lookup run concurrently.
+    """
+    payload = BOOTSTRAP_PAYLOADS.get(product)
+    if payload is None:
+        return JSONResponse({"error": "Unknown product"}, status_code=404)
+    
+    access = {"subscribed": False, "has_contact": False, "channel_username": settings.REQUIRED_CHANNEL_USERNAME}
+    if user_id:
+        bot_instance = notification_service.get_bot_instance()
+        checks = [user_service.has_contact(user_id)]
+        if bot_instance:
+            checks.append(is_subscribed_to_required_channel(bot_instance, user_id))
+        else:
+            access["error"] = "Bot not initialized"
+        # A failed lookup must not fail the whole bootstrap: it falls back to False
+        results = await asyncio.gather(*checks, return_exceptions=True)
+        for key, result in zip(("has_contact", "subscribed"), results):
+            if isinstance(result, Exception):
+                logger.error(f"Bootstrap {key} check failed for {user_id}: {result}")
+                access["error"] = f"{key} check failed"
+            else:
+                access[key] = result
+    
+    # Per-user answer: not cacheable, only the static part is pre-encoded
+    return Response(content=payload.merged(access), media_type="application/json",
+                    headers={"Cache-Control": "no-store"})
 
 # ==== NEW: Check subscription endpoint ====
 @router.get("/api/check-subscription")
@@ -317,21 +398,18 @@ async def save_user_contacts(request: Request):
         logger.info(f"Contacts saved for user {user_id}")
         
         # Notification
-        await notification_service.notify_new_lead(
+        task_runner.submit("notify_new_lead", notification_service.notify_new_lead,
             name=data['name'],
             contact=data['phone'],
             message=f"Role: {data['role']}, Company: {data['company']}",
             source="Web API",
             username=data.get('username'),
-            user_id=data.get('user_id')
+            user_id=data.get('user_id'),
+            product=product
         )
         
-        # Export to Google Sheets
-        try:
-            from core.google_sheets import export_lead_to_sheets
-            await export_lead_to_sheets(contact.__dict__)
-        except Exception as e:
-            logger.error(f"Failed to export lead to sheets: {e}")
+        # Sheets row was queued in the outbox with the contact
+        sheets_outbox_worker.wake()
         
         return JSONResponse({
             "status": "success", 
@@ -364,41 +442,18 @@ async def submit_test_results(request: Request):
         user_id = data['user_id']
         answers = data['answers']
         
-        # Process via service
-        test_id = await test_service.process_teremok_test(user_id, answers)
-        
-        # Calculate result locally for response context
-        result_calc = calculate_result(answers)
+        # Upsert contact, legacy row and unified session in one round trip
+        saved = await test_service.submit_teremok_test(user_id, answers)
+        test_id = saved["test_id"]
+        result_calc = saved["result"]
         result_type = result_calc['type']
-
-        # === UNIFIED STORAGE ===
-        try:
-             # Try to get existing contact info to enrich source
-             contact_info = await user_service.get_contact(user_id)
-             src = contact_info.source if contact_info else 'unknown'
-             chn = contact_info.preferred_channel if contact_info else 'unknown'
-             
-             await test_repo.save_test_session(
-                 user_id=user_id,
-                 product='teremok',
-                 source=src,
-                 channel=chn,
-                 answers=answers,
-                 result=result_calc,
-                 meta={"type": result_type}
-             )
-        except Exception as e:
-            logger.warning(f"Failed to save unified test session (Teremok): {e}")
-        # =======================
+        contact = saved["contact"].__dict__ if saved["contact"] else None
         
         logger.info(f"Test result saved for user {user_id}: {result_type} (ID: {test_id})")
         
-        # Получаем контакты (если есть)
-        contact = await user_service.get_contact(user_id)
-        
         # Отправляем уведомление менеджеру только если включено
         if settings.SEND_NOTIFICATIONS:
-            await notification_service.notify_test_result(
+            task_runner.submit("notify_test_result", notification_service.notify_test_result,
                 user_id=user_id,
                 contact=contact,
                 result_type=result_type,
@@ -407,16 +462,8 @@ async def submit_test_results(request: Request):
                 scores=result_calc.get('scores', {})
             )
         
-        # Экспорт в Google Sheets
-        try:
-            # We add test_id just in case, though google sheets logic might not use it yet
-            from core.google_sheets import export_test_to_sheets
-            await export_test_to_sheets(
-                test={"user_id": user_id, "result_type": result_type, "scores": result_calc.get('scores', {}), "product": "teremok", "test_id": test_id},
-                lead=contact
-            )
-        except Exception as e:
-            logger.error(f"Failed to export test to sheets: {e}")
+        # Экспорт в Google Sheets: строка уже в outbox, воркер отправит её в фоне
+        sheets_outbox_worker.wake()
         
         type_info = TYPES_DATA.get(result_type)
         
@@ -474,14 +521,8 @@ async def teremok_result_page(request: Request, result_id: int):
             # Fallback for unknown type
             type_info = TYPES_DATA.get("bird") 
             
-        # Parse scores if stored as string (should be dict from pydantic, but double check)
-        scores = result.get('scores', {})
-        if isinstance(scores, str):
-            try:
-                import json
-                scores = json.loads(scores)
-            except:
-                scores = {}
+        # JSONB column: already a dict
+        scores = result.get('scores') or {}
                 
         # Get types data for the chart
         all_types = get_types_for_api()
@@ -514,18 +555,19 @@ async def submit_lead(request: Request):
         
         # Send to manager if bot is available (legacy behavior)
         if settings.SEND_NOTIFICATIONS:
-            await notification_service.notify_new_lead(
+            task_runner.submit("notify_new_lead", notification_service.notify_new_lead,
                 name=name,
                 contact=contact_info_str,
                 message=message,
                 source="Legacy Web API",
                 username=None,
-                user_id=0
+                user_id=0,
+                product="teremok"
             )
         
         if result_type:
             # Also notify about test result if provided
-            await notification_service.notify_test_result(
+            task_runner.submit("notify_test_result", notification_service.notify_test_result,
                  result_type=result_type,
                  answers={}, # Not available in legacy lead
                  contact={"name": name, "phone": contact_info_str},
@@ -566,26 +608,16 @@ async def teremok_cases(request: Request):
 
 # API: Get questions
 @router.get("/api/formula/questions")
-async def get_formula_questions():
-    from core.formula_logic import FORMULA_QUESTIONS, FORMULA_OPTIONS
-    questions = [
-        {
-            "id": q.id,
-            "text": q.text,
-            "options": FORMULA_OPTIONS
-        }
-        for q in FORMULA_QUESTIONS
-    ]
-    return {"questions": questions, "total": len(questions)}
+async def get_formula_questions(request: Request):
+    return FORMULA_QUESTIONS_PAYLOAD.response(request)
 
 
 # ===== FORMULA (RSP) MODULE =====
 
 @app.get("/api/formula/rsp/questions")
-async def get_formula_rsp_questions():
+async def get_formula_rsp_questions(request: Request):
     """Get questions for Formula RSP test"""
-    from core.formula_rsp_questions import FORMULA_RSP_QUESTIONS
-    return JSONResponse({"questions": FORMULA_RSP_QUESTIONS})
+    return FORMULA_RSP_QUESTIONS_PAYLOAD.response(request)
 
 @app.post("/api/formula/rsp/submit")
 @limiter.limit("5/minute")
@@ -610,85 +642,21 @@ async def submit_formula_rsp_results(request: Request):
                  import random
                  user_id = random.randint(1000000, 9999999)
         
-        # Ensure contact exists (Guest or Subscribed)
-        user_has_contact = await user_service.has_contact(user_id)
-        
-        # If we have explicit Name/Role in payload (from Form), update/save contact
-        if name and role:
-             contact = UserContact(
-                user_id=user_id,
-                name=name,
-                role=role,
-                company="", 
-                team_size="",
-                phone="",
-                telegram_username=None,
-                product="formula_rsp"
-             )
-             await user_service.register_contact(contact)
-             
-        elif not user_has_contact:
-            # No contact and no payload -> Create guest
-             contact = UserContact(
-                user_id=user_id,
-                name="Guest User",
-                role="Guest",
-                company="",
-                team_size="",
-                phone="",
-                telegram_username=None,
-                product="formula_rsp"
-             )
-             await user_service.register_contact(contact)
-
-        # Calculate and Save Result via Service
-        result_obj = await test_service.process_formula_rsp(user_id, answers)
-        test_id = result_obj.id
-        
-        # === UNIFIED STORAGE ===
-        try:
-             # Try to get existing contact info to enrich source
-             contact_info = await user_service.get_contact(user_id)
-             src = contact_info.source if contact_info else 'unknown'
-             chn = contact_info.preferred_channel if contact_info else 'unknown'
-             
-             await test_repo.save_test_session(
-                 user_id=user_id,
-                 product='formula',
-                 source=src,
-                 channel=chn,
-                 answers=answers,
-                 result=result_obj.scores, # Or full obj
-                 meta={"type": result_obj.primary_name}
-             )
-        except Exception as e:
-            logger.warning(f"Failed to save unified test session (Formula): {e}")
-        # =======================
+        # Upsert contact (explicit Name/Role from Form, or Guest), legacy row
+        # and unified session in one round trip
+        saved = await test_service.submit_formula_rsp(user_id, answers, name=name, role=role)
+        result_obj = saved["result"]
+        test_id = saved["test_id"]
+        contact = saved["contact"].__dict__ if saved["contact"] else None
 
         logger.info(f"Formula RSP result saved for {user_id}: {result_obj.primary_code} (ID: {test_id})")
         
-        # Export to Google Sheets
-        contact = await user_service.get_contact(user_id)
-        try:
-            from core.google_sheets import export_test_to_sheets
-            await export_test_to_sheets(
-                test={
-                    "user_id": user_id, 
-                    "result_type": result_obj.primary_name,
-                    "scores": result_obj.scores,
-                    "product": "formula_rsp",
-                    "test_id": test_id,
-                    "name": name,
-                    "role": role 
-                },
-                lead=contact.__dict__ if contact else None
-            )
-        except Exception as e:
-            logger.error(f"Failed to export Formula RSP to sheets: {e}")
+        # Sheets row was queued in the outbox by the submit statement
+        sheets_outbox_worker.wake()
 
         # Send notification
         if settings.SEND_NOTIFICATIONS:
-            await notification_service.notify_test_result(
+            task_runner.submit("notify_test_result", notification_service.notify_test_result,
                 user_id=user_id,
                 contact=contact,
                 result_type=result_obj.primary_name,
@@ -772,12 +740,8 @@ async def formula_result_page(request: Request, test_id: int):
             # Fallback
             type_info = get_rsp_type("result")
              
-        # Parse scores
-        import json
-        try:
-             scores = json.loads(row_dict['scores']) if isinstance(row_dict['scores'], str) else row_dict['scores']
-        except:
-             scores = {}
+        # JSONB column: already a dict
+        scores = row_dict['scores'] or {}
              
         # All types for chart
         all_types = list(FORMULA_RSP_TYPES.values())